@@ -1,22 +1,57 @@
 # LangGraph agentic RAG pipeline.
-# Flow: retrieve -> grade_documents -> [generate | rewrite_query -> retrieve (max 1 retry)]
+# Flow: router -> filter_tables -> [generate | retrieve -> grade_documents ->
+#       [generate | rewrite_query -> retrieve (max 1 retry)]]
+# With speculative_rewrite the retry is started alongside the first grading instead.
 
+import asyncio
+import hashlib
 import json
 import re
+import time
 import uuid
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, AsyncIterator, Generator, Iterator
 from typing import Any, TypedDict, cast
 
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_openai import ChatOpenAI
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, StateGraph
+from langgraph.types import StreamMode
 from pydantic import SecretStr
 
+from app.answer_cache import AnswerCache, normalize_query
 from app.config import settings
-from app.ingestion import get_retriever
+from app.grading import GradePrefilter, PrefilterResult
+from app.ingestion import (
+    IndexHandle,
+    get_embeddings,
+    get_index_version,
+    get_retriever,
+    get_table_store,
+    load_live_brand_lexicon,
+    pin_index,
+)
 from app.log import get_logger
+from app.memory import Conversation, ConversationStore, conversation_store_path
+from app.metrics import (
+    ANSWER_CACHE,
+    CHAT_REQUESTS,
+    CHAT_SECONDS,
+    GRADER_KEEP_RATIO,
+    QUERY_REWRITES,
+    ROUTES,
+    RequestTimings,
+    TokenUsageCallback,
+    timed_node,
+)
+from app.resources import get_resources
+from app.routing import FastRouter, RouteDecision
+from app.single_flight import SingleFlight, StreamFlights
+from app.tokens import count_tokens, truncate_tokens
 
 log = get_logger(__name__)
 
@@ -27,16 +62,97 @@ class AgentState(TypedDict):
     generation: str
     query_rewritten: bool
     route: str
+    # Rendered conversation memory (summary + recent turns); empty on a first turn
+    history: str
+
+
+def _create_llm() -> ChatOpenAI:
+    resources = get_resources()
+    return ChatOpenAI(
+        model=settings.llm_model,
+        api_key=SecretStr(settings.openrouter_api_key) if settings.openrouter_api_key else None,
+        base_url=settings.openrouter_base_url,
+        temperature=0,
+        # Usage on streamed completions too, for the per-node token metrics
+        stream_usage=True,
+        http_client=resources.http_client,
+        http_async_client=resources.async_http_client,
+    )
+
+
+llm = _create_llm()
+
+
+# Rebuilds the LLM on the current pooled HTTP clients. The lifespan calls it at startup: a
+# previous lifespan in this process closed the clients the old one was built on.
+def bind_llm() -> None:
+    global llm
+    llm = _create_llm()
 
 
-llm = ChatOpenAI(
-    model=settings.llm_model,
-    api_key=SecretStr(settings.openrouter_api_key) if settings.openrouter_api_key else None,
-    base_url=settings.openrouter_base_url,
-    temperature=0,
+CONDENSE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "Given a conversation with a product catalog assistant and a follow-up message, "
+            "rewrite the follow-up as a standalone message that can be understood without the "
+            "conversation. Keep product names, article numbers and sizes it refers to. "
+            "If it already stands on its own, return it unchanged. Output ONLY the message.",
+        ),
+        ("human", "Conversation:\n{history}\n\nFollow-up: {query}"),
+    ]
 )
 
 
+llm_flights = SingleFlight("llm")
+chat_flights: StreamFlights[dict[str, Any]] = StreamFlights("chat")
+
+
+# Non-streamed completions. Identical prompts in flight at once (say, the same standalone
+# question reached from several conversations) share one LLM call.
+def _complete(prompt: ChatPromptTemplate, inputs: dict[str, Any]) -> str:
+    chain = prompt | llm | StrOutputParser()
+    if not settings.single_flight_enabled:
+        return chain.invoke(inputs)
+    return llm_flights.do(_prompt_key(prompt, inputs), lambda: chain.invoke(inputs))
+
+
+async def _acomplete(prompt: ChatPromptTemplate, inputs: dict[str, Any]) -> str:
+    chain = prompt | llm | StrOutputParser()
+    if not settings.single_flight_enabled:
+        return await chain.ainvoke(inputs)
+    return await llm_flights.ado(_prompt_key(prompt, inputs), lambda: chain.ainvoke(inputs))
+
+
+def _prompt_key(prompt: ChatPromptTemplate, inputs: dict[str, Any]) -> str:
+    return hashlib.sha256(prompt.format(**inputs).encode()).hexdigest()
+
+
+# Turn a follow-up ("and in 10 ml?") into a standalone query for routing and retrieval
+def condense_query(state: AgentState) -> AgentState:
+    if not state["history"]:
+        return state
+    log.info("node_condense_query", query=state["query"])
+    result = _complete(CONDENSE_PROMPT, {"history": state["history"], "query": state["query"]})
+    return _apply_condensed(state, result)
+
+
+async def acondense_query(state: AgentState) -> AgentState:
+    if not state["history"]:
+        return state
+    log.info("node_condense_query", query=state["query"])
+    result = await _acomplete(
+        CONDENSE_PROMPT, {"history": state["history"], "query": state["query"]}
+    )
+    return _apply_condensed(state, result)
+
+
+def _apply_condensed(state: AgentState, result: str) -> AgentState:
+    standalone = result.strip() or state["query"]
+    log.info("query_condensed", standalone_query=standalone)
+    return {**state, "query": standalone}
+
+
 ROUTER_PROMPT = ChatPromptTemplate.from_messages(
     [
         (
@@ -54,18 +170,72 @@ ROUTER_PROMPT = ChatPromptTemplate.from_messages(
 )
 
 
+fast_router = FastRouter(
+    brands=load_live_brand_lexicon,
+    index_version=get_index_version,
+    embeddings=get_embeddings if settings.router_embedding_classifier else None,
+    margin=settings.router_embedding_margin,
+)
+
+
+# Obvious intents (greetings, article numbers, brand names) skip the LLM classifier
 def router(state: AgentState) -> AgentState:
     log.info("node_router", query=state["query"])
-    chain = ROUTER_PROMPT | llm | StrOutputParser()
-    result = chain.invoke({"query": state["query"]})
+    if settings.fast_router_enabled and (fast := fast_router.classify(state["query"])):
+        return _route(state, fast)
+    result = _complete(ROUTER_PROMPT, {"query": state["query"]})
+    return _apply_route(state, result)
+
+
+async def arouter(state: AgentState) -> AgentState:
+    log.info("node_router", query=state["query"])
+    if settings.fast_router_enabled and (fast := await fast_router.aclassify(state["query"])):
+        return _route(state, fast)
+    result = await _acomplete(ROUTER_PROMPT, {"query": state["query"]})
+    return _apply_route(state, result)
+
+
+def _apply_route(state: AgentState, result: str) -> AgentState:
     decision = result.strip().lower()
 
     # Fallback to search if unclear
     if decision not in ["search", "chat"]:
         decision = "search"
 
-    log.info("router_decision", decision=decision)
-    return {**state, "route": decision}
+    return _route(state, RouteDecision(decision, "llm", 1.0))
+
+
+# `source` tells how the route was decided, so skipped LLM calls can be counted from logs
+def _route(state: AgentState, decision: RouteDecision) -> AgentState:
+    log.info(
+        "router_decision",
+        decision=decision.route,
+        source=decision.source,
+        confidence=decision.confidence,
+    )
+    ROUTES.labels(decision.route, decision.source).inc()
+    return {**state, "route": decision.route}
+
+
+# Forward completion deltas to the SSE stream as `token` events while collecting the full text
+def _stream_tokens(chain: Runnable[dict[str, Any], str], inputs: dict[str, Any]) -> str:
+    writer = get_stream_writer()
+    parts: list[str] = []
+    for token in chain.stream(inputs):
+        if token:
+            parts.append(token)
+            writer({"type": "token", "content": token})
+    return "".join(parts)
+
+
+async def _astream_tokens(chain: Runnable[dict[str, Any], str], inputs: dict[str, Any]) -> str:
+    writer = get_stream_writer()
+    parts: list[str] = []
+    async for token in chain.astream(inputs):
+        if token:
+            parts.append(token)
+            writer({"type": "token", "content": token})
+    return "".join(parts)
 
 
 CASUAL_CHAT_PROMPT = ChatPromptTemplate.from_messages(
@@ -87,19 +257,61 @@ CASUAL_CHAT_PROMPT = ChatPromptTemplate.from_messages(
 def casual_chat(state: AgentState) -> AgentState:
     log.info("node_casual_chat", query=state["query"])
     chain = CASUAL_CHAT_PROMPT | llm | StrOutputParser()
-    result = chain.invoke({"query": state["query"]})
+    result = _stream_tokens(chain, {"query": state["query"]})
     return {**state, "generation": result, "documents": []}
 
 
+async def acasual_chat(state: AgentState) -> AgentState:
+    log.info("node_casual_chat", query=state["query"])
+    chain = CASUAL_CHAT_PROMPT | llm | StrOutputParser()
+    result = await _astream_tokens(chain, {"query": state["query"]})
+    return {**state, "generation": result, "documents": []}
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+# The index version stream_agent pinned for this run, passed in the graph config
+def _pinned_index(config: RunnableConfig | None) -> IndexHandle | None:
+    return (config or {}).get("configurable", {}).get("index")
+
+
 # Fetch top-k relevant chunks from the vector store
-def retrieve(state: AgentState) -> AgentState:
+def retrieve(state: AgentState, config: RunnableConfig | None = None) -> AgentState:
     log.info("node_retrieve", query=state["query"])
-    retriever = get_retriever()
+    retriever = get_retriever(_pinned_index(config))
+    start = time.perf_counter()
     docs = retriever.invoke(state["query"])
-    log.info("retrieved_docs", count=len(docs))
+    log.info("retrieved_docs", count=len(docs), duration_ms=_elapsed_ms(start))
     return {**state, "documents": docs}
 
 
+async def aretrieve(state: AgentState, config: RunnableConfig | None = None) -> AgentState:
+    log.info("node_retrieve", query=state["query"])
+    retriever = get_retriever(_pinned_index(config))
+    start = time.perf_counter()
+    docs = await retriever.ainvoke(state["query"])
+    log.info("retrieved_docs", count=len(docs), duration_ms=_elapsed_ms(start))
+    return {**state, "documents": docs}
+
+
+# Constraint-style questions ("needles shorter than 20 mm, 27G") are answered from the
+# structured table store; matching rows go straight to generate as compact tables
+def filter_tables(state: AgentState, config: RunnableConfig | None = None) -> AgentState:
+    store = get_table_store(_pinned_index(config)) if settings.table_filter_enabled else None
+    if store is None:
+        return state
+    start = time.perf_counter()
+    docs = store.filter(state["query"])
+    log.info("node_filter_tables", matched_tables=len(docs), duration_ms=_elapsed_ms(start))
+    return {**state, "documents": docs}
+
+
+def after_filter(state: AgentState) -> str:
+    return "generate" if state["documents"] else "retrieve"
+
+
 BATCH_GRADER_PROMPT = ChatPromptTemplate.from_messages(
     [
         (
@@ -117,23 +329,123 @@ BATCH_GRADER_PROMPT = ChatPromptTemplate.from_messages(
 )
 
 
-# LLM-based filter: keep only chunks relevant to the query (Batched)
+grade_prefilter = GradePrefilter(
+    accept_similarity=settings.grader_accept_similarity,
+    reject_similarity=settings.grader_reject_similarity,
+)
+
+
+# LLM-based filter: keep only chunks relevant to the query (Batched). The local prefilter
+# settles clear accepts/rejects first, so the LLM only grades the uncertain middle.
 def grade_documents(state: AgentState) -> AgentState:
     log.info("node_grade_documents", num_docs=len(state["documents"]))
 
-    if not state["documents"]:
+    exact, candidates = _split_exact(state["documents"])
+    if not candidates:
+        _log_grading_skipped(exact)
         return state
 
-    chain = BATCH_GRADER_PROMPT | llm | StrOutputParser()
+    start = time.perf_counter()
+    split = (
+        grade_prefilter.split(state["query"], candidates)
+        if settings.grader_prefilter_enabled
+        else PrefilterResult(uncertain=candidates)
+    )
+    prefilter_ms = _elapsed_ms(start)
+
+    result, prompt = "none", ""
+    start = time.perf_counter()
+    if split.uncertain:
+        prompt = _format_grader_documents(split.uncertain)
+        result = _complete(BATCH_GRADER_PROMPT, {"question": state["query"], "documents": prompt})
+    _log_grader_savings(candidates, split, prompt, prefilter_ms, _elapsed_ms(start))
+    graded = _apply_grades(
+        {**state, "documents": split.uncertain}, result, keep=exact + split.accepted
+    )
+    GRADER_KEEP_RATIO.observe(len(graded["documents"]) / len(state["documents"]))
+    return graded
+
+
+async def agrade_documents(state: AgentState) -> AgentState:
+    log.info("node_grade_documents", num_docs=len(state["documents"]))
 
+    exact, candidates = _split_exact(state["documents"])
+    if not candidates:
+        _log_grading_skipped(exact)
+        return state
+
+    start = time.perf_counter()
+    split = (
+        grade_prefilter.split(state["query"], candidates)
+        if settings.grader_prefilter_enabled
+        else PrefilterResult(uncertain=candidates)
+    )
+    prefilter_ms = _elapsed_ms(start)
+
+    result, prompt = "none", ""
+    start = time.perf_counter()
+    if split.uncertain:
+        prompt = _format_grader_documents(split.uncertain)
+        result = await _acomplete(
+            BATCH_GRADER_PROMPT, {"question": state["query"], "documents": prompt}
+        )
+    _log_grader_savings(candidates, split, prompt, prefilter_ms, _elapsed_ms(start))
+    graded = _apply_grades(
+        {**state, "documents": split.uncertain}, result, keep=exact + split.accepted
+    )
+    GRADER_KEEP_RATIO.observe(len(graded["documents"]) / len(state["documents"]))
+    return graded
+
+
+# Tokens the unfiltered, untruncated grader prompt would have carried vs. what was sent
+def _log_grader_savings(
+    candidates: list[Document],
+    split: PrefilterResult,
+    prompt: str,
+    prefilter_ms: float,
+    llm_ms: float,
+) -> None:
+    full_tokens = count_tokens(_format_grader_documents(candidates, max_tokens=None))
+    sent_tokens = count_tokens(prompt) if prompt else 0
+    log.info(
+        "grader_prefilter",
+        accepted=len(split.accepted),
+        rejected=len(split.rejected),
+        uncertain=len(split.uncertain),
+        llm_skipped=not prompt,
+        full_tokens=full_tokens,
+        sent_tokens=sent_tokens,
+        saved_tokens=full_tokens - sent_tokens,
+        prefilter_ms=prefilter_ms,
+        llm_ms=llm_ms,
+    )
+
+
+# Exact article-number hits are relevant by construction and bypass the grader
+def _split_exact(documents: list[Document]) -> tuple[list[Document], list[Document]]:
+    exact = [doc for doc in documents if doc.metadata.get("exact_match")]
+    return exact, [doc for doc in documents if not doc.metadata.get("exact_match")]
+
+
+def _log_grading_skipped(exact: list[Document]) -> None:
+    if exact:
+        log.info("grading_skipped", exact=len(exact))
+
+
+# Chunks are cut to grader_chunk_tokens: the head of a page or table is enough to judge it
+def _format_grader_documents(
+    documents: list[Document], max_tokens: int | None = settings.grader_chunk_tokens
+) -> str:
     doc_strings = [
-        f"Document {i + 1}:\n{doc.page_content}" for i, doc in enumerate(state["documents"])
+        f"Document {i + 1}:\n"
+        + (truncate_tokens(doc.page_content, max_tokens) if max_tokens else doc.page_content)
+        for i, doc in enumerate(documents)
     ]
-    formatted_docs = "\n\n".join(doc_strings)
+    return "\n\n".join(doc_strings)
 
-    result = chain.invoke({"question": state["query"], "documents": formatted_docs})
 
-    # Parse results
+# Parse the grader's index list and keep only the selected documents (after any `keep`)
+def _apply_grades(state: AgentState, result: str, keep: list[Document] | None = None) -> AgentState:
     clean_result = result.strip().lower()
     relevant_indices = set()
 
@@ -143,15 +455,23 @@ def grade_documents(state: AgentState) -> AgentState:
 
     relevant_docs = [doc for i, doc in enumerate(state["documents"]) if i in relevant_indices]
 
-    log.info("grading_complete", relevant=len(relevant_docs), total=len(state["documents"]))
-    return {**state, "documents": relevant_docs}
+    log.info(
+        "grading_complete",
+        relevant=len(relevant_docs),
+        total=len(state["documents"]),
+        exact=len(keep or []),
+    )
+    return {**state, "documents": [*(keep or []), *relevant_docs]}
 
 
-# Route: generate if docs exist, rewrite once if none, else generate fallback
+# Route: generate if docs exist, rewrite once if none, else generate fallback. Rewrites are
+# counted here and when a speculation is used, not in rewrite_query: the speculative graph
+# runs that for every search and mostly discards the result.
 def decide_next(state: AgentState) -> str:
     if state["documents"]:
         return "generate"
     if not state["query_rewritten"]:
+        QUERY_REWRITES.inc()
         return "rewrite_query"
     return "generate"
 
@@ -172,12 +492,79 @@ REWRITE_PROMPT = ChatPromptTemplate.from_messages(
 # Reformulate the query for better retrieval on the German catalog
 def rewrite_query(state: AgentState) -> AgentState:
     log.info("node_rewrite_query", original_query=state["query"])
-    chain = REWRITE_PROMPT | llm | StrOutputParser()
-    new_query = chain.invoke({"query": state["query"]})
+    new_query = _complete(REWRITE_PROMPT, {"query": state["query"]})
     log.info("query_rewritten", new_query=new_query)
     return {**state, "query": new_query, "query_rewritten": True}
 
 
+async def arewrite_query(state: AgentState) -> AgentState:
+    log.info("node_rewrite_query", original_query=state["query"])
+    new_query = await _acomplete(REWRITE_PROMPT, {"query": state["query"]})
+    log.info("query_rewritten", new_query=new_query)
+    return {**state, "query": new_query, "query_rewritten": True}
+
+
+def _rewrite_and_retrieve(state: AgentState, config: RunnableConfig | None) -> AgentState:
+    return retrieve(rewrite_query(state), config)
+
+
+async def _arewrite_and_retrieve(state: AgentState, config: RunnableConfig | None) -> AgentState:
+    return await aretrieve(await arewrite_query(state), config)
+
+
+_speculation_executor = ContextThreadPoolExecutor(
+    max_workers=settings.speculation_workers, thread_name_prefix="speculation"
+)
+
+
+# Grade the first retrieval while the rewrite + second retrieval already runs. If the
+# grade keeps anything the speculative branch is cancelled (or, on the sync path where a
+# started thread cannot be stopped, its result is discarded); otherwise its documents
+# are already retrieved and only need grading. A speculation still queued behind busy
+# pool threads when it is needed is taken back and run inline rather than waited for.
+# Exact article-number hits always survive grading, so with any of them a rewrite could
+# never be used and none is started.
+def speculative_grade(state: AgentState, config: RunnableConfig | None = None) -> AgentState:
+    if _split_exact(state["documents"])[0]:
+        return grade_documents(state)
+    speculative = _speculation_executor.submit(_rewrite_and_retrieve, state, config)
+    start = time.perf_counter()
+    graded = grade_documents(state)
+    if graded["documents"]:
+        log.info("speculation_unused", cancelled=speculative.cancel(), grade_ms=_elapsed_ms(start))
+        return graded
+    rewritten = (
+        _rewrite_and_retrieve(state, config) if speculative.cancel() else speculative.result()
+    )
+    QUERY_REWRITES.inc()
+    log.info("speculation_used", wait_ms=_elapsed_ms(start))
+    return rewritten
+
+
+async def aspeculative_grade(state: AgentState, config: RunnableConfig | None = None) -> AgentState:
+    if _split_exact(state["documents"])[0]:
+        return await agrade_documents(state)
+    speculative = asyncio.create_task(_arewrite_and_retrieve(state, config))
+    start = time.perf_counter()
+    try:
+        graded = await agrade_documents(state)
+    except BaseException:
+        speculative.cancel()
+        raise
+    if graded["documents"]:
+        log.info("speculation_unused", cancelled=speculative.cancel(), grade_ms=_elapsed_ms(start))
+        return graded
+    rewritten = await speculative
+    QUERY_REWRITES.inc()
+    log.info("speculation_used", wait_ms=_elapsed_ms(start))
+    return rewritten
+
+
+# Graded documents go to generate; a used speculation returns ungraded rewritten docs
+def after_speculation(state: AgentState) -> str:
+    return "grade_documents" if state["query_rewritten"] else "generate"
+
+
 GENERATE_PROMPT = ChatPromptTemplate.from_messages(
     [
         (
@@ -202,45 +589,81 @@ Rules:
 )
 
 
+NO_ANSWER_MESSAGE = "I don't have enough information in the catalog to answer this question."
+
+
 # Produce a final answer from the graded context, or a fallback if no docs remain
 def generate(state: AgentState) -> AgentState:
     log.info("node_generate", num_docs=len(state["documents"]))
 
     if not state["documents"]:
-        return {
-            **state,
-            "generation": "I don't have enough information in the catalog to answer this question.",
-        }
+        return {**state, "generation": NO_ANSWER_MESSAGE}
 
     chain = GENERATE_PROMPT | llm | StrOutputParser()
-
-    context = "\n\n---\n\n".join(
-        f"[Page {doc.metadata.get('page', '?')}, Type: {doc.metadata.get('content_type', 'text')}]\n{doc.page_content}"
-        for doc in state["documents"]
+    result = _stream_tokens(
+        chain, {"context": _format_context(state["documents"]), "question": state["query"]}
     )
+    log.info("generation_complete", answer_length=len(result))
+    return {**state, "generation": result}
+
 
-    result = chain.invoke({"context": context, "question": state["query"]})
+async def agenerate(state: AgentState) -> AgentState:
+    log.info("node_generate", num_docs=len(state["documents"]))
+
+    if not state["documents"]:
+        return {**state, "generation": NO_ANSWER_MESSAGE}
+
+    chain = GENERATE_PROMPT | llm | StrOutputParser()
+    result = await _astream_tokens(
+        chain, {"context": _format_context(state["documents"]), "question": state["query"]}
+    )
     log.info("generation_complete", answer_length=len(result))
     return {**state, "generation": result}
 
 
-def build_graph() -> Any:
+def _format_context(documents: list[Document]) -> str:
+    return "\n\n---\n\n".join(
+        f"[Page {doc.metadata.get('page', '?')}, Type: {doc.metadata.get('content_type', 'text')}]\n{doc.page_content}"
+        for doc in documents
+    )
+
+
+# Nodes and edges shared by both graph variants; they differ only in what follows retrieve
+def _base_graph() -> StateGraph:
     graph = StateGraph(AgentState)
 
-    graph.add_node("router", router)
-    graph.add_node("casual_chat", casual_chat)
-    graph.add_node("retrieve", retrieve)
-    graph.add_node("grade_documents", grade_documents)
-    graph.add_node("rewrite_query", rewrite_query)
-    graph.add_node("generate", generate)
+    # Each node carries a sync and an async implementation; `stream` uses the former,
+    # `astream` the latter, so one compiled graph serves both entry points. timed_node
+    # records every run in the latency metrics and the request's timing summary.
+    graph.add_node("condense_query", timed_node("condense_query", condense_query, acondense_query))
+    graph.add_node("router", timed_node("router", router, arouter))
+    graph.add_node("casual_chat", timed_node("casual_chat", casual_chat, acasual_chat))
+    graph.add_node("filter_tables", timed_node("filter_tables", filter_tables))
+    graph.add_node("retrieve", timed_node("retrieve", retrieve, aretrieve))
+    graph.add_node(
+        "grade_documents", timed_node("grade_documents", grade_documents, agrade_documents)
+    )
+    graph.add_node("generate", timed_node("generate", generate, agenerate))
 
-    graph.set_entry_point("router")
+    graph.set_entry_point("condense_query")
+    graph.add_edge("condense_query", "router")
 
     graph.add_conditional_edges(
-        "router", lambda state: state["route"], {"search": "retrieve", "chat": "casual_chat"}
+        "router", lambda state: state["route"], {"search": "filter_tables", "chat": "casual_chat"}
+    )
+    graph.add_conditional_edges(
+        "filter_tables", after_filter, {"generate": "generate", "retrieve": "retrieve"}
     )
 
     graph.add_edge("casual_chat", END)
+    graph.add_edge("generate", END)
+    return graph
+
+
+def build_graph() -> Any:
+    graph = _base_graph()
+    graph.add_node("rewrite_query", timed_node("rewrite_query", rewrite_query, arewrite_query))
+
     graph.add_edge("retrieve", "grade_documents")
     graph.add_conditional_edges(
         "grade_documents",
@@ -248,18 +671,39 @@ def build_graph() -> Any:
         {"generate": "generate", "rewrite_query": "rewrite_query"},
     )
     graph.add_edge("rewrite_query", "retrieve")
-    graph.add_edge("generate", END)
+
+    return graph.compile()
+
+
+# Speculative variant: after the first retrieval, rewrite_query -> retrieve runs
+# concurrently with the first grading instead of after it rejected everything.
+#   retrieve -> speculative_grade -> [generate | grade_documents (rewritten docs) -> generate]
+def build_speculative_graph() -> Any:
+    graph = _base_graph()
+    graph.add_node(
+        "speculative_grade", timed_node("speculative_grade", speculative_grade, aspeculative_grade)
+    )
+
+    graph.add_edge("retrieve", "speculative_grade")
+    graph.add_conditional_edges(
+        "speculative_grade",
+        after_speculation,
+        {"generate": "generate", "grade_documents": "grade_documents"},
+    )
+    graph.add_edge("grade_documents", "generate")
 
     return graph.compile()
 
 
 # Compiled once at import time to avoid rebuilding per request
-rag_agent = build_graph()
+rag_agent = build_speculative_graph() if settings.speculative_rewrite else build_graph()
 
 
 NODE_STATUS_LABELS: dict[str, str] = {
+    "filter_tables": "Filtering product tables...",
     "retrieve": "Searching documents...",
     "grade_documents": "Evaluating relevance...",
+    "speculative_grade": "Evaluating relevance...",
     "rewrite_query": "Refining search...",
     "generate": "Generating answer...",
     "router": "Understanding intent...",
@@ -267,40 +711,146 @@ NODE_STATUS_LABELS: dict[str, str] = {
 }
 
 
+# "updates" drives the status events, "custom" carries token deltas from _stream_tokens
+STREAM_MODES: list[StreamMode] = ["updates", "custom"]
+
+
 def _sse_event(data: dict[str, Any]) -> str:
     return f"data: {json.dumps(data)}\n\n"
 
 
-def stream_agent(query: str, conversation_id: str | None = None) -> Generator[str, None, None]:
-    conv_id = conversation_id or str(uuid.uuid4())
-    log.info("agent_stream_started", query=query, conversation_id=conv_id)
+answer_cache = AnswerCache(
+    max_entries=settings.answer_cache_size,
+    ttl_s=settings.answer_cache_ttl_s,
+    index_version=get_index_version,
+    similarity_threshold=settings.answer_cache_similarity,
+    embeddings=get_embeddings,
+)
+
+
+# Only cache real answers: chat replies, or searches that found supporting documents
+def _cacheable(result: AgentState | None) -> bool:
+    return result is not None and (result["route"] == "chat" or bool(result["documents"]))
+
 
-    initial_state: AgentState = {
+def _cache_payload(event: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in event.items() if key not in ("conversation_id", "timings")}
+
+
+# Graph config for one run: the pinned index version, and the timing/token collectors
+def _run_config(index: IndexHandle | None, timings: RequestTimings) -> RunnableConfig:
+    return {
+        "configurable": {"index": index, "timings": timings},
+        "callbacks": [TokenUsageCallback(timings)],
+    }
+
+
+# The request's own total time, with node times and tokens of the graph run that served it
+def _finish(
+    event: dict[str, Any], timings: RequestTimings, coalesced: bool = False
+) -> dict[str, Any]:
+    own = timings.summary()
+    CHAT_SECONDS.observe(own["total_ms"] / 1000)
+    summary = {**own, **event.get("timings", {}), "total_ms": own["total_ms"]}
+    return {**event, "timings": {**summary, "coalesced": coalesced}}
+
+
+def _initial_state(query: str, history: str = "") -> AgentState:
+    return {
         "query": query,
         "documents": [],
         "generation": "",
         "query_rewritten": False,
         "route": "search",
+        "history": history,
     }
 
-    result: AgentState | None = None
-    for event in rag_agent.stream(initial_state):
-        for node_name, node_output in event.items():
-            result = cast(AgentState, node_output)
-            label = NODE_STATUS_LABELS.get(node_name)
-            if label:
-                yield _sse_event({"type": "status", "message": label})
 
-    if result is None:
-        yield _sse_event(
-            {
-                "type": "answer",
-                "answer": "Something went wrong — no result from the agent.",
-                "sources": [],
-                "conversation_id": conv_id,
-            }
-        )
+conversations = ConversationStore(
+    max_entries=settings.memory_max_conversations,
+    ttl_s=settings.memory_ttl_s,
+    path=conversation_store_path() if settings.memory_persist else None,
+)
+
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "Summarize this conversation between a user and a medical product catalog assistant "
+            "in a few sentences. Keep product names, article numbers, sizes and page numbers "
+            "the user may refer back to. Output ONLY the summary.",
+        ),
+        ("human", "{conversation}"),
+    ]
+)
+
+
+def _load_conversation(conv_id: str) -> Conversation:
+    return conversations.get(conv_id) if settings.memory_enabled else Conversation()
+
+
+async def _aload_conversation(conv_id: str) -> Conversation:
+    return await conversations.aget(conv_id) if settings.memory_enabled else Conversation()
+
+
+# Stored answers are truncated; the summary and sources carry what follow-ups need
+def _with_turn(conversation: Conversation, query: str, answer: str) -> Conversation:
+    turn = (query, truncate_tokens(answer, settings.memory_answer_tokens))
+    return Conversation(summary=conversation.summary, turns=[*conversation.turns, turn])
+
+
+def _record_turn(conv_id: str, conversation: Conversation, query: str, answer: str) -> Conversation:
+    updated = _with_turn(conversation, query, answer)
+    conversations.put(conv_id, updated)
+    return updated
+
+
+async def _arecord_turn(
+    conv_id: str, conversation: Conversation, query: str, answer: str
+) -> Conversation:
+    updated = _with_turn(conversation, query, answer)
+    await conversations.aput(conv_id, updated)
+    return updated
+
+
+# Once history exceeds its token budget, fold all but the most recent turns into the summary
+def _split_for_summary(conversation: Conversation) -> tuple[Conversation, list[tuple[str, str]]]:
+    recent = settings.memory_recent_turns
+    if (
+        len(conversation.turns) <= recent
+        or count_tokens(conversation.render()) <= settings.memory_history_tokens
+    ):
+        return Conversation(), conversation.turns
+    older = Conversation(summary=conversation.summary, turns=conversation.turns[:-recent])
+    return older, conversation.turns[-recent:]
+
+
+def compact_conversation(conv_id: str, conversation: Conversation) -> None:
+    older, recent = _split_for_summary(conversation)
+    if not older.turns:
         return
+    summary = _complete(SUMMARY_PROMPT, {"conversation": older.render()})
+    conversations.put(conv_id, Conversation(summary=summary.strip(), turns=recent))
+    log.info("conversation_summarized", conversation_id=conv_id, folded_turns=len(older.turns))
+
+
+async def acompact_conversation(conv_id: str, conversation: Conversation) -> None:
+    older, recent = _split_for_summary(conversation)
+    if not older.turns:
+        return
+    summary = await _acomplete(SUMMARY_PROMPT, {"conversation": older.render()})
+    await conversations.aput(conv_id, Conversation(summary=summary.strip(), turns=recent))
+    log.info("conversation_summarized", conversation_id=conv_id, folded_turns=len(older.turns))
+
+
+def _answer_event(result: AgentState | None) -> dict[str, Any]:
+    if result is None:
+        return {
+            "type": "answer",
+            "answer": "Something went wrong — no result from the agent.",
+            "sources": [],
+        }
 
     sources = [
         {
@@ -313,14 +863,152 @@ def stream_agent(query: str, conversation_id: str | None = None) -> Generator[st
         for doc in result.get("documents", [])
     ]
 
-    log.info("agent_stream_complete", conversation_id=conv_id, num_sources=len(sources))
+    log.info("agent_stream_complete", num_sources=len(sources))
 
-    yield _sse_event(
-        {
-            "type": "answer",
-            "answer": result.get("generation", ""),
-            "sources": sources,
-            "conversation_id": conv_id,
-            "rewritten_query": result.get("query") if result.get("query_rewritten") else None,
-        }
+    return {
+        "type": "answer",
+        "answer": result.get("generation", ""),
+        "sources": sources,
+        "rewritten_query": result.get("query") if result.get("query_rewritten") else None,
+    }
+
+
+# The index version a turn's answer was produced against, for the answer cache
+def _pinned_generation(index: IndexHandle | None) -> int | None:
+    return index.generation if index is not None else None
+
+
+# Runs the graph for one turn: status and token events as nodes finish, then the answer
+# (without conversation_id; timings cover the graph run). First-turn answers are cached.
+def _run_turn(query: str, history: str, use_cache: bool) -> Iterator[dict[str, Any]]:
+    timings = RequestTimings()
+    result: AgentState | None = None
+    # The whole run reads one index version, even if a rebuild goes live meanwhile
+    with pin_index() as index:
+        config = _run_config(index, timings)
+        state = _initial_state(query, history)
+        for mode, event in rag_agent.stream(state, config, stream_mode=STREAM_MODES):
+            if mode == "custom":
+                yield event
+                continue
+            for node_name, node_output in event.items():
+                result = cast(AgentState, node_output)
+                label = NODE_STATUS_LABELS.get(node_name)
+                if label:
+                    yield {"type": "status", "message": label}
+
+    answer = {**_answer_event(result), "timings": timings.summary()}
+    if use_cache and _cacheable(result):
+        answer_cache.put(query, _cache_payload(answer), _pinned_generation(index))
+    yield answer
+
+
+async def _arun_turn(query: str, history: str, use_cache: bool) -> AsyncIterator[dict[str, Any]]:
+    timings = RequestTimings()
+    result: AgentState | None = None
+    # The whole run reads one index version, even if a rebuild goes live meanwhile
+    with pin_index() as index:
+        config = _run_config(index, timings)
+        state = _initial_state(query, history)
+        async for mode, event in rag_agent.astream(state, config, stream_mode=STREAM_MODES):
+            if mode == "custom":
+                yield event
+                continue
+            for node_name, node_output in event.items():
+                result = cast(AgentState, node_output)
+                label = NODE_STATUS_LABELS.get(node_name)
+                if label:
+                    yield {"type": "status", "message": label}
+
+    answer = {**_answer_event(result), "timings": timings.summary()}
+    if use_cache and _cacheable(result):
+        await answer_cache.aput(query, _cache_payload(answer), _pinned_generation(index))
+    yield answer
+
+
+# First turns depend only on the query, so identical ones asked while one is running
+# (e.g. at a shift change) subscribe to that run instead of starting their own
+def _coalescable(history: str) -> bool:
+    return settings.single_flight_enabled and not history
+
+
+# Synchronous fallback: Starlette iterates this on its threadpool
+def stream_agent(query: str, conversation_id: str | None = None) -> Generator[str, None, None]:
+    conv_id = conversation_id or str(uuid.uuid4())
+    log.info("agent_stream_started", query=query, conversation_id=conv_id)
+
+    conversation = _load_conversation(conv_id)
+    history = conversation.render()
+    # Follow-ups depend on their history, so only first turns use the answer cache
+    use_cache = settings.answer_cache_enabled and not history
+    timings = RequestTimings()
+    CHAT_REQUESTS.inc()
+
+    if use_cache:
+        cached = answer_cache.get(query)
+        ANSWER_CACHE.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            if settings.memory_enabled:
+                _record_turn(conv_id, conversation, query, cached["answer"])
+            yield _sse_event(_finish({**cached, "conversation_id": conv_id}, timings))
+            return
+
+    events, coalesced = (
+        chat_flights.join(normalize_query(query), lambda: _run_turn(query, history, use_cache))
+        if _coalescable(history)
+        else (_run_turn(query, history, use_cache), False)
+    )
+    for event in events:
+        if event["type"] != "answer":
+            yield _sse_event(event)
+            continue
+        answer = _finish({**event, "conversation_id": conv_id}, timings, coalesced)
+        if settings.memory_enabled:
+            conversation = _record_turn(conv_id, conversation, query, answer["answer"])
+        yield _sse_event(answer)
+
+    # Summarizing after the answer is out keeps it off the response's critical path
+    if settings.memory_enabled:
+        compact_conversation(conv_id, conversation)
+
+
+# Native asyncio variant: runs the async node implementations on the event loop
+async def astream_agent(
+    query: str, conversation_id: str | None = None
+) -> AsyncGenerator[str, None]:
+    conv_id = conversation_id or str(uuid.uuid4())
+    log.info("agent_stream_started", query=query, conversation_id=conv_id)
+
+    conversation = await _aload_conversation(conv_id)
+    history = conversation.render()
+    # Follow-ups depend on their history, so only first turns use the answer cache
+    use_cache = settings.answer_cache_enabled and not history
+    timings = RequestTimings()
+    CHAT_REQUESTS.inc()
+
+    if use_cache:
+        cached = await answer_cache.aget(query)
+        ANSWER_CACHE.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            if settings.memory_enabled:
+                await _arecord_turn(conv_id, conversation, query, cached["answer"])
+            yield _sse_event(_finish({**cached, "conversation_id": conv_id}, timings))
+            return
+
+    events, coalesced = (
+        chat_flights.ajoin(normalize_query(query), lambda: _arun_turn(query, history, use_cache))
+        if _coalescable(history)
+        else (_arun_turn(query, history, use_cache), False)
     )
+    async for event in events:
+        if event["type"] != "answer":
+            yield _sse_event(event)
+            continue
+        answer = _finish({**event, "conversation_id": conv_id}, timings, coalesced)
+        if settings.memory_enabled:
+            conversation = await _arecord_turn(conv_id, conversation, query, answer["answer"])
+        yield _sse_event(answer)
+
+    # Summarizing after the answer is out keeps it off the response's critical path
+    if settings.memory_enabled:
+        await acompact_conversation(conv_id, conversation)
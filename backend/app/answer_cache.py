@@ -0,0 +1,162 @@
+# Answer cache: replay finished answers for repeated questions without running the graph.
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().strip("?!.").strip().lower()
+
+
+# Digit runs (article numbers, sizes) must match exactly for a semantic hit:
+# "Art.-Nr. 4550242" and "Art.-Nr. 4550243" embed almost identically.
+def _numbers(query: str) -> tuple[str, ...]:
+    return tuple(re.findall(r"\d+", query))
+
+
+@dataclass
+class _Entry:
+    payload: dict[str, Any]
+    index_version: int
+    expires_at: float
+    embedding: np.ndarray | None
+
+
+# LRU + TTL cache of answer payloads keyed on the normalized query, with an optional
+# cosine-similarity fallback. Entries remember the index version they were produced
+# against, so rebuilding the index invalidates them without explicit coordination.
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_s: float,
+        index_version: Callable[[], int],
+        similarity_threshold: float = 0.0,
+        embeddings: Callable[[], Embeddings] | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity_threshold = similarity_threshold
+        self._index_version = index_version
+        self._embeddings = embeddings if similarity_threshold > 0 else None
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str) -> dict[str, Any] | None:
+        embedding = self._embed(query) if self._needs_embedding(query) else None
+        return self._lookup(query, embedding)
+
+    async def aget(self, query: str) -> dict[str, Any] | None:
+        embedding = await self._aembed(query) if self._needs_embedding(query) else None
+        return self._lookup(query, embedding)
+
+    # `index_version` is the version the answer was produced against (the one its turn
+    # pinned); answers from an index that has since been replaced are not stored
+    def put(self, query: str, payload: dict[str, Any], index_version: int | None = None) -> None:
+        embedding = self._embed(query) if self._embeddings else None
+        self._store(query, payload, embedding, index_version)
+
+    async def aput(
+        self, query: str, payload: dict[str, Any], index_version: int | None = None
+    ) -> None:
+        embedding = await self._aembed(query) if self._embeddings else None
+        self._store(query, payload, embedding, index_version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _needs_embedding(self, query: str) -> bool:
+        if self._embeddings is None:
+            return False
+        with self._lock:
+            return normalize_query(query) not in self._entries
+
+    def _embed(self, query: str) -> np.ndarray | None:
+        assert self._embeddings is not None
+        return _unit(self._embeddings().embed_query(normalize_query(query)))
+
+    async def _aembed(self, query: str) -> np.ndarray | None:
+        assert self._embeddings is not None
+        return _unit(await self._embeddings().aembed_query(normalize_query(query)))
+
+    def _lookup(self, query: str, embedding: np.ndarray | None) -> dict[str, Any] | None:
+        key = normalize_query(query)
+        with self._lock:
+            self._evict_stale()
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                log.info("answer_cache_hit", match="exact")
+                return entry.payload
+
+            if embedding is None:
+                return None
+
+            best_key, best_score = None, self.similarity_threshold
+            for candidate_key, candidate in self._entries.items():
+                if candidate.embedding is None or _numbers(candidate_key) != _numbers(key):
+                    continue
+                score = float(candidate.embedding @ embedding)
+                if score >= best_score:
+                    best_key, best_score = candidate_key, score
+
+            if best_key is None:
+                return None
+
+            self._entries.move_to_end(best_key)
+            log.info("answer_cache_hit", match="semantic", similarity=round(best_score, 4))
+            return self._entries[best_key].payload
+
+    def _store(
+        self,
+        query: str,
+        payload: dict[str, Any],
+        embedding: np.ndarray | None,
+        index_version: int | None,
+    ) -> None:
+        key = normalize_query(query)
+        current = self._index_version()
+        if index_version is not None and index_version != current:
+            log.info("answer_cache_skip", reason="index changed during the turn")
+            return
+        with self._lock:
+            self._entries[key] = _Entry(
+                payload=payload,
+                index_version=current,
+                expires_at=time.monotonic() + self.ttl_s,
+                embedding=embedding,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict_stale(self) -> None:
+        now = time.monotonic()
+        version = self._index_version()
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if entry.expires_at <= now or entry.index_version != version
+        ]
+        for key in stale:
+            del self._entries[key]
+
+
+def _unit(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
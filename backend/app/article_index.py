@@ -0,0 +1,101 @@
+# Exact article-number index: catalog IDs are parsed out of table rows at extraction time
+# and persisted as ID -> (chunk, page, row), so ID lookups skip BM25 and vector search.
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from app.bm25 import ChunkStore
+from app.extraction import ARTICLE_NUMBER_RE, find_article_numbers
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+_PREFIX_RE = re.compile(r"\bart\.?\s?-?\s?nr\b\.?|\bref\b\.?", re.IGNORECASE)
+
+
+# True when the query is nothing but article numbers (and "Art.-Nr." prefixes)
+def is_id_only(query: str) -> bool:
+    remainder = _PREFIX_RE.sub(" ", ARTICLE_NUMBER_RE.sub(" ", query))
+    return not re.search(r"\w", remainder)
+
+
+@dataclass
+class ArticleHit:
+    chunk: int
+    page: int
+    row: int
+
+
+class ArticleIndex:
+    def __init__(self, entries: dict[str, ArticleHit]) -> None:
+        self.entries = entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, query: str) -> list[tuple[str, ArticleHit]]:
+        return [
+            (id_, self.entries[id_]) for id_ in find_article_numbers(query) if id_ in self.entries
+        ]
+
+
+# `documents` must be in chunk-store order, so each hit addresses its chunk by position
+def save_article_index(path: Path, documents: list[Document]) -> ArticleIndex:
+    entries: dict[str, ArticleHit] = {}
+    for position, doc in enumerate(documents):
+        rows = json.loads(doc.metadata.get("article_numbers") or "{}")
+        for article_number, row in rows.items():
+            entries.setdefault(article_number, ArticleHit(position, doc.metadata["page"], row))
+
+    staging = path.with_name(path.name + ".tmp")
+    staging.write_text(
+        json.dumps({id_: [hit.chunk, hit.page, hit.row] for id_, hit in entries.items()})
+    )
+    staging.replace(path)
+
+    log.info("article_index_saved", num_ids=len(entries))
+    return ArticleIndex(entries)
+
+
+def load_article_index(path: Path) -> ArticleIndex | None:
+    if not path.exists():
+        return None
+    raw = json.loads(path.read_text())
+    return ArticleIndex({id_: ArticleHit(*values) for id_, values in raw.items()})
+
+
+# Header, separator and the matched row of a markdown table chunk
+def _row_excerpt(markdown: str, row: int) -> str:
+    lines = markdown.split("\n")
+    if row + 1 >= len(lines):
+        return markdown
+    return "\n".join([lines[0], lines[1], lines[row + 1]])
+
+
+# Resolves article numbers in the query to their table rows. Hits are relevant by
+# construction, so they are flagged `exact_match` and the grader passes them through.
+class ArticleRetriever(BaseRetriever):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: ArticleIndex
+    chunks: ChunkStore
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        docs = []
+        for article_number, hit in self.index.lookup(query):
+            chunk = self.chunks.get(hit.chunk)
+            chunk.metadata.update(
+                {"exact_match": True, "article_number": article_number, "table_row": hit.row}
+            )
+            chunk.page_content = _row_excerpt(chunk.page_content, hit.row)
+            docs.append(chunk)
+        return docs
@@ -0,0 +1,227 @@
+# Persisted BM25 index: a CSR term-document matrix of BM25 weights written at index time
+# as .npy arrays (memory-mapped on load) next to a JSONL chunk store, so workers start
+# without re-fetching the corpus from Chroma or re-tokenizing it.
+
+import json
+import mmap
+import re
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+FORMAT_VERSION = 2
+_ARRAYS = ("indptr", "doc_ids", "weights", "offsets")
+
+# Catalog-aware tokens: "Art.-Nr." stays one token, and identifiers or measurements with
+# inner dots, commas, dashes or slashes ("4606051V", "0,45", "1/2", "G-26") stay intact.
+_TOKEN_RE = re.compile(r"(?P<artnr>\bart\.?\s?-?\s?nr\b\.?)|\w+(?:[.,\-/]\w+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        "art.-nr." if match.lastgroup == "artnr" else match.group()
+        for match in _TOKEN_RE.finditer(text.lower())
+    ]
+
+
+# CSR term-document matrix with the full BM25 term weight precomputed per posting:
+# row t holds doc_ids[indptr[t]:indptr[t + 1]] and their weights, so scoring a query
+# is one bincount over the concatenated rows of its terms.
+@dataclass
+class BM25Index:
+    vocab: dict[str, int]
+    indptr: np.ndarray
+    doc_ids: np.ndarray
+    weights: np.ndarray
+    num_docs: int
+
+    @classmethod
+    def build(
+        cls, texts: list[str], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25
+    ) -> "BM25Index":
+        vocab: dict[str, int] = {}
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        term_ids: list[int] = []
+        token_docs: list[int] = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[doc_id] = len(tokens)
+            term_ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+            token_docs.extend([doc_id] * len(tokens))
+
+        return cls.from_tokens(
+            vocab,
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(token_docs, dtype=np.int64),
+            doc_len,
+            k1=k1,
+            b=b,
+            epsilon=epsilon,
+        )
+
+    # Build from one (term id, doc id) pair per token occurrence
+    @classmethod
+    def from_tokens(
+        cls,
+        vocab: dict[str, int],
+        term_ids: np.ndarray,
+        token_docs: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> "BM25Index":
+        num_docs = len(doc_len)
+        stride = max(num_docs, 1)
+
+        # Count (term, doc) pairs; np.unique sorts them term-major, i.e. in CSR order
+        pairs, tf = np.unique(term_ids * stride + token_docs, return_counts=True)
+        terms = pairs // stride
+        doc_ids = (pairs % stride).astype(np.int32)
+
+        df = np.bincount(terms, minlength=len(vocab)).astype(np.float64)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(df)
+
+        # BM25Okapi IDF, with negative values floored to epsilon * mean IDF
+        idf = np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+
+        avgdl = float(doc_len.mean()) if num_docs else 1.0
+        norm = k1 * (1 - b + b * doc_len[doc_ids] / (avgdl or 1.0))
+        weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+
+        return cls(vocab, indptr, doc_ids, weights.astype(np.float32), num_docs)
+
+    def scores(self, query: str) -> np.ndarray:
+        rows = [self.vocab[token] for token in tokenize(query) if token in self.vocab]
+        if not rows or not self.num_docs:
+            return np.zeros(self.num_docs, dtype=np.float32)
+
+        doc_ids = np.concatenate([self.doc_ids[self.indptr[t] : self.indptr[t + 1]] for t in rows])
+        weights = np.concatenate([self.weights[self.indptr[t] : self.indptr[t + 1]] for t in rows])
+        return np.bincount(doc_ids, weights=weights, minlength=self.num_docs).astype(np.float32)
+
+    def top_k(self, query: str, k: int) -> np.ndarray:
+        return top_k_indices(self.scores(query), k)
+
+
+# Indices of the k highest scores, best first; argpartition avoids a full sort
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+# Chunk text and metadata in JSONL, read back by byte offset so only hits are loaded
+class ChunkStore:
+    def __init__(self, path: Path, offsets: np.ndarray) -> None:
+        self.offsets = offsets
+        self._file = path.open("rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, doc_id: int) -> Document:
+        line = self._mmap[self.offsets[doc_id] : self.offsets[doc_id + 1]]
+        record = json.loads(line)
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+
+def save_bm25_index(directory: Path, documents: list[Document]) -> BM25Index:
+    index = BM25Index.build([doc.page_content for doc in documents])
+
+    staging = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    offsets = [0]
+    with (staging / "chunks.jsonl").open("wb") as f:
+        for doc in documents:
+            line = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata})
+            offsets.append(offsets[-1] + f.write(line.encode("utf-8") + b"\n"))
+
+    arrays: dict[str, Any] = {
+        "indptr": index.indptr,
+        "doc_ids": index.doc_ids,
+        "weights": index.weights,
+        "offsets": np.asarray(offsets, dtype=np.int64),
+    }
+    for name in _ARRAYS:
+        np.save(staging / f"{name}.npy", arrays[name])
+    (staging / "vocab.json").write_text(json.dumps(index.vocab, ensure_ascii=False))
+    (staging / "meta.json").write_text(
+        json.dumps({"version": FORMAT_VERSION, "num_docs": index.num_docs})
+    )
+
+    # Swap the finished directory in so readers never see a half-written index
+    previous = directory.with_name(directory.name + ".old")
+    shutil.rmtree(previous, ignore_errors=True)
+    if directory.exists():
+        directory.rename(previous)
+    staging.rename(directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    log.info("bm25_index_saved", num_docs=index.num_docs, vocab_size=len(index.vocab))
+    return index
+
+
+def load_bm25_index(directory: Path) -> tuple[BM25Index, ChunkStore] | None:
+    meta_path = directory / "meta.json"
+    if not meta_path.exists():
+        return None
+
+    meta = json.loads(meta_path.read_text())
+    if meta.get("version") != FORMAT_VERSION:
+        return None
+
+    arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+    index = BM25Index(
+        vocab=json.loads((directory / "vocab.json").read_text()),
+        indptr=arrays["indptr"],
+        doc_ids=arrays["doc_ids"],
+        weights=arrays["weights"],
+        num_docs=meta["num_docs"],
+    )
+    return index, ChunkStore(directory / "chunks.jsonl", arrays["offsets"])
+
+
+class PersistedBM25Retriever(BaseRetriever):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: BM25Index
+    chunks: ChunkStore
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        scores = self.index.scores(query)
+        docs = []
+        for doc_id in top_k_indices(scores, self.k):
+            # Zero means no query term occurs in the chunk at all
+            if scores[doc_id] <= 0:
+                break
+            doc = self.chunks.get(int(doc_id))
+            doc.metadata["bm25_score"] = float(scores[doc_id])
+            docs.append(doc)
+        return docs
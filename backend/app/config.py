@@ -12,11 +12,97 @@ class Settings(BaseSettings):
     pdf_path: str = "../data/product_catalog_01.pdf"
     chroma_dir: str = "./data/chroma"
 
-    # Retrieval
+    # Vector index: "chroma", or "matrix" for an in-process memory-mapped matrix with exact
+    # top-k search (switching backends needs a re-index). The matrix stores "int8" (1 byte
+    # per dimension, fastest) or "float16" rows.
+    vector_backend: str = "chroma"
+    vector_dtype: str = "int8"
+
+    # Ingestion (pdf_path may also be a directory or glob of PDFs; 0 workers = one per core)
+    ingest_workers: int = 0
+    ingest_pages_per_task: int = 16
+    # Page text is split along layout blocks and tables into row groups (header repeated) of
+    # at most this many tokens, though a group always holds one row; 0 keeps one chunk per
+    # page text and per table
+    chunk_max_tokens: int = 400
+
+    # Retrieval: each leg fetches retrieval_k, fusion keeps at most retrieval_k within the budget
     retrieval_k: int = 8
+    retrieval_token_budget: int = 6_000
+    rrf_k: int = 60
+    # Constraint questions ("shorter than 20 mm") are answered from the table store first
+    table_filter_enabled: bool = True
+    table_filter_max_rows: int = 20
+
+    # Fast-path router: rules decide obvious intents; the embedding classifier is opt-in
+    fast_router_enabled: bool = True
+    router_embedding_classifier: bool = False
+    router_embedding_margin: float = 0.05
+
+    # Grader prefilter: local accept/reject on the vector leg's query/chunk cosine and term
+    # overlap; the LLM grades only the uncertain rest, each chunk cut to grader_chunk_tokens
+    grader_prefilter_enabled: bool = True
+    grader_accept_similarity: float = 0.55
+    grader_reject_similarity: float = 0.2
+    grader_chunk_tokens: int = 300
+
+    # Rewrite + re-retrieve concurrently with the first grading; costs one rewrite call per
+    # search even when the first retrieval suffices. On the sync path each speculation takes
+    # one of speculation_workers threads; one still queued when needed runs inline instead
+    speculative_rewrite: bool = False
+    speculation_workers: int = 16
+
+    # Embedding stage during indexing
+    embedding_batch_size: int = 128
+    embedding_batch_max_tokens: int = 100_000
+    embedding_max_in_flight: int = 4
+    embedding_max_retries: int = 6
+    # Client-side tiktoken splitting of over-long embedding inputs; needs tiktoken's encoding
+    # files (downloaded on first use), so offline setups turn it off
+    embedding_check_ctx_length: bool = True
+    embedding_retry_base_s: float = 1.0
+
+    # Embedding cache (stored next to chroma_dir so it survives re-indexing)
+    embedding_cache_enabled: bool = True
+    embedding_cache_memory_size: int = 10_000
+    embedding_cache_disk_size: int = 500_000
+
+    # Answer cache (similarity 0 = exact normalized-query matches only)
+    answer_cache_enabled: bool = True
+    answer_cache_size: int = 1_000
+    answer_cache_ttl_s: float = 3_600
+    answer_cache_similarity: float = 0.0
+
+    # Single-flight: identical first-turn chats in flight share one graph run, and identical
+    # LLM prompts and embedding inputs in flight share one call
+    single_flight_enabled: bool = True
+
+    # Conversation memory: history beyond memory_history_tokens is folded into a rolling
+    # summary, keeping the last memory_recent_turns verbatim; persist keeps it across restarts
+    memory_enabled: bool = True
+    memory_max_conversations: int = 10_000
+    memory_ttl_s: float = 86_400
+    memory_persist: bool = False
+    memory_history_tokens: int = 1_500
+    memory_recent_turns: int = 4
+    memory_answer_tokens: int = 200
+
+    # Shared HTTP clients for OpenRouter (HTTP/2 needs the h2 package from httpx[http2])
+    http2: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_s: float = 60.0
+    http_timeout_s: float = 120.0
+    http_connect_timeout_s: float = 10.0
+    warm_up_on_startup: bool = True
+
+    # Admin API (/admin/*) is disabled unless a token is set; send it as X-Admin-Token
+    admin_token: str = ""
 
     # App
     log_level: str = "INFO"
+    # Serve /chat from the native asyncio pipeline; False falls back to the sync generator
+    async_agent: bool = True
 
     model_config = {"env_file": ".env", "extra": "ignore"}
 
@@ -0,0 +1,254 @@
+# Embedding cache: in-process LRU backed by a persistent SQLite store, keyed by model + text hash.
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from app.log import get_logger
+from app.metrics import EMBEDDING_CACHE
+from app.single_flight import SingleFlight
+
+log = get_logger(__name__)
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Two-level cache: a bounded LRU in memory and a bounded SQLite table on disk.
+# Entries are keyed by (model, sha256(text)) so switching embedding models never
+# serves vectors from a different embedding space. The async methods answer memory hits
+# inline and run SQLite on a worker thread, so disk I/O never blocks the event loop.
+class EmbeddingCache:
+    # Access times of disk hits are written in batches of this size, and always before pruning
+    touch_batch = 1_000
+
+    def __init__(self, path: Path, model: str, max_memory: int, max_disk: int) -> None:
+        self.model = model
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._touched: set[str] = set()
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL,"
+            " accessed REAL NOT NULL DEFAULT (julianday('now')),"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (model, accessed)"
+        )
+        self._conn.commit()
+        # Upper bound on the rows on disk: counted once here, then raised by every insert
+        # (replacements included), so puts skip COUNT(*) until the bound may be exceeded
+        self._disk_rows = self._count_disk()
+
+    # Return cached vectors in input order, None for misses
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        keys = [_text_key(text) for text in texts]
+        return self._results(keys, self._lookup(keys, disk=True))
+
+    async def aget_many(self, texts: list[str]) -> list[list[float] | None]:
+        keys = [_text_key(text) for text in texts]
+        found = self._lookup(keys, disk=False)
+        if len(found) < len(set(keys)):
+            found = await asyncio.to_thread(self._lookup, keys, True)
+        return self._results(keys, found)
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = _text_key(text)
+                self._remember(key, vector)
+                rows.append((self.model, key, array("f", vector).tobytes()))
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)", rows
+            )
+            self._disk_rows += len(rows)
+            if self._disk_rows > self.max_disk:
+                self._prune_disk()
+            self._conn.commit()
+
+    async def aput_many(self, texts: list[str], vectors: list[list[float]]) -> None:
+        await asyncio.to_thread(self.put_many, texts, vectors)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def _lookup(self, keys: list[str], disk: bool) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+            missing = [key for key in set(keys) if key not in found] if disk else []
+            for start in range(0, len(missing), 500):
+                batch = missing[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self._touched.add(key)
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._conn.commit()
+        return found
+
+    def _results(self, keys: list[str], found: dict[str, list[float]]) -> list[list[float] | None]:
+        results = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in results)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(results) - hits
+        EMBEDDING_CACHE.labels("hit").inc(hits)
+        EMBEDDING_CACHE.labels("miss").inc(len(results) - hits)
+        return results
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self) -> None:
+        self._conn.executemany(
+            "UPDATE embeddings SET accessed = julianday('now') WHERE model = ? AND key = ?",
+            [(self.model, key) for key in self._touched],
+        )
+        self._touched.clear()
+
+    def _count_disk(self) -> int:
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model,)
+        ).fetchone()
+        return count
+
+    # Drop least-recently-used rows down to 90% of the bound, so the next prune (and its
+    # COUNT) is a tenth of max_disk inserts away
+    def _prune_disk(self) -> None:
+        self._flush_touched()
+        count = self._count_disk()
+        target = self.max_disk * 9 // 10
+        if count > self.max_disk:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                " SELECT rowid FROM embeddings WHERE model = ? ORDER BY accessed LIMIT ?)",
+                (self.model, count - target),
+            )
+            count = target
+        self._disk_rows = count
+
+
+# Embeddings wrapper that only sends cache misses to the underlying model
+# Cache misses are single-flight: concurrent requests for the same query text (or the same
+# batch of chunk texts) wait for the one API call already in flight
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self, underlying: Embeddings, cache: EmbeddingCache, single_flight: bool = True
+    ) -> None:
+        self.underlying = underlying
+        self.cache = cache
+        self._flights = SingleFlight("embedding") if single_flight else None
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        cached = self.cache.get_many(texts)
+        misses = _unique_misses(texts, cached)
+        fresh: dict[str, list[float]] = {}
+        if misses:
+            fresh = dict(zip(misses, self._once(_batch_key(misses), lambda: self._fill(misses))))
+        return _merge(texts, cached, fresh)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        cached = await self.cache.aget_many(texts)
+        misses = _unique_misses(texts, cached)
+        fresh: dict[str, list[float]] = {}
+        if misses:
+            fresh = dict(
+                zip(misses, await self._aonce(_batch_key(misses), lambda: self._afill(misses)))
+            )
+        return _merge(texts, cached, fresh)
+
+    def embed_query(self, text: str) -> list[float]:
+        (cached,) = self.cache.get_many([text])
+        if cached is not None:
+            return cached
+        return self._once(f"query:{_text_key(text)}", lambda: self._fill_query(text))[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        (cached,) = await self.cache.aget_many([text])
+        if cached is not None:
+            return cached
+        return (await self._aonce(f"query:{_text_key(text)}", lambda: self._afill_query(text)))[0]
+
+    def _once(self, key: str, embed: Callable[[], list[list[float]]]) -> list[list[float]]:
+        return self._flights.do(key, embed) if self._flights else embed()
+
+    async def _aonce(
+        self, key: str, embed: Callable[[], Awaitable[list[list[float]]]]
+    ) -> list[list[float]]:
+        return await (self._flights.ado(key, embed) if self._flights else embed())
+
+    def _fill(self, texts: list[str]) -> list[list[float]]:
+        vectors = self.underlying.embed_documents(texts)
+        self.cache.put_many(texts, vectors)
+        return vectors
+
+    async def _afill(self, texts: list[str]) -> list[list[float]]:
+        vectors = await self.underlying.aembed_documents(texts)
+        await self.cache.aput_many(texts, vectors)
+        return vectors
+
+    # Queries go through embed_query: providers may embed queries differently from documents
+    def _fill_query(self, text: str) -> list[list[float]]:
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many([text], [vector])
+        return [vector]
+
+    async def _afill_query(self, text: str) -> list[list[float]]:
+        vector = await self.underlying.aembed_query(text)
+        await self.cache.aput_many([text], [vector])
+        return [vector]
+
+
+def _batch_key(texts: list[str]) -> str:
+    return f"documents:{_text_key(chr(0).join(texts))}"
+
+
+def _unique_misses(texts: list[str], cached: list[list[float] | None]) -> list[str]:
+    return list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+
+
+def _merge(
+    texts: list[str], cached: list[list[float] | None], fresh: dict[str, list[float]]
+) -> list[list[float]]:
+    if fresh:
+        log.debug("embedding_cache_fill", requested=len(texts), embedded=len(fresh))
+    return [vector if vector is not None else fresh[text] for text, vector in zip(texts, cached)]
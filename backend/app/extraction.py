@@ -0,0 +1,294 @@
+# PDF extraction: pull page text and tables out of catalog PDFs as LangChain Documents.
+# Kept free of index/LLM imports so spawned worker processes start quickly.
+
+import glob
+import json
+import multiprocessing
+import os
+import re
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.log import get_logger
+from app.tokens import count_tokens
+
+log = get_logger(__name__)
+
+
+# Convert a PyMuPDF table (list of rows) into a markdown table string
+def _table_to_markdown(table: list[list[str | None]]) -> str:
+    if not table or not table[0]:
+        return ""
+
+    rows: list[list[str]] = []
+    for row in table:
+        rows.append([cell.replace("\n", " ").strip() if cell else "" for cell in row])
+
+    header = "| " + " | ".join(rows[0]) + " |"
+    separator = "| " + " | ".join("---" for _ in rows[0]) + " |"
+    body_lines = []
+    for row_cells in rows[1:]:
+        body_lines.append("| " + " | ".join(row_cells) + " |")
+
+    return "\n".join([header, separator] + body_lines)
+
+
+# Catalog article numbers: six or more digits with an optional letter suffix ("4606051V")
+ARTICLE_NUMBER_RE = re.compile(r"\b\d{6,}[a-z]{0,2}\b", re.IGNORECASE)
+_ID_HEADER_RE = re.compile(r"art|ref|code|nr|no\b", re.IGNORECASE)
+
+
+def find_article_numbers(text: str) -> list[str]:
+    return list(dict.fromkeys(match.upper() for match in ARTICLE_NUMBER_RE.findall(text)))
+
+
+# Map article number -> 1-based body row. Columns whose header names an article/reference
+# number are searched for IDs; elsewhere a cell must consist of a single ID.
+def extract_article_numbers(table: list[list[str | None]]) -> dict[str, int]:
+    if len(table) < 2:
+        return {}
+
+    id_columns = {i for i, cell in enumerate(table[0]) if cell and _ID_HEADER_RE.search(cell)}
+    rows: dict[str, int] = {}
+    for row_num, row in enumerate(table[1:], start=1):
+        for col, cell in enumerate(row):
+            if not cell:
+                continue
+            if col in id_columns:
+                ids = find_article_numbers(cell)
+            elif ARTICLE_NUMBER_RE.fullmatch(cell.strip()):
+                ids = [cell.strip().upper()]
+            else:
+                continue
+            for article_number in ids:
+                rows.setdefault(article_number, row_num)
+    return rows
+
+
+# Pack pieces (layout blocks, or lines of an oversized block) into runs of at most
+# max_tokens; a single piece over the budget becomes a run of its own
+def _pack(pieces: list[str], max_tokens: int, sep: str = "\n") -> list[str]:
+    runs: list[str] = []
+    current: list[str] = []
+    used = 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and used + tokens > max_tokens:
+            runs.append(sep.join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += tokens
+    if current:
+        runs.append(sep.join(current))
+    return runs
+
+
+# Text blocks of the page in reading order, minus those lying mostly inside an extracted
+# table (find_tables already turned them into markdown)
+def _text_blocks(page: fitz.Page, table_rects: list[fitz.Rect]) -> list[str]:
+    blocks = []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] != 0:
+            continue
+        rect = fitz.Rect(block["bbox"])
+        if any((rect & table).get_area() > rect.get_area() / 2 for table in table_rects):
+            continue
+        text = "\n".join(
+            "".join(span["text"] for span in line["spans"]) for line in block["lines"]
+        ).strip()
+        if text:
+            blocks.append(text)
+    return blocks
+
+
+# Split page text into chunks of at most max_tokens along layout block boundaries; a
+# block that is over budget on its own is split between lines
+def _split_text(blocks: list[str], max_tokens: int) -> list[str]:
+    if max_tokens <= 0:
+        return ["\n".join(blocks)]
+    pieces: list[str] = []
+    for block in blocks:
+        if count_tokens(block) > max_tokens:
+            pieces.extend(_pack(block.split("\n"), max_tokens))
+        else:
+            pieces.append(block)
+    return _pack(pieces, max_tokens)
+
+
+# Split a table into row groups whose markdown (header and separator repeated in every
+# group, so each chunk keeps its column names) stays within max_tokens
+def _split_table(
+    table: list[list[str | None]], max_tokens: int
+) -> list[tuple[str, dict[str, int]]]:
+    lines = _table_to_markdown(table).split("\n")
+    header = lines[:2]
+    # A header that alone fills the budget leaves none for rows: one row per group then
+    budget = max_tokens - count_tokens("\n".join(header))
+
+    groups: list[tuple[int, int]] = []
+    start, used = 0, 0
+    for row, line in enumerate(lines[2:]):
+        tokens = count_tokens(line)
+        if max_tokens > 0 and row > start and used + tokens > budget:
+            groups.append((start, row))
+            start, used = row, 0
+        used += tokens
+    groups.append((start, len(lines) - 2))
+
+    # Article-number rows are numbered within each group's own markdown
+    return [
+        (
+            "\n".join(header + lines[2 + start : 2 + stop]),
+            extract_article_numbers([table[0], *table[1 + start : 1 + stop]]),
+        )
+        for start, stop in groups
+    ]
+
+
+# Extract a page's text and its tables as LangChain Documents, split under the chunk token
+# budget. Every chunk keeps its parent `page` for citations; `part` numbers the pieces of
+# the page text or of one table.
+def _extract_page(page: fitz.Page, page_num: int, source: str) -> list[Document]:
+    chunks: list[Document] = []
+
+    tables = page.find_tables()
+    table_chunks = []
+    table_rects = []
+
+    for table in tables.tables:
+        data = table.extract()
+        # Skip tiny/empty tables (likely PDF artifacts)
+        if len(data) < 2 or len(data[0]) < 2:
+            continue
+
+        md = _table_to_markdown(data)
+        if not md.strip():
+            continue
+
+        table_chunks.append(_split_table(data, settings.chunk_max_tokens))
+        table_rects.append(fitz.Rect(table.bbox))
+
+    blocks = _text_blocks(page, table_rects)
+
+    # Only create text chunks if the page has meaningful content
+    if len("\n".join(blocks)) > 50:
+        for part, text in enumerate(_split_text(blocks, settings.chunk_max_tokens), start=1):
+            chunks.append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        "page": page_num,
+                        "part": part,
+                        "content_type": "text",
+                        "source": source,
+                    },
+                )
+            )
+
+    for groups in table_chunks:
+        for part, (md, article_numbers) in enumerate(groups, start=1):
+            metadata: dict[str, str | int] = {
+                "page": page_num,
+                "part": part,
+                "content_type": "table",
+                "source": source,
+            }
+            # Chroma metadata values must be scalars, so the ID -> row map is stored as JSON
+            if article_numbers:
+                metadata["article_numbers"] = json.dumps(article_numbers)
+            chunks.append(Document(page_content=md, metadata=metadata))
+
+    return chunks
+
+
+# Worker entry point: each process opens its own fitz document for its page range
+def _extract_page_range(pdf_path: str, start: int, stop: int, source: str) -> list[Document]:
+    chunks: list[Document] = []
+    with fitz.open(pdf_path) as doc:
+        for page_idx in range(start, stop):
+            chunks.extend(_extract_page(doc[page_idx], page_idx + 1, source))
+    return chunks
+
+
+def _is_glob(pdf_path: str) -> bool:
+    return any(char in pdf_path for char in "*?[")
+
+
+# Accept a single file, a directory of PDFs, or a glob pattern
+def resolve_pdf_paths(pdf_path: str) -> list[Path]:
+    path = Path(pdf_path)
+    if path.is_dir():
+        return sorted(path.glob("*.pdf"))
+    if _is_glob(pdf_path):
+        return sorted(Path(match) for match in glob.glob(pdf_path, recursive=True))
+    return [path]
+
+
+# Chunk sources (and so chunk IDs) are paths relative to this directory: the directory
+# itself, a glob's leading literal directories, or a single file's parent. Files of the
+# same name in different directories of a recursive glob stay distinct.
+def ingest_root(pdf_path: str) -> Path:
+    path = Path(pdf_path)
+    if path.is_dir():
+        return path
+    if _is_glob(pdf_path):
+        literal = []
+        for part in path.parts:
+            if _is_glob(part):
+                break
+            literal.append(part)
+        return Path(*literal) if literal else Path()
+    return path.parent
+
+
+def _ingest_workers() -> int:
+    return settings.ingest_workers or os.cpu_count() or 1
+
+
+# Split every PDF into page ranges and extract them on a process pool (find_tables is
+# CPU-bound). pool.map keeps submission order, so chunks come back in page order.
+# `on_pages(done, total)` is called as page ranges finish.
+def extract_chunks_from_pdf(
+    pdf_path: str, on_pages: Callable[[int, int], None] | None = None
+) -> list[Document]:
+    root = ingest_root(pdf_path)
+    tasks: list[tuple[str, int, int, str]] = []
+    for path in resolve_pdf_paths(pdf_path):
+        source = path.relative_to(root).as_posix()
+        with fitz.open(path) as doc:
+            num_pages = len(doc)
+        for start in range(0, num_pages, settings.ingest_pages_per_task):
+            stop = min(start + settings.ingest_pages_per_task, num_pages)
+            tasks.append((str(path), start, stop, source))
+
+    total_pages = sum(stop - start for _, start, stop, _ in tasks)
+    done_pages = 0
+
+    def collect(results: Iterable[list[Document]]) -> list[list[Document]]:
+        nonlocal done_pages
+        collected = []
+        for (_, start, stop, _), result in zip(tasks, results):
+            collected.append(result)
+            done_pages += stop - start
+            if on_pages is not None:
+                on_pages(done_pages, total_pages)
+        return collected
+
+    workers = min(_ingest_workers(), len(tasks))
+    if workers <= 1:
+        results = collect(_extract_page_range(*task) for task in tasks)
+    else:
+        # spawn rather than fork: the server process holds threads and an event loop
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            results = collect(pool.map(_extract_page_range, *zip(*tasks)))
+
+    chunks = [chunk for result in results for chunk in result]
+    log.info("pdf_extracted", num_chunks=len(chunks), pdf_path=pdf_path, workers=max(workers, 1))
+    return chunks
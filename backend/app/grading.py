@@ -0,0 +1,70 @@
+# Local relevance prefilter for the batch grader: cheap signals settle the clear cases so
+# only the uncertain middle of the retrieved chunks is sent to the LLM.
+
+import re
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+
+from app.bm25 import tokenize
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+_STOPWORDS = frozenset(
+    "the and for with you have are what which does show any all can der die das und mit "
+    "für ein eine ist sind gibt".split()
+)
+
+
+@dataclass
+class PrefilterResult:
+    accepted: list[Document] = field(default_factory=list)
+    rejected: list[Document] = field(default_factory=list)
+    uncertain: list[Document] = field(default_factory=list)
+
+
+def _query_terms(query: str) -> tuple[set[str], set[str]]:
+    terms = {t for t in tokenize(query) if t not in _STOPWORDS and (len(t) > 2 or t.isdigit())}
+    # Identifiers and measurements ("4606051v", "0,45") must match exactly to count
+    identifiers = {t for t in terms if re.search(r"\d", t) and len(t) > 2}
+    return terms, identifiers
+
+
+# Accept when every identifier in the query occurs in the chunk, or when the chunk is
+# both semantically close and shares most query terms; reject when it is neither close
+# nor matched lexically. Closeness is the query/chunk cosine the vector leg recorded as
+# vector_score, so nothing is embedded here. A chunk only the BM25 leg found has no
+# vector_score and is never accepted or rejected on closeness.
+class GradePrefilter:
+    def __init__(
+        self,
+        accept_similarity: float,
+        reject_similarity: float,
+        accept_overlap: float = 0.5,
+    ) -> None:
+        self.accept_similarity = accept_similarity
+        self.reject_similarity = reject_similarity
+        self.accept_overlap = accept_overlap
+
+    def split(self, query: str, documents: list[Document]) -> PrefilterResult:
+        terms, identifiers = _query_terms(query)
+
+        result = PrefilterResult()
+        for doc in documents:
+            doc_terms = set(tokenize(doc.page_content))
+            overlap = len(terms & doc_terms) / len(terms) if terms else 0.0
+            similarity = doc.metadata.get("vector_score")
+            lexical = bool(terms & doc_terms) or doc.metadata.get("bm25_score", 0.0) > 0
+
+            if identifiers and identifiers <= doc_terms:
+                result.accepted.append(doc)
+            elif similarity is None:
+                result.uncertain.append(doc)
+            elif similarity >= self.accept_similarity and overlap >= self.accept_overlap:
+                result.accepted.append(doc)
+            elif similarity < self.reject_similarity and not lexical:
+                result.rejected.append(doc)
+            else:
+                result.uncertain.append(doc)
+        return result
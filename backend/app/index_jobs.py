@@ -0,0 +1,101 @@
+# Background index jobs: full rebuilds (the startup auto-index and the admin API) run one
+# at a time on a worker thread while the live index keeps serving chats.
+
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from app.ingestion import IndexProgress, IndexStats, rebuild_index
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+
+@dataclass
+class IndexJob:
+    id: str
+    pdf_path: str
+    progress: IndexProgress = field(default_factory=IndexProgress)
+    stats: IndexStats | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    # Deleted once the job finishes (the directory of an uploaded PDF)
+    cleanup: Path | None = None
+    # Overrides IndexJobs' run for this job
+    run: Callable[[str, IndexProgress], IndexStats] | None = field(default=None, repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "pdf_path": self.pdf_path,
+            **asdict(self.progress),
+            "stats": asdict(self.stats) if self.stats else None,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IndexJobs:
+    def __init__(
+        self, run: Callable[[str, IndexProgress], IndexStats], max_jobs: int = 100
+    ) -> None:
+        self.max_jobs = max_jobs
+        self._run = run
+        self._jobs: OrderedDict[str, IndexJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-job")
+
+    def submit(
+        self,
+        pdf_path: str,
+        cleanup: Path | None = None,
+        run: Callable[[str, IndexProgress], IndexStats] | None = None,
+    ) -> IndexJob:
+        job = IndexJob(id=uuid.uuid4().hex, pdf_path=pdf_path, cleanup=cleanup, run=run)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs beyond max_jobs
+            finished = [j.id for j in self._jobs.values() if j.finished_at is not None]
+            for job_id in finished[: max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[job_id]
+        self._executor.submit(self._execute, job)
+        log.info("index_job_queued", job_id=job.id, pdf_path=pdf_path)
+        return job
+
+    def get(self, job_id: str) -> IndexJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self) -> IndexJob | None:
+        with self._lock:
+            return next(reversed(self._jobs.values()), None)
+
+    def _execute(self, job: IndexJob) -> None:
+        start = time.time()
+        try:
+            job.stats = (job.run or self._run)(job.pdf_path, job.progress)
+        except Exception as exc:
+            job.progress.state, job.progress.error = "failed", str(exc)
+            log.exception("index_job_failed", job_id=job.id)
+        else:
+            log.info(
+                "index_job_complete",
+                job_id=job.id,
+                version=job.progress.version,
+                num_chunks=job.stats.total,
+                duration_s=round(time.time() - start, 2),
+            )
+        finally:
+            if job.cleanup is not None:
+                shutil.rmtree(job.cleanup, ignore_errors=True)
+            job.finished_at = time.time()
+
+
+index_jobs = IndexJobs(run=rebuild_index)
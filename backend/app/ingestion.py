@@ -1,204 +1,1135 @@
-# PDF ingestion: extract text and tables, chunk, and index into ChromaDB.
+# PDF ingestion: chunk extracted PDF content and index it into the vector store (ChromaDB,
+# or the in-process matrix index with vector_backend=matrix).
 
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import random
 import shutil
+import threading
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 
-import fitz
+import openai
 from langchain_chroma import Chroma
-from langchain_community.retrievers import BM25Retriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
 from pydantic import SecretStr
 
+from app.article_index import ArticleRetriever, is_id_only, load_article_index, save_article_index
+from app.bm25 import PersistedBM25Retriever, load_bm25_index, save_bm25_index
 from app.config import settings
+from app.embeddings import CachedEmbeddings, EmbeddingCache
+from app.extraction import extract_chunks_from_pdf
 from app.log import get_logger
+from app.matrix_store import MatrixVectorStore
+from app.metrics import RETRIEVAL_LEG_SECONDS, TimedEmbeddings
+from app.resources import get_resources
+from app.routing import load_brand_lexicon, save_brand_lexicon
+from app.table_store import TableStore, load_table_store, save_table_store
+from app.tokens import count_tokens
 
 log = get_logger(__name__)
 
-_retriever: BaseRetriever | None = None
+IndexVectorStore = Chroma | MatrixVectorStore
 
+_embeddings: Embeddings | None = None
+# Bumped whenever the collection is rebuilt; caches derived from the index compare against it
+_index_version = 0
 
-# Convert a PyMuPDF table (list of rows) into a markdown table string
-def _table_to_markdown(table: list[list[str | None]]) -> str:
-    if not table or not table[0]:
-        return ""
 
-    rows: list[list[str]] = []
-    for row in table:
-        rows.append([cell.replace("\n", " ").strip() if cell else "" for cell in row])
+def embedding_cache_path() -> Path:
+    return Path(settings.chroma_dir).parent / "embedding_cache.sqlite3"
 
-    header = "| " + " | ".join(rows[0]) + " |"
-    separator = "| " + " | ".join("---" for _ in rows[0]) + " |"
-    body_lines = []
-    for row_cells in rows[1:]:
-        body_lines.append("| " + " | ".join(row_cells) + " |")
 
-    return "\n".join([header, separator] + body_lines)
+# max_retries defaults to the openai SDK default
+def _api_embeddings(max_retries: int = 2) -> Embeddings:
+    resources = get_resources()
+    embeddings = OpenAIEmbeddings(
+        model=settings.embedding_model,
+        api_key=SecretStr(settings.openrouter_api_key) if settings.openrouter_api_key else None,
+        base_url=settings.openrouter_base_url,
+        http_client=resources.http_client,
+        http_async_client=resources.async_http_client,
+        check_embedding_ctx_length=settings.embedding_check_ctx_length,
+        max_retries=max_retries,
+    )
+    # Timed beneath the cache, so only real API round-trips are observed
+    return TimedEmbeddings(embeddings)
 
 
-# Walk each page, extract full text and tables as separate LangChain Documents
-def extract_chunks_from_pdf(pdf_path: str) -> list[Document]:
-    doc = fitz.open(pdf_path)
-    chunks: list[Document] = []
+# Shared across vector stores so repeated queries and re-indexing hit the same cache
+def get_embeddings() -> Embeddings:
+    global _embeddings
+    if _embeddings is None:
+        embeddings = _api_embeddings()
+        if settings.embedding_cache_enabled:
+            cache = EmbeddingCache(
+                embedding_cache_path(),
+                model=settings.embedding_model,
+                max_memory=settings.embedding_cache_memory_size,
+                max_disk=settings.embedding_cache_disk_size,
+            )
+            _embeddings = CachedEmbeddings(
+                embeddings, cache, single_flight=settings.single_flight_enabled
+            )
+        else:
+            _embeddings = embeddings
+    return _embeddings
 
-    for page_idx in range(len(doc)):
-        page = doc[page_idx]
-        page_num = page_idx + 1
 
-        tables = page.find_tables()
-        table_chunks = []
+# The embedding stage retries in _embed_with_retry behind a shared backoff gate, so its
+# client has the SDK's own retries off; it shares the cache with the query-time client.
+# Rebuilt whenever get_embeddings() returns a different object.
+_index_embeddings: tuple[Embeddings, Embeddings] | None = None
 
-        for table in tables.tables:
-            data = table.extract()
-            # Skip tiny/empty tables (likely PDF artifacts)
-            if len(data) < 2 or len(data[0]) < 2:
-                continue
 
-            md = _table_to_markdown(data)
-            if not md.strip():
-                continue
+def get_index_embeddings() -> Embeddings:
+    global _index_embeddings
+    shared = get_embeddings()
+    if _index_embeddings is None or _index_embeddings[0] is not shared:
+        if isinstance(shared, CachedEmbeddings):
+            embeddings: Embeddings = CachedEmbeddings(
+                _api_embeddings(max_retries=0), shared.cache, single_flight=False
+            )
+        elif isinstance(shared, TimedEmbeddings):
+            embeddings = _api_embeddings(max_retries=0)
+        else:  # a stand-in set by tests or scripts
+            embeddings = shared
+        _index_embeddings = (shared, embeddings)
+    return _index_embeddings[1]
 
-            table_chunks.append(md)
 
-        page_text = page.get_text().strip()
+# Rebuilds the embedding client on the current pooled HTTP clients (see agent.bind_llm).
+# Loaded vector stores hold the cached wrapper, so only the client beneath it is replaced.
+def bind_embeddings() -> None:
+    global _embeddings, _index_embeddings
+    if isinstance(_embeddings, CachedEmbeddings):
+        _embeddings.underlying = _api_embeddings()
+    else:
+        _embeddings = None
+    _index_embeddings = None
 
-        # Only create a text chunk if the page has meaningful content
-        if page_text and len(page_text) > 50:
-            chunks.append(
-                Document(
-                    page_content=page_text,
-                    metadata={
-                        "page": page_num,
-                        "content_type": "text",
-                        "source": Path(pdf_path).name,
-                    },
-                )
-            )
 
-        for md in table_chunks:
-            chunks.append(
-                Document(
-                    page_content=md,
-                    metadata={
-                        "page": page_num,
-                        "content_type": "table",
-                        "source": Path(pdf_path).name,
-                    },
-                )
-            )
+@dataclass
+class IndexStats:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
 
-    doc.close()
-    log.info("pdf_extracted", num_chunks=len(chunks), pdf_path=pdf_path)
-    return chunks
+    @property
+    def total(self) -> int:
+        return self.added + self.updated + self.unchanged
 
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+# Live progress of an index build, served by /ready and the admin job endpoints
+@dataclass
+class IndexProgress:
+    state: str = "queued"  # queued | indexing | complete | failed
+    version: int | None = None
+    pages_total: int = 0
+    pages_done: int = 0
+    chunks: int = 0
+    batches_total: int = 0
+    batches_done: int = 0
+    error: str | None = None
 
-def get_embeddings() -> OpenAIEmbeddings:
-    return OpenAIEmbeddings(
-        model=settings.embedding_model,
-        api_key=SecretStr(settings.openrouter_api_key) if settings.openrouter_api_key else None,
-        base_url=settings.openrouter_base_url,
-    )
 
+# Stable ID per chunk slot (source, page, content type, position on the page) plus a
+# content hash, so re-indexing can tell new, changed, and untouched chunks apart.
+def assign_chunk_ids(chunks: list[Document]) -> list[str]:
+    ordinals: Counter[tuple[str, int, str]] = Counter()
+    ids = []
+    for chunk in chunks:
+        slot = (
+            chunk.metadata.get("source", ""),
+            chunk.metadata.get("page", 0),
+            chunk.metadata.get("content_type", "text"),
+        )
+        chunk_id = f"{slot[0]}:p{slot[1]}:{slot[2]}:{ordinals[slot]}"
+        ordinals[slot] += 1
 
-# Wipe existing index, re-extract chunks from PDF, embed, and store in ChromaDB
-def index_pdf(pdf_path: str | None = None) -> int:
+        chunk.metadata["chunk_id"] = chunk_id
+        chunk.metadata["content_hash"] = hashlib.sha256(chunk.page_content.encode()).hexdigest()
+        ids.append(chunk_id)
+    return ids
+
+
+# Re-extract chunks from the PDF(s) and sync the vector store to them: upsert new or changed
+# chunks, delete stale ones, and leave unchanged chunks (and their embeddings) alone.
+# With `version`, the chunks are written to that (not yet live) index version and the
+# live retriever is left alone (see rebuild_index); otherwise the live version is synced
+# in place and reloaded.
+def index_pdf(
+    pdf_path: str | None = None,
+    version: int | None = None,
+    progress: IndexProgress | None = None,
+) -> IndexStats:
     pdf_path = pdf_path or settings.pdf_path
-    log.info("indexing_started", pdf_path=pdf_path)
+    progress = progress or IndexProgress()
+    in_place = version is None
+    if version is None:
+        version = live_version_on_disk() or 0
+    root = index_dir(version)
+    log.info("indexing_started", pdf_path=pdf_path, version=version)
+
+    def on_pages(done: int, total: int) -> None:
+        progress.pages_done, progress.pages_total = done, total
+
+    chunks = extract_chunks_from_pdf(pdf_path, on_pages=on_pages)
+    progress.chunks = len(chunks)
+    ids = assign_chunk_ids(chunks)
+
+    # A new version starts out empty, so it is diffed against the live version instead,
+    # whose vectors unchanged chunks reuse
+    vectorstore = _vectorstore(version)
+    base_version = version if in_place else live_version_on_disk()
+    base = (
+        vectorstore
+        if base_version is None or base_version == version
+        else _vectorstore(base_version)
+    )
+    existing = base.get(include=["metadatas"])
+    existing_hashes = {
+        chunk_id: (meta or {}).get("content_hash")
+        for chunk_id, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+    stats = IndexStats()
+    to_upsert: list[Document] = []
+    to_copy: list[Document] = []
+    for chunk_id, chunk in zip(ids, chunks):
+        if chunk_id not in existing_hashes:
+            stats.added += 1
+        elif existing_hashes[chunk_id] != chunk.metadata["content_hash"]:
+            stats.updated += 1
+        else:
+            stats.unchanged += 1
+            if base is not vectorstore:
+                to_copy.append(chunk)
+            continue
+        to_upsert.append(chunk)
+
+    stale_ids = sorted(existing_hashes.keys() - set(ids))
+    stats.removed = len(stale_ids)
+
+    if to_copy:
+        assert base_version is not None
+        if _embedded_with(index_dir(base_version)) == settings.embedding_model:
+            _copy_vectors(base, vectorstore, to_copy)
+        else:
+            to_upsert += to_copy
+    if base is not vectorstore and isinstance(base, MatrixVectorStore):
+        base.close()
+    if to_upsert:
+        embed_and_upsert(vectorstore, to_upsert, progress)
+    if stale_ids and base is vectorstore:
+        vectorstore.delete(ids=stale_ids)
+    if isinstance(vectorstore, MatrixVectorStore):
+        vectorstore.save()
+    if stats.changed or to_copy or not bm25_index_dir(root).exists():
+        _save_derived_indexes(vectorstore, root)
+    # Synced in place, vectors of an earlier model may remain, so the record only survives
+    # if it already named this model
+    if not in_place:
+        _embedding_model_path(root).write_text(settings.embedding_model)
+    elif _embedded_with(root) != settings.embedding_model:
+        _embedding_model_path(root).unlink(missing_ok=True)
+
+    log.info(
+        "indexing_complete",
+        added=stats.added,
+        updated=stats.updated,
+        removed=stats.removed,
+        unchanged=stats.unchanged,
+        **_embedding_cache_stats(),
+    )
+    if in_place:
+        _write_current_version(version)
+        init_retriever()
+        if stats.changed:
+            _bump_index_version()
+    return stats
+
+
+# Records which embedding model a version's vectors came from; a rebuild copies vectors
+# only from a live version embedded with the configured model
+def _embedding_model_path(root: Path) -> Path:
+    return root / "embedding_model"
+
+
+def _embedded_with(root: Path) -> str | None:
+    path = _embedding_model_path(root)
+    return path.read_text() if path.exists() else None
+
+
+def _stored_vectors(vectorstore: IndexVectorStore, ids: list[str]) -> list[list[float]]:
+    if isinstance(vectorstore, MatrixVectorStore):
+        return vectorstore.get_vectors(ids)
+    data = vectorstore._collection.get(ids=ids, include=["embeddings"])
+    vectors = dict(zip(data["ids"], data["embeddings"]))  # type: ignore[arg-type]
+    return [list(vectors[chunk_id]) for chunk_id in ids]
+
+
+# Copies unchanged chunks' vectors from the live version into a version being built
+def _copy_vectors(
+    source: IndexVectorStore, target: IndexVectorStore, chunks: list[Document]
+) -> None:
+    size = settings.embedding_batch_size
+    for start in range(0, len(chunks), size):
+        batch = chunks[start : start + size]
+        ids = [doc.metadata["chunk_id"] for doc in batch]
+        _upsert(target, batch, _stored_vectors(source, ids))
+    log.info("index_vectors_copied", count=len(chunks))
+
+
+# The answer cache and the router's brand lexicon compare this counter to notice that the
+# live index changed. It is bumped when a different version goes live (here, or in another
+# worker and picked up by _refresh_index) and when an in-place re-index changed chunks; the
+# live handle records the value it was activated with.
+def _bump_index_version() -> None:
+    global _index_version
+    with _index_lock:
+        _index_version += 1
+        if _index is not None:
+            _index.generation = _index_version
+
+
+# Index versions: a full rebuild writes a new Chroma collection plus its derived index
+# files under chroma_dir/versions/v<N>, then points chroma_dir/CURRENT at it. Version 0
+# is the layout from before versioning (default collection, files at the top level).
+def index_dir(version: int) -> Path:
+    root = Path(settings.chroma_dir)
+    return root if version == 0 else root / "versions" / f"v{version}"
+
+
+def collection_name(version: int) -> str:
+    return "langchain" if version == 0 else f"catalog_v{version}"
+
+
+def current_version_path() -> Path:
+    return Path(settings.chroma_dir) / "CURRENT"
+
+
+# The version CURRENT points at, or 0 for an unversioned index; None when nothing is built
+def live_version_on_disk() -> int | None:
+    path = current_version_path()
+    if path.exists():
+        return int(path.read_text())
+    if bm25_index_dir(index_dir(0)).exists():
+        return 0
+    return None
+
+
+# Written to a temp file and renamed, so CURRENT always names a complete version
+def _write_current_version(version: int) -> None:
+    path = current_version_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(path.name + ".tmp")
+    staging.write_text(str(version))
+    os.replace(staging, path)
+
+
+# Chroma is only opened where it holds data, so the matrix backend never creates its files
+def _has_chroma_data() -> bool:
+    return (Path(settings.chroma_dir) / "chroma.sqlite3").exists()
+
+
+def _versions_on_disk() -> set[int]:
+    versions: set[int] = set()
+    if _has_chroma_data():
+        versions = {
+            int(name.removeprefix("catalog_v"))
+            for name in get_resources().chroma_client.list_collections()
+            if str(name).startswith("catalog_v")
+        }
+    versions_dir = Path(settings.chroma_dir) / "versions"
+    if versions_dir.exists():
+        versions |= {int(path.name[1:]) for path in versions_dir.glob("v*")}
+    return versions
+
+
+def _drop_version(version: int) -> None:
+    if _has_chroma_data():
+        try:
+            get_resources().chroma_client.delete_collection(collection_name(version))
+        except Exception:  # already gone
+            pass
+    root = index_dir(version)
+    if version:
+        shutil.rmtree(root, ignore_errors=True)
+    else:
+        shutil.rmtree(bm25_index_dir(root), ignore_errors=True)
+        shutil.rmtree(vector_index_dir(root), ignore_errors=True)
+        for path in (
+            article_index_path(root),
+            table_store_path(root),
+            root / "brand_lexicon.json",
+            _embedding_model_path(root),
+        ):
+            path.unlink(missing_ok=True)
+    log.info("index_version_dropped", version=version)
+
+
+# One loaded index version. Chats pin the handle they start on and release it when done;
+# a handle replaced by a newer version is retired, and its files are dropped once its
+# last reader lets go, so in-flight chats finish on the version they started with.
+@dataclass(eq=False)
+class IndexHandle:
+    version: int
+    retriever: BaseRetriever
+    table_store: TableStore | None
+    refs: int = 0
+    retired: bool = False
+    # get_index_version() while this handle was live
+    generation: int = 0
+
+    # Closes the chunk files, their maps and the table store's connection
+    def close(self) -> None:
+        vector_retriever = self.retriever
+        if isinstance(self.retriever, HybridRetriever):
+            vector_retriever = self.retriever.vector_retriever
+            if isinstance(self.retriever.bm25_retriever, PersistedBM25Retriever):
+                self.retriever.bm25_retriever.chunks.close()
+        if isinstance(vector_retriever, ScoredVectorRetriever) and isinstance(
+            vector_retriever.vectorstore, MatrixVectorStore
+        ):
+            vector_retriever.vectorstore.close()
+        if self.table_store is not None:
+            self.table_store.close()
+
+
+_index: IndexHandle | None = None
+# Retired handles still pinned by a request
+_retired: list[IndexHandle] = []
+# Versions being built or loaded by this process
+_claims: Counter[int] = Counter()
+_index_lock = threading.Lock()
+# Serializes full rebuilds; the live index keeps serving while one runs
+_build_lock = threading.Lock()
+# Serializes loading and swapping in a version
+_swap_lock = threading.Lock()
+# mtime of CURRENT when this process last checked it
+_current_mtime: int | None = None
+
+
+# Several workers share chroma_dir, each with its own handles. Every process leases the
+# versions it uses (live, retired but pinned, being built or loaded) in leases/<pid>, and
+# a version is only dropped while no running process leases it.
+def _leases_dir() -> Path:
+    return Path(settings.chroma_dir) / "leases"
+
+
+def _own_versions() -> set[int]:
+    versions = {handle.version for handle in _retired} | set(+_claims)
+    if _index is not None:
+        versions.add(_index.version)
+    return versions
+
+
+# Called with _index_lock held, after every change to _own_versions()
+def _write_lease() -> None:
+    path = _leases_dir() / str(os.getpid())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(path.name + ".tmp")
+    staging.write_text(json.dumps(sorted(_own_versions())))
+    os.replace(staging, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Versions leased by other running processes; leases of processes that died are removed
+def _leased_elsewhere() -> set[int]:
+    versions: set[int] = set()
+    if not _leases_dir().exists():
+        return versions
+    for path in _leases_dir().iterdir():
+        if not path.name.isdigit() or int(path.name) == os.getpid():
+            continue
+        if not _pid_alive(int(path.name)):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            versions.update(json.loads(path.read_text()))
+        except (OSError, ValueError):  # replaced or removed while reading
+            continue
+    return versions
+
+
+def _claim(version: int) -> None:
+    with _index_lock:
+        _claims[version] += 1
+        _write_lease()
+
+
+def _unclaim(version: int) -> None:
+    with _index_lock:
+        _claims[version] -= 1
+        _write_lease()
+
+
+# Drops a version nobody uses any more: not live, and not leased here or by another worker
+def _collect(version: int) -> None:
+    with _index_lock:
+        if version == live_version_on_disk() or version in _own_versions():
+            return
+    if version in _leased_elsewhere():
+        log.info("index_version_kept", version=version, reason="leased by another process")
+        return
+    _drop_version(version)
+
+
+def is_index_live() -> bool:
+    _check_current()
+    return _index is not None
+
+
+def _activate(handle: IndexHandle) -> None:
+    global _index, _index_version
+    with _index_lock:
+        old, _index = _index, handle
+        if old is None or old.version != handle.version:
+            _index_version += 1
+        handle.generation = _index_version
+        # The replaced handle (of an older version, or of this one before an in-place
+        # re-index) is released once no request pins it
+        release = old is not None and old.refs == 0
+        if old is not None:
+            old.retired = True
+            if old.refs:
+                _retired.append(old)
+        _write_lease()
+    if release:
+        assert old is not None
+        _release(old)
+    log.info("index_activated", version=handle.version)
+
+
+# Closes a retired handle nobody pins any more and drops its version if nothing uses it
+def _release(handle: IndexHandle) -> None:
+    handle.close()
+    _collect(handle.version)
+
+
+# Loads and activates the version CURRENT points at; called with _swap_lock held. The
+# version is leased before it is loaded and CURRENT re-read afterwards, so a worker that
+# swapped meanwhile cannot drop it from under the load.
+def _load_current() -> None:
+    global _current_mtime
+    while True:
+        path = current_version_path()
+        _current_mtime = path.stat().st_mtime_ns if path.exists() else None
+        version = live_version_on_disk() or 0
+        _claim(version)
+        if (live_version_on_disk() or 0) == version:
+            break
+        _unclaim(version)
+    try:
+        _activate(_load_index(version))
+    finally:
+        _unclaim(version)
+
+
+# Loading a version (opening Chroma, mapping BM25, perhaps rebuilding derived indexes) and
+# dropping one (rmtree, delete_collection) run on this thread, never on a request's thread
+# or the event loop; requests only pin what is already loaded
+_swap_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-swap")
+_refresh_pending = False
+
+
+# Another worker may have made a newer version live, or written the first CURRENT while
+# this one has no index yet. Checked by CURRENT's mtime on every pin and readiness check;
+# a change is loaded in the background while requests keep the version they have.
+def _check_current() -> None:
+    global _refresh_pending
+    try:
+        mtime = current_version_path().stat().st_mtime_ns
+    except FileNotFoundError:
+        return
+    with _index_lock:
+        if mtime == _current_mtime or _refresh_pending:
+            return
+        _refresh_pending = True
+    _swap_executor.submit(_refresh_index)
 
-    chroma_path = Path(settings.chroma_dir)
-    if chroma_path.exists():
-        shutil.rmtree(chroma_path)
 
-    chunks = extract_chunks_from_pdf(pdf_path)
+def _refresh_index() -> None:
+    global _current_mtime, _refresh_pending
+    try:
+        with _swap_lock:
+            path = current_version_path()
+            mtime = path.stat().st_mtime_ns if path.exists() else None
+            live = live_version_on_disk()
+            if live is not None and (_index is None or live > _index.version):
+                _load_current()
+            else:
+                _current_mtime = mtime
+    except Exception:
+        log.exception("index_refresh_failed")
+    finally:
+        with _index_lock:
+            _refresh_pending = False
 
-    Chroma.from_documents(
-        documents=chunks,
-        embedding=get_embeddings(),
-        persist_directory=settings.chroma_dir,
+
+# Pins the live index version (None before any index is loaded) for one request
+@contextmanager
+def pin_index() -> Iterator[IndexHandle | None]:
+    _check_current()
+    with _index_lock:
+        handle = _index
+        if handle is not None:
+            handle.refs += 1
+    try:
+        yield handle
+    finally:
+        if handle is not None:
+            with _index_lock:
+                handle.refs -= 1
+                release = handle.retired and handle.refs == 0
+                if release:
+                    _retired.remove(handle)
+                    _write_lease()
+            if release:
+                _swap_executor.submit(_release, handle)
+
+
+# Serializes rebuilds across the processes sharing chroma_dir
+@contextmanager
+def _build_file_lock() -> Iterator[None]:
+    path = Path(settings.chroma_dir) / "build.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+# Full rebuild that never exposes a half-written index: chunks are written to a fresh
+# version, which goes live only once complete. A crash mid-build leaves an orphan
+# version that drop_stale_versions() removes on the next start.
+def rebuild_index(
+    pdf_path: str | None = None,
+    progress: IndexProgress | None = None,
+    only_if_missing: bool = False,
+) -> IndexStats:
+    global _current_mtime
+    progress = progress or IndexProgress()
+    with _build_lock, _build_file_lock():
+        live = live_version_on_disk()
+        if only_if_missing and live is not None:
+            if _index is None or _index.version != live:
+                init_retriever()
+            progress.state, progress.version = "complete", live
+            log.info("index_build_skipped", version=live, reason="built by another worker")
+            return IndexStats()
+        version = max(_versions_on_disk() | {live or 0}) + 1
+        progress.state, progress.version, progress.error = "indexing", version, None
+        _claim(version)
+        try:
+            stats = index_pdf(pdf_path, version=version, progress=progress)
+            handle = _load_index(version)
+            with _swap_lock:
+                _write_current_version(version)
+                _current_mtime = current_version_path().stat().st_mtime_ns
+                _activate(handle)
+        except Exception as exc:
+            progress.state, progress.error = "failed", str(exc)
+            _drop_version(version)
+            raise
+        finally:
+            _unclaim(version)
+
+    progress.state = "complete"
+    return stats
+
+
+# Startup auto-index. Every worker of a fresh deploy finds no index and asks for one; the
+# first to take the build lock builds it and the others adopt its version.
+def ensure_index(pdf_path: str | None = None, progress: IndexProgress | None = None) -> IndexStats:
+    return rebuild_index(pdf_path, progress, only_if_missing=True)
+
+
+# Removes versions that no running process uses: leftovers of interrupted builds, and
+# retired versions a previous process did not get to drop. A version another worker is
+# building or still serving is leased, so it is kept.
+def drop_stale_versions() -> None:
+    live = live_version_on_disk()
+    if live is None:
+        return
+    with _index_lock:
+        in_use = _own_versions()
+    stale = _versions_on_disk() - {live} - in_use
+    if live != 0 and bm25_index_dir(index_dir(0)).exists() and 0 not in in_use:
+        stale.add(0)
+    stale -= _leased_elsewhere()
+    for version in sorted(stale):
+        _drop_version(version)
+
+
+# Group chunks into embedding requests bounded by item count and by total tokens,
+# so each request stays under the provider's per-request input limit.
+def _token_batches(chunks: list[Document]) -> Iterator[list[Document]]:
+    batch: list[Document] = []
+    batch_tokens = 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk.page_content)
+        if batch and (
+            len(batch) >= settings.embedding_batch_size
+            or batch_tokens + tokens > settings.embedding_batch_max_tokens
+        ):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+# Shared by the batches of one embedding stage. A rate-limit response pushes back the time
+# before which no batch may send, so every batch in flight pauses, not just the one that
+# was limited; released batches start with jitter so they do not all hit the API at once.
+class _BackoffGate:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+
+    def wait(self) -> None:
+        waited = False
+        while True:
+            with self._lock:
+                delay = self._not_before - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+            waited = True
+        if waited:
+            time.sleep(random.uniform(0, settings.embedding_retry_base_s))
+
+    def push_back(self, delay: float) -> None:
+        with self._lock:
+            self._not_before = max(self._not_before, time.monotonic() + delay)
+
+
+# Capped exponential backoff with jitter, or the provider's Retry-After when it asks longer
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    delay = min(settings.embedding_retry_base_s * 2**attempt, 60.0)
+    delay *= random.uniform(0.5, 1.5)
+    if isinstance(exc, openai.APIStatusError):
+        try:
+            delay = max(delay, float(exc.response.headers.get("retry-after", 0)))
+        except ValueError:  # an HTTP date rather than seconds
+            pass
+    return delay
+
+
+# Retry 429/5xx/connection failures. A 429 backs off every batch through the gate; other
+# failures only back off the batch that hit them.
+def _embed_with_retry(texts: list[str], gate: _BackoffGate | None = None) -> list[list[float]]:
+    embeddings = get_index_embeddings()
+    gate = gate or _BackoffGate()
+    for attempt in range(settings.embedding_max_retries + 1):
+        gate.wait()
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as exc:
+            if attempt == settings.embedding_max_retries or not _is_retryable(exc):
+                raise
+            delay = _retry_delay(exc, attempt)
+            rate_limited = isinstance(exc, openai.RateLimitError)
+            log.warning(
+                "embedding_batch_retry",
+                attempt=attempt + 1,
+                delay_s=round(delay, 2),
+                rate_limited=rate_limited,
+                error=str(exc),
+            )
+            if rate_limited:
+                gate.push_back(delay)
+            else:
+                time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+# Embedding stage: up to embedding_max_in_flight batches are embedded concurrently and
+# each finished batch is upserted (with its content hash) right away. An interrupted
+# run therefore resumes where it stopped: the next index_pdf sees those chunks as
+# unchanged, and their vectors are also in the persistent embedding cache. (The matrix
+# store persists on save(), so there a resumed run is served from that cache instead.)
+def embed_and_upsert(
+    vectorstore: IndexVectorStore, chunks: list[Document], progress: IndexProgress | None = None
+) -> None:
+    batches = list(_token_batches(chunks))
+    if progress is not None:
+        progress.batches_total = len(batches)
+    gate = _BackoffGate()
+    with ThreadPoolExecutor(
+        max_workers=settings.embedding_max_in_flight, thread_name_prefix="embed"
+    ) as pool:
+        futures = {
+            pool.submit(_embed_with_retry, [doc.page_content for doc in batch], gate): batch
+            for batch in batches
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            batch = futures[future]
+            _upsert(vectorstore, batch, future.result())
+            if progress is not None:
+                progress.batches_done = done
+            log.info("embedding_batch_upserted", batch=done, batches=len(batches), size=len(batch))
+
+
+def _upsert(
+    vectorstore: IndexVectorStore, batch: list[Document], vectors: list[list[float]]
+) -> None:
+    upsert = (
+        vectorstore.upsert_embeddings
+        if isinstance(vectorstore, MatrixVectorStore)
+        else vectorstore._collection.upsert
+    )
+    upsert(
+        ids=[doc.metadata["chunk_id"] for doc in batch],
+        embeddings=vectors,  # type: ignore[arg-type]
+        documents=[doc.page_content for doc in batch],
+        metadatas=[doc.metadata for doc in batch],
     )
 
-    log.info("indexing_complete", num_chunks=len(chunks))
-    init_retriever()
-    return len(chunks)
 
+def get_index_version() -> int:
+    return _index_version
 
-def get_vectorstore() -> Chroma:
+
+def _embedding_cache_stats() -> dict[str, int]:
+    embeddings = get_embeddings()
+    return embeddings.cache.stats() if isinstance(embeddings, CachedEmbeddings) else {}
+
+
+# A thin wrapper per call over the one shared Chroma client, or the version's matrix files
+def _vectorstore(version: int) -> IndexVectorStore:
+    if settings.vector_backend == "matrix":
+        return MatrixVectorStore(
+            vector_index_dir(index_dir(version)), get_embeddings(), dtype=settings.vector_dtype
+        )
     return Chroma(
-        persist_directory=settings.chroma_dir,
+        client=get_resources().chroma_client,
+        collection_name=collection_name(version),
         embedding_function=get_embeddings(),
     )
 
 
+# The live version's vector store
+def get_vectorstore() -> IndexVectorStore:
+    return _vectorstore(_index.version if _index else live_version_on_disk() or 0)
+
+
+# Runs the BM25 leg next to the vector leg; context-copying so log/trace context carries over
+_leg_executor = ContextThreadPoolExecutor(thread_name_prefix="hybrid-retrieval")
+
+
+def _timed(fn: Callable[[str], list[Document]], query: str) -> tuple[list[Document], float]:
+    start = time.perf_counter()
+    docs = fn(query)
+    return docs, (time.perf_counter() - start) * 1000
+
+
+async def _atimed(coro: Awaitable[list[Document]]) -> tuple[list[Document], float]:
+    start = time.perf_counter()
+    docs = await coro
+    return docs, (time.perf_counter() - start) * 1000
+
+
+def _observe_legs(bm25_ms: float, vector_ms: float) -> None:
+    RETRIEVAL_LEG_SECONDS.labels("bm25").observe(bm25_ms / 1000)
+    RETRIEVAL_LEG_SECONDS.labels("vector").observe(vector_ms / 1000)
+
+
+# Vector leg that keeps each chunk's cosine similarity to the query in metadata, where the
+# grader prefilter reads it instead of embedding the chunks again
+class ScoredVectorRetriever(BaseRetriever):
+    vectorstore: VectorStore
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self._with_vector_scores(
+            self.vectorstore.similarity_search_with_score(query, k=self.k)
+        )
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self._with_vector_scores(
+            await self.vectorstore.asimilarity_search_with_score(query, k=self.k)
+        )
+
+    def _with_vector_scores(self, results: list[tuple[Document, float]]) -> list[Document]:
+        for doc, score in results:
+            doc.metadata["vector_score"] = _cosine_similarity(self.vectorstore, score)
+        return [doc for doc, _ in results]
+
+
+# The matrix store scores by cosine already. Chroma returns a distance in its collection's
+# space: squared L2 by default, which for the unit-length embeddings is 2 - 2 * cosine.
+def _cosine_similarity(vectorstore: VectorStore, score: float) -> float:
+    if not isinstance(vectorstore, Chroma):
+        return float(score)
+    hnsw = vectorstore._collection.configuration.get("hnsw") or {}
+    return 1 - float(score) / 2 if (hnsw.get("space") or "l2") == "l2" else 1 - float(score)
+
+
+def _dedupe_key(doc: Document) -> str:
+    return doc.metadata.get("content_hash") or hashlib.sha256(doc.page_content.encode()).hexdigest()
+
+
+# Reciprocal rank fusion: each leg contributes 1 / (rrf_k + rank) per document. Per-leg
+# scores stay in metadata next to the fused rrf_score; duplicates merge on content hash.
+def reciprocal_rank_fusion(legs: list[list[Document]], rrf_k: int) -> list[Document]:
+    fused: dict[str, Document] = {}
+    for docs in legs:
+        for rank, doc in enumerate(docs, start=1):
+            key = _dedupe_key(doc)
+            if key in fused:
+                fused[key].metadata.update(
+                    {k: v for k, v in doc.metadata.items() if k.endswith("_score")}
+                )
+            else:
+                fused[key] = doc
+                doc.metadata["rrf_score"] = 0.0
+            fused[key].metadata["rrf_score"] += 1 / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda doc: doc.metadata["rrf_score"], reverse=True)
+
+
 class HybridRetriever(BaseRetriever):
     vector_retriever: BaseRetriever
     bm25_retriever: BaseRetriever
+    exact_retriever: BaseRetriever | None = None
+    k: int = 8
+    token_budget: int = 6_000
+    rrf_k: int = 60
 
+    # BM25 is local CPU work and the vector leg waits on the embedding round-trip,
+    # so both legs run concurrently and latency tracks the slower of the two.
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> list[Document]:
-        # Simple combination: BM25 first, then Vector.
-        # Deduplicate by page content.
+        exact_docs = self._exact(query)
+        if exact_docs and is_id_only(query):
+            return self._combine(exact_docs, [], [], 0.0, 0.0)
+
+        bm25_future = _leg_executor.submit(_timed, self.bm25_retriever.invoke, query)
+        vector_docs, vector_ms = _timed(self.vector_retriever.invoke, query)
+        bm25_docs, bm25_ms = bm25_future.result()
+        _observe_legs(bm25_ms, vector_ms)
+        return self._combine(exact_docs, bm25_docs, vector_docs, bm25_ms, vector_ms)
 
-        bm25_docs = self.bm25_retriever.invoke(query)
-        vector_docs = self.vector_retriever.invoke(query)
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        exact_docs = self._exact(query)
+        if exact_docs and is_id_only(query):
+            return self._combine(exact_docs, [], [], 0.0, 0.0)
 
-        # Combine and deduplicate
-        seen = set()
-        combined = []
+        (bm25_docs, bm25_ms), (vector_docs, vector_ms) = await asyncio.gather(
+            _atimed(self.bm25_retriever.ainvoke(query)),
+            _atimed(self.vector_retriever.ainvoke(query)),
+        )
+        _observe_legs(bm25_ms, vector_ms)
+        return self._combine(exact_docs, bm25_docs, vector_docs, bm25_ms, vector_ms)
 
-        # Prioritize BM25 for exact matches
-        for doc in bm25_docs:
-            if doc.page_content not in seen:
-                doc.metadata["match_type"] = "Exact Match"
-                seen.add(doc.page_content)
-                combined.append(doc)
+    # Article-number hits are a dictionary lookup, so they are resolved inline before the
+    # legs; a query made only of article numbers does not run the legs at all.
+    def _exact(self, query: str) -> list[Document]:
+        if not self.exact_retriever:
+            return []
+        with RETRIEVAL_LEG_SECONDS.labels("exact").time():
+            return self.exact_retriever.invoke(query)
 
-        for doc in vector_docs:
-            if doc.page_content not in seen:
-                doc.metadata["match_type"] = "Semantic Match"
-                seen.add(doc.page_content)
-                combined.append(doc)
+    # Exact ID hits first, then the fused rankings, keeping the true top-k that fits the
+    # prompt token budget. Full chunks already covered by an exact hit are dropped.
+    def _combine(
+        self,
+        exact_docs: list[Document],
+        bm25_docs: list[Document],
+        vector_docs: list[Document],
+        bm25_ms: float,
+        vector_ms: float,
+    ) -> list[Document]:
+        bm25_keys = {_dedupe_key(doc) for doc in bm25_docs + exact_docs}
+        exact_keys = {_dedupe_key(doc) for doc in exact_docs}
+        ranked = exact_docs + [
+            doc
+            for doc in reciprocal_rank_fusion([bm25_docs, vector_docs], self.rrf_k)
+            if _dedupe_key(doc) not in exact_keys
+        ]
 
+        combined: list[Document] = []
+        tokens = 0
+        for doc in ranked[: max(self.k, len(exact_docs))]:
+            doc_tokens = count_tokens(doc.page_content)
+            # Always keep the best chunk, even if it alone exceeds the budget
+            if combined and tokens + doc_tokens > self.token_budget:
+                break
+            # BM25 hits keep the "Exact Match" label the frontend highlights
+            doc.metadata["match_type"] = (
+                "Exact Match" if _dedupe_key(doc) in bm25_keys else "Semantic Match"
+            )
+            combined.append(doc)
+            tokens += doc_tokens
+
+        log.info(
+            "hybrid_retrieval",
+            count=len(combined),
+            candidates=len(ranked),
+            exact_count=len(exact_docs),
+            tokens=tokens,
+            bm25_count=len(bm25_docs),
+            vector_count=len(vector_docs),
+            bm25_ms=round(bm25_ms, 1),
+            vector_ms=round(vector_ms, 1),
+        )
         return combined
 
 
-def _build_retriever() -> BaseRetriever:
-    vectorstore = get_vectorstore()
-    vector_retriever = vectorstore.as_retriever(search_kwargs={"k": settings.retrieval_k})
+# Derived index files live in the version's index_dir
+def article_index_path(root: Path) -> Path:
+    return root / "article_index.json"
 
-    if not vectorstore._collection.count():
-        return vector_retriever
 
-    # fetch all docs to build BM25 index
-    data = vectorstore.get()
-    docs_content = data["documents"]
-    metadatas = data["metadatas"]
+def table_store_path(root: Path) -> Path:
+    return root / "tables.sqlite3"
 
-    if not docs_content:
-        return vector_retriever
 
-    full_docs = [
+def bm25_index_dir(root: Path) -> Path:
+    return root / "bm25"
+
+
+def vector_index_dir(root: Path) -> Path:
+    return root / "vectors"
+
+
+# Full corpus read-back from the vector store; only needed when (re)writing the BM25 index
+def _collection_documents(vectorstore: IndexVectorStore) -> list[Document]:
+    data = vectorstore.get()
+    return [
         Document(page_content=content, metadata=meta)
-        for content, meta in zip(docs_content, metadatas)
+        for content, meta in zip(data["documents"], data["metadatas"])
     ]
 
-    bm25_retriever = BM25Retriever.from_documents(full_docs)
-    bm25_retriever.k = settings.retrieval_k
 
-    log.info("hybrid_retriever_initialized", num_docs=len(full_docs))
-    return HybridRetriever(vector_retriever=vector_retriever, bm25_retriever=bm25_retriever)
+# Everything derived from the chunk corpus besides the vectors: BM25 index, article-number
+# index (addressing the BM25 chunk store by position), the brand lexicon the fast-path
+# router matches against, and the structured table store
+def _save_derived_indexes(vectorstore: IndexVectorStore, root: Path) -> None:
+    documents = _collection_documents(vectorstore)
+    save_bm25_index(bm25_index_dir(root), documents)
+    save_article_index(article_index_path(root), documents)
+    save_brand_lexicon([doc.page_content for doc in documents], root)
+    save_table_store(table_store_path(root), documents)
+
+
+def _build_retriever(version: int) -> BaseRetriever:
+    root = index_dir(version)
+    vectorstore = _vectorstore(version)
+    vector_retriever = ScoredVectorRetriever(vectorstore=vectorstore, k=settings.retrieval_k)
+
+    count = (
+        vectorstore.count()
+        if isinstance(vectorstore, MatrixVectorStore)
+        else vectorstore._collection.count()
+    )
+    if not count:
+        return vector_retriever
+
+    # Load the lexical indexes persisted at index time; rebuild them only if missing or stale
+    loaded = load_bm25_index(bm25_index_dir(root))
+    article_index = load_article_index(article_index_path(root))
+    stale = loaded is None or loaded[0].num_docs != count
+    if stale or article_index is None or not table_store_path(root).exists():
+        log.info("derived_index_rebuild", reason="stale" if loaded else "missing")
+        _save_derived_indexes(vectorstore, root)
+        loaded = load_bm25_index(bm25_index_dir(root))
+        article_index = load_article_index(article_index_path(root))
+    assert loaded is not None and article_index is not None
+
+    index, chunks = loaded
+    bm25_retriever = PersistedBM25Retriever(index=index, chunks=chunks, k=settings.retrieval_k)
+
+    log.info("hybrid_retriever_initialized", num_docs=index.num_docs, num_ids=len(article_index))
+    return HybridRetriever(
+        vector_retriever=vector_retriever,
+        bm25_retriever=bm25_retriever,
+        exact_retriever=ArticleRetriever(index=article_index, chunks=chunks),
+        k=settings.retrieval_k,
+        token_budget=settings.retrieval_token_budget,
+        rrf_k=settings.rrf_k,
+    )
+
+
+def _load_index(version: int) -> IndexHandle:
+    return IndexHandle(
+        version=version,
+        retriever=_build_retriever(version),
+        table_store=load_table_store(
+            table_store_path(index_dir(version)), max_rows=settings.table_filter_max_rows
+        ),
+    )
 
 
+# (Re)load the version CURRENT points at and make it live
 def init_retriever() -> None:
-    global _retriever
-    _retriever = _build_retriever()
+    with _swap_lock:
+        _load_current()
 
 
-def get_retriever() -> BaseRetriever:
-    global _retriever
-    if _retriever is None:
+def _live_index() -> IndexHandle:
+    if _index is None:
         init_retriever()
-    assert _retriever is not None
-    return _retriever
+    assert _index is not None
+    return _index
+
+
+# `index` is the version a request pinned; without one, the live version
+def get_retriever(index: IndexHandle | None = None) -> BaseRetriever:
+    return (index or _live_index()).retriever
+
+
+# None until an index with tables exists
+def get_table_store(index: IndexHandle | None = None) -> TableStore | None:
+    return (index or _live_index()).table_store
+
+
+# Brand lexicon of the live version, for the fast-path router
+def load_live_brand_lexicon() -> frozenset[str]:
+    return load_brand_lexicon(index_dir(_index.version if _index else live_version_on_disk() or 0))
@@ -1,18 +1,32 @@
 # FastAPI application for the Agentic RAG Chatbot.
 
-import time
+import asyncio
+import hmac
+import shutil
+import uuid
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from app.agent import stream_agent
+from app.agent import astream_agent, bind_llm, stream_agent
 from app.config import settings
-from app.ingestion import index_pdf
+from app.extraction import resolve_pdf_paths
+from app.index_jobs import index_jobs
+from app.ingestion import (
+    bind_embeddings,
+    drop_stale_versions,
+    ensure_index,
+    init_retriever,
+    is_index_live,
+    live_version_on_disk,
+)
 from app.log import get_logger, setup_logging
+from app.metrics import render_metrics
 from app.models import ChatRequest
+from app.resources import close_resources, get_resources, warm_up
 
 setup_logging()
 log = get_logger(__name__)
@@ -21,19 +35,26 @@ log = get_logger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.info("app_starting", llm_model=settings.llm_model)
-
-    chroma_path = Path(settings.chroma_dir)
-    if not chroma_path.exists():
-        log.info("auto_indexing_started", reason="chroma directory not found")
-        start = time.time()
-        num_chunks = index_pdf()
-        duration = time.time() - start
-        log.info("auto_indexing_complete", num_chunks=num_chunks, duration_s=round(duration, 2))
+    # A previous lifespan in this process closed the pooled clients; rebuild the long-lived
+    # clients on the current ones
+    bind_llm()
+    bind_embeddings()
+
+    # Indexing runs as a background job, so the server starts (and /health answers) at once
+    if live_version_on_disk() is None:
+        log.info("auto_indexing_started", reason="no index found")
+        index_jobs.submit(settings.pdf_path, run=ensure_index)
     else:
-        log.info("auto_indexing_skipped", reason="chroma directory already exists")
+        log.info("auto_indexing_skipped", reason="index already exists")
+        await asyncio.to_thread(init_retriever)
+        await asyncio.to_thread(drop_stale_versions)
+
+    if settings.warm_up_on_startup:
+        await warm_up(get_resources())
 
     yield
     log.info("app_shutting_down")
+    await close_resources()
 
 
 app = FastAPI(
@@ -51,18 +72,97 @@ app.add_middleware(
 )
 
 
+# Liveness only: the process is up, whether or not an index is loaded
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
 
+# Readiness: 200 once a complete index can answer chats, 503 before; the body carries
+# the latest index job's progress either way
+@app.get("/ready")
+async def ready():
+    latest = index_jobs.latest()
+    body = {"ready": is_index_live(), "indexing": latest.to_dict() if latest else None}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+# Prometheus scrape endpoint: node, retrieval and embedding latency, tokens, cache hits
+@app.get("/metrics")
+async def metrics():
+    content, media_type = render_metrics()
+    return Response(content, media_type=media_type)
+
+
 # Stream live status updates and the final answer via SSE
 @app.post("/chat")
 async def chat(request: ChatRequest):
     log.info("chat_request", message=request.message, conversation_id=request.conversation_id)
+    if not is_index_live():
+        raise HTTPException(
+            status_code=503,
+            detail="The product catalog is still being indexed. Please try again shortly.",
+            headers={"Retry-After": "10"},
+        )
+
+    stream = (
+        astream_agent(request.message, request.conversation_id)
+        if settings.async_agent
+        else stream_agent(request.message, request.conversation_id)
+    )
 
     return StreamingResponse(
-        stream_agent(request.message, request.conversation_id),
+        stream,
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+
+def require_admin(x_admin_token: str | None = Header(default=None)) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    # Constant-time comparison, so response timing does not leak the token
+    if not hmac.compare_digest((x_admin_token or "").encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def uploads_dir() -> Path:
+    return Path(settings.chroma_dir).parent / "uploads"
+
+
+# Rebuild the index from an uploaded PDF or a server-side path (file, directory or glob).
+# The job builds a new index version in the background; it goes live atomically when done.
+@app.post("/admin/index", status_code=202, dependencies=[Depends(require_admin)])
+async def admin_index(
+    file: UploadFile | None = File(default=None),
+    pdf_path: str | None = Form(default=None),
+):
+    if (file is None) == (pdf_path is None):
+        raise HTTPException(status_code=400, detail="Send either a PDF file or a pdf_path")
+
+    upload_dir = None
+    if file is not None:
+        # A directory per upload, so same-named files never overwrite a queued job's input;
+        # the job deletes it when it finishes
+        upload_dir = uploads_dir() / uuid.uuid4().hex
+        target = upload_dir / Path(file.filename or "upload.pdf").name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("wb") as out:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, out)
+        pdf_path = str(target)
+
+    assert pdf_path is not None
+    if not any(path.is_file() for path in resolve_pdf_paths(pdf_path)):
+        if upload_dir is not None:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"No PDF found at {pdf_path}")
+
+    return index_jobs.submit(pdf_path, cleanup=upload_dir).to_dict()
+
+
+@app.get("/admin/index/{job_id}", dependencies=[Depends(require_admin)])
+async def admin_index_status(job_id: str):
+    job = index_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown index job")
+    return job.to_dict()
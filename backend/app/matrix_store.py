@@ -0,0 +1,343 @@
+# In-process vector index: chunk embeddings as a unit-normalized float16 or int8 matrix,
+# searched exactly by blocked matrix multiply. The files are memory-mapped read-only, so
+# uvicorn workers share one copy of the vectors through the OS page cache.
+
+import json
+import shutil
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStore
+
+from app.bm25 import ChunkStore
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+FORMAT_VERSION = 1
+DTYPES = ("float16", "int8")
+# Rows upcast and scored per matmul; 4096 x 1536 float32 is a 24 MiB working buffer
+_BLOCK_ROWS = 4_096
+
+
+# Quantized rows: float16 keeps the normalized vector as is; int8 stores each row as
+# round(v / scale) with a per-row scale of max|v| / 127, i.e. 1 byte per dimension
+@dataclass
+class QuantizedMatrix:
+    data: np.ndarray
+    scales: np.ndarray | None = None
+
+    @classmethod
+    def quantize(cls, vectors: np.ndarray, dtype: str) -> "QuantizedMatrix":
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype!r}; expected one of {DTYPES}")
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        if dtype == "float16":
+            return cls(vectors.astype(np.float16))
+        scales = np.abs(vectors).max(axis=1, initial=0.0) / 127
+        scales[scales == 0] = 1.0
+        data = np.round(vectors / scales[:, None]).astype(np.int8)
+        return cls(data, scales.astype(np.float32))
+
+    @classmethod
+    def concat(cls, parts: Sequence["QuantizedMatrix"]) -> "QuantizedMatrix":
+        scales = [part.scales for part in parts]
+        return cls(
+            np.concatenate([part.data for part in parts]),
+            None if scales[0] is None else np.concatenate(scales),  # type: ignore[arg-type]
+        )
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def dtype(self) -> str:
+        return str(self.data.dtype)
+
+    def dequantize(self) -> np.ndarray:
+        data = np.asarray(self.data, dtype=np.float32)
+        return data if self.scales is None else data * self.scales[:, None]
+
+    def rows(self, indices: np.ndarray) -> "QuantizedMatrix":
+        return QuantizedMatrix(
+            np.asarray(self.data[indices]),
+            None if self.scales is None else np.asarray(self.scales[indices]),
+        )
+
+    # Exact top-k cosine similarity for a batch of unit-normalized queries (m x dim). Row
+    # blocks are upcast into one reused float32 buffer small enough to stay in cache, and
+    # each block contributes only its k best per query to the final selection.
+    def top_k(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.data))
+        if not k:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        buffer = np.empty((min(_BLOCK_ROWS, len(self.data)), self.data.shape[1]), np.float32)
+        candidate_ids, candidate_scores = [], []
+        for start in range(0, len(self.data), _BLOCK_ROWS):
+            block = buffer[: min(_BLOCK_ROWS, len(self.data) - start)]
+            np.copyto(block, self.data[start : start + len(block)], casting="unsafe")
+            scores = queries @ block.T
+            if self.scales is not None:
+                scores *= self.scales[start : start + len(block)]
+            ids, scores = _best(scores, k)
+            candidate_ids.append(ids + start)
+            candidate_scores.append(scores)
+
+        ids, scores = (
+            np.concatenate(candidate_ids, axis=1),
+            np.concatenate(candidate_scores, axis=1),
+        )
+        best, scores = _best(scores, k)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, 1)
+        return np.take_along_axis(ids, best, 1), np.take_along_axis(scores, order, 1)
+
+
+# Column indices and values of the k largest scores per row, unordered
+def _best(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    if scores.shape[1] <= k:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape), scores
+    ids = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return ids, np.take_along_axis(scores, ids, 1)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+# LangChain vector store over a QuantizedMatrix plus a JSONL chunk store, persisted in one
+# directory. Writes (upsert_embeddings, add_texts, delete) are buffered until save(),
+# which rewrites the directory and swaps it in; searches only see saved rows.
+class MatrixVectorStore(VectorStore):
+    def __init__(self, directory: Path, embedding: Embeddings, dtype: str = "int8") -> None:
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype!r}; expected one of {DTYPES}")
+        self.directory = directory
+        self.dtype = dtype
+        self._embedding = embedding
+        self._upserts: dict[str, tuple[list[float], Document]] = {}
+        self._deletes: set[str] = set()
+        self._load()
+
+    def _load(self) -> None:
+        self._ids: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._matrix: QuantizedMatrix | None = None
+        self._chunks: ChunkStore | None = None
+
+        meta_path = self.directory / "meta.json"
+        if not meta_path.exists():
+            return
+        meta = json.loads(meta_path.read_text())
+        if meta.get("version") != FORMAT_VERSION:
+            return
+        scales_path = self.directory / "scales.npy"
+        self._matrix = QuantizedMatrix(
+            np.load(self.directory / "matrix.npy", mmap_mode="r"),
+            np.load(scales_path, mmap_mode="r") if scales_path.exists() else None,
+        )
+        self._ids = json.loads((self.directory / "ids.json").read_text())
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        self._chunks = ChunkStore(
+            self.directory / "chunks.jsonl", np.load(self.directory / "offsets.npy", mmap_mode="r")
+        )
+        # Searches work on either dtype; the next save() converts the stored rows
+        if self._matrix.dtype != self.dtype:
+            log.warning("vector_dtype_mismatch", stored=self._matrix.dtype, configured=self.dtype)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # Releases the mapped chunk file; the matrix maps go with their last reference
+    def close(self) -> None:
+        if self._chunks is not None:
+            self._chunks.close()
+        self._chunks, self._matrix = None, None
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _document(self, position: int) -> Document:
+        assert self._chunks is not None
+        doc = self._chunks.get(position)
+        doc.id = self._ids[position]
+        return doc
+
+    # Same shape as Chroma's get(), so index syncing treats both backends alike
+    def get(self, include: Iterable[str] = ("documents", "metadatas")) -> dict[str, Any]:
+        include = set(include)
+        docs = [self._document(i) for i in range(self.count())] if include else []
+        return {
+            "ids": list(self._ids),
+            "documents": [doc.page_content for doc in docs] if "documents" in include else None,
+            "metadatas": [doc.metadata for doc in docs] if "metadatas" in include else None,
+        }
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        return [self._document(self._positions[i]) for i in ids if i in self._positions]
+
+    # Stored (dequantized) vectors of the given chunks, for copying them into another store
+    def get_vectors(self, ids: Sequence[str]) -> list[list[float]]:
+        assert self._matrix is not None
+        positions = np.asarray([self._positions[i] for i in ids], dtype=np.int64)
+        return self._matrix.rows(positions).dequantize().tolist()
+
+    def upsert_embeddings(
+        self,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        for chunk_id, vector, text, metadata in zip(ids, embeddings, documents, metadatas):
+            self._deletes.discard(chunk_id)
+            self._upserts[chunk_id] = (vector, Document(page_content=text, metadata=metadata))
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        ids = ids or [f"chunk-{len(self._ids) + len(self._upserts) + i}" for i in range(len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        self.upsert_embeddings(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        for chunk_id in ids or []:
+            self._upserts.pop(chunk_id, None)
+            self._deletes.add(chunk_id)
+        return True
+
+    # Rewrites the directory with the buffered writes applied: kept rows are copied as
+    # stored (re-quantized only if vector_dtype changed), new and changed rows are appended
+    def save(self) -> None:
+        if not self._upserts and not self._deletes and (self.directory / "meta.json").exists():
+            return
+        replaced = self._deletes | self._upserts.keys()
+        kept = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in replaced]
+        ids = [self._ids[i] for i in kept] + list(self._upserts)
+        docs = [self._document(i) for i in kept] + [doc for _, doc in self._upserts.values()]
+
+        parts = []
+        if self._matrix is not None and kept:
+            rows = self._matrix.rows(np.asarray(kept, dtype=np.int64))
+            if rows.dtype != self.dtype:
+                rows = QuantizedMatrix.quantize(rows.dequantize(), self.dtype)
+            parts.append(rows)
+        if self._upserts:
+            vectors = np.asarray([vector for vector, _ in self._upserts.values()], dtype=np.float32)
+            parts.append(QuantizedMatrix.quantize(vectors, self.dtype))
+        matrix = (
+            QuantizedMatrix.concat(parts)
+            if parts
+            else QuantizedMatrix.quantize(np.empty((0, 0), dtype=np.float32), self.dtype)
+        )
+
+        staging = self.directory.with_name(self.directory.name + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        offsets = [0]
+        with (staging / "chunks.jsonl").open("wb") as f:
+            for doc in docs:
+                line = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata})
+                offsets.append(offsets[-1] + f.write(line.encode("utf-8") + b"\n"))
+        np.save(staging / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+        np.save(staging / "matrix.npy", matrix.data)
+        if matrix.scales is not None:
+            np.save(staging / "scales.npy", matrix.scales)
+        (staging / "ids.json").write_text(json.dumps(ids))
+        (staging / "meta.json").write_text(
+            json.dumps({"version": FORMAT_VERSION, "dtype": matrix.dtype, "count": len(ids)})
+        )
+
+        # Swap the finished directory in so readers never see a half-written index
+        previous = self.directory.with_name(self.directory.name + ".old")
+        shutil.rmtree(previous, ignore_errors=True)
+        if self.directory.exists():
+            self.directory.rename(previous)
+        staging.rename(self.directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+        self._upserts.clear()
+        self._deletes.clear()
+        self._load()
+        log.info("vector_matrix_saved", count=len(ids), dtype=matrix.dtype)
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: list[float], k: int = 4
+    ) -> list[tuple[Document, float]]:
+        if self._matrix is None or not self.count():
+            return []
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        ids, scores = self._matrix.top_k(query, k)
+        return [(self._document(int(i)), float(s)) for i, s in zip(ids[0], scores[0])]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    # Scores are cosine similarities; mapped onto 0..1 like the other relevance scores
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda similarity: (similarity + 1) / 2
+
+    # Embeds on the async client; the matmul runs in the executor, off the event loop
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return await run_in_executor(
+            None, self.similarity_search_by_vector_with_score, embedding, k
+        )
+
+    async def _asimilarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        return [
+            (doc, relevance(score))
+            for doc, score in await self.asimilarity_search_with_score(query, k)
+        ]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        directory: Path | None = None,
+        dtype: str = "int8",
+        **kwargs: Any,
+    ) -> "MatrixVectorStore":
+        if directory is None:
+            raise ValueError("MatrixVectorStore.from_texts needs a directory")
+        store = cls(directory, embedding, dtype=dtype)
+        store.add_texts(texts, metadatas, ids=ids)
+        store.save()
+        return store
@@ -0,0 +1,132 @@
+# Conversation memory: per-conversation history (rolling summary + recent turns) in an
+# in-process LRU with TTL, optionally persisted to SQLite so it survives restarts.
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from app.config import settings
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+# Expired rows are deleted at most this often; reads ignore them in the meantime
+PRUNE_INTERVAL_S = 60.0
+
+
+# Next to chroma_dir, like the embedding cache, so re-indexing never drops conversations
+def conversation_store_path() -> Path:
+    return Path(settings.chroma_dir).parent / "conversations.sqlite3"
+
+
+@dataclass
+class Conversation:
+    summary: str = ""
+    # (user message, assistant answer) pairs, oldest first
+    turns: list[tuple[str, str]] = field(default_factory=list)
+
+    def render(self) -> str:
+        lines = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+        for question, answer in self.turns:
+            lines += [f"User: {question}", f"Assistant: {answer}"]
+        return "\n".join(lines)
+
+
+class ConversationStore:
+    def __init__(self, max_entries: int, ttl_s: float, path: Path | None = None) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str, tuple[float, Conversation]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+        self._conn: sqlite3.Connection | None = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated)"
+            )
+            self._conn.commit()
+
+    # Unknown or expired conversations start empty
+    def get(self, conversation_id: str) -> Conversation:
+        now = time.time()
+        with self._lock:
+            conversation = self._cached(conversation_id, now)
+            if conversation is not None:
+                return conversation
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT data, updated FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+                if row is not None and row[1] + self.ttl_s > now:
+                    data = json.loads(row[0])
+                    conversation = Conversation(
+                        summary=data["summary"], turns=[tuple(turn) for turn in data["turns"]]
+                    )
+                    self._remember(conversation_id, conversation, row[1] + self.ttl_s)
+                    return conversation
+        return Conversation()
+
+    # Memory hits are answered on the loop; only a SQLite read goes to a thread
+    async def aget(self, conversation_id: str) -> Conversation:
+        if self._conn is None:
+            return self.get(conversation_id)
+        with self._lock:
+            conversation = self._cached(conversation_id, time.time())
+        if conversation is not None:
+            return conversation
+        return await asyncio.to_thread(self.get, conversation_id)
+
+    def put(self, conversation_id: str, conversation: Conversation) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(conversation_id, conversation, now + self.ttl_s)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (id, data, updated) VALUES (?, ?, ?)",
+                    (conversation_id, json.dumps(asdict(conversation)), now),
+                )
+                if now - self._pruned_at >= PRUNE_INTERVAL_S:
+                    self._conn.execute(
+                        "DELETE FROM conversations WHERE updated < ?", (now - self.ttl_s,)
+                    )
+                    self._pruned_at = now
+                self._conn.commit()
+
+    async def aput(self, conversation_id: str, conversation: Conversation) -> None:
+        if self._conn is None:
+            self.put(conversation_id, conversation)
+        else:
+            await asyncio.to_thread(self.put, conversation_id, conversation)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _cached(self, conversation_id: str, now: float) -> Conversation | None:
+        entry = self._entries.get(conversation_id)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(conversation_id)
+            return entry[1]
+        self._entries.pop(conversation_id, None)
+        return None
+
+    def _remember(
+        self, conversation_id: str, conversation: Conversation, expires_at: float
+    ) -> None:
+        self._entries[conversation_id] = (expires_at, conversation)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,206 @@
+# Prometheus metrics and per-request timing: latency of every graph node, retrieval leg and
+# embedding call, LLM tokens per node, cache hits, grader keep ratio, rewrites and routes.
+# With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates them.
+
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.utils import accepts_config
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+
+from app.tokens import count_tokens
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+NODE_SECONDS = Histogram(
+    "rag_node_duration_seconds", "Graph node latency", ["node"], buckets=_LATENCY_BUCKETS
+)
+NODE_TOKENS = Histogram(
+    "rag_node_llm_tokens",
+    "LLM tokens per call, by graph node and prompt/completion",
+    ["node", "kind"],
+    buckets=_TOKEN_BUCKETS,
+)
+RETRIEVAL_LEG_SECONDS = Histogram(
+    "rag_retrieval_leg_duration_seconds",
+    "Hybrid retriever leg latency",
+    ["leg"],
+    buckets=_LATENCY_BUCKETS,
+)
+EMBEDDING_SECONDS = Histogram(
+    "rag_embedding_request_duration_seconds",
+    "Embedding API call latency (cache misses only)",
+    ["op"],
+    buckets=_LATENCY_BUCKETS,
+)
+EMBEDDING_CACHE = Counter(
+    "rag_embedding_cache_lookups", "Embedding cache lookups per text", ["result"]
+)
+ANSWER_CACHE = Counter("rag_answer_cache_lookups", "Answer cache lookups", ["result"])
+GRADER_KEEP_RATIO = Histogram(
+    "rag_grader_keep_ratio",
+    "Share of retrieved documents kept by grading",
+    buckets=(0, 0.1, 0.25, 0.5, 0.75, 0.9, 1),
+)
+CHAT_REQUESTS = Counter("rag_chat_requests", "Chat turns handled")
+CHAT_SECONDS = Histogram(
+    "rag_chat_duration_seconds", "Time to the final answer", buckets=_LATENCY_BUCKETS
+)
+QUERY_REWRITES = Counter("rag_query_rewrites", "Queries rewritten for a second retrieval")
+ROUTES = Counter("rag_routes", "Router decisions", ["route", "source"])
+COALESCED_CALLS = Counter(
+    "rag_coalesced_calls", "Calls served by joining an identical call in flight", ["kind"]
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# Timing summary of one chat turn, attached to the final SSE answer event
+class RequestTimings:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.nodes_ms: dict[str, float] = {}
+        self.tokens: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add_node(self, node: str, seconds: float) -> None:
+        with self._lock:
+            self.nodes_ms[node] = self.nodes_ms.get(node, 0.0) + seconds * 1000
+
+    def add_tokens(self, node: str, prompt: int, completion: int) -> None:
+        with self._lock:
+            usage = self.tokens.setdefault(node, {"prompt": 0, "completion": 0})
+            usage["prompt"] += prompt
+            usage["completion"] += completion
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+                "nodes_ms": {node: round(ms, 1) for node, ms in self.nodes_ms.items()},
+                "tokens": {node: dict(usage) for node, usage in self.tokens.items()},
+            }
+
+
+def _timings(config: RunnableConfig | None) -> RequestTimings | None:
+    return (config or {}).get("configurable", {}).get("timings")
+
+
+def _observe_node(node: str, seconds: float, config: RunnableConfig | None) -> None:
+    NODE_SECONDS.labels(node).observe(seconds)
+    if timings := _timings(config):
+        timings.add_node(node, seconds)
+
+
+# Wraps a node's sync/async implementations so every run is timed; a `config` parameter on
+# the wrapped functions still receives the graph config
+def timed_node(
+    node: str,
+    func: Callable[..., Any],
+    afunc: Callable[..., Awaitable[Any]] | None = None,
+) -> RunnableLambda:
+    def run(state: Any, config: RunnableConfig) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(state, config) if accepts_config(func) else func(state)
+        finally:
+            _observe_node(node, time.perf_counter() - start, config)
+
+    async def arun(state: Any, config: RunnableConfig) -> Any:
+        assert afunc is not None
+        start = time.perf_counter()
+        try:
+            return await (afunc(state, config) if accepts_config(afunc) else afunc(state))
+        finally:
+            _observe_node(node, time.perf_counter() - start, config)
+
+    return RunnableLambda(run, afunc=arun if afunc else None, name=node)
+
+
+# Attributes LLM token usage to the graph node the call ran in (LangGraph puts the node name
+# in the run metadata). Providers that omit usage, e.g. when streaming, get an estimate.
+class TokenUsageCallback(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, timings: RequestTimings | None = None) -> None:
+        self.timings = timings
+        self._runs: dict[UUID, tuple[str, int]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[BaseMessage]],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        node = (metadata or {}).get("langgraph_node", "other")
+        prompt = sum(count_tokens(str(m.content)) for batch in messages for m in batch)
+        self._runs[run_id] = (node, prompt)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        node, prompt = self._runs.pop(run_id, ("other", 0))
+        completion = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = generation.message if isinstance(generation, ChatGeneration) else None
+                usage = message.usage_metadata if isinstance(message, AIMessage) else None
+                if usage:
+                    prompt, completion = usage["input_tokens"], usage["output_tokens"]
+                else:
+                    completion += count_tokens(generation.text)
+        NODE_TOKENS.labels(node, "prompt").observe(prompt)
+        NODE_TOKENS.labels(node, "completion").observe(completion)
+        if self.timings is not None:
+            self.timings.add_tokens(node, prompt, completion)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+
+# Times the calls that reach the embedding API (it sits under the embedding cache)
+class TimedEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings) -> None:
+        self.underlying = underlying
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with EMBEDDING_SECONDS.labels("documents").time():
+            return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        with EMBEDDING_SECONDS.labels("documents").time():
+            return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with EMBEDDING_SECONDS.labels("query").time():
+            return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        with EMBEDDING_SECONDS.labels("query").time():
+            return await self.underlying.aembed_query(text)
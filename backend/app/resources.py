@@ -0,0 +1,114 @@
+# Application-scoped resources: pooled HTTP clients shared by every OpenRouter-facing
+# client (LLM and embeddings) and a single Chroma client. main.lifespan warms them at
+# startup and closes them at shutdown; scripts and tests create them lazily on first use.
+
+import asyncio
+import importlib.util
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import chromadb
+import httpx
+
+from app.config import settings
+from app.log import get_logger
+from app.tokens import count_tokens
+
+log = get_logger(__name__)
+
+
+@dataclass
+class Resources:
+    http_client: httpx.Client
+    async_http_client: httpx.AsyncClient
+    _chroma_client: Any = field(default=None, repr=False)
+    _chroma_path: str | None = field(default=None, repr=False)
+
+    # Created on first use: PersistentClient creates chroma_dir, and startup decides
+    # whether to index by checking that directory exists
+    @property
+    def chroma_client(self) -> Any:
+        if self._chroma_client is None or self._chroma_path != settings.chroma_dir:
+            self._chroma_client = chromadb.PersistentClient(path=settings.chroma_dir)
+            self._chroma_path = settings.chroma_dir
+        return self._chroma_client
+
+
+def _http2_enabled() -> bool:
+    if not settings.http2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        log.warning("http2_unavailable", reason="h2 package not installed")
+        return False
+    return True
+
+
+def create_resources() -> Resources:
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry_s,
+    )
+    timeout = httpx.Timeout(settings.http_timeout_s, connect=settings.http_connect_timeout_s)
+    http2 = _http2_enabled()
+    log.info("http_clients_created", http2=http2, max_connections=settings.http_max_connections)
+    return Resources(
+        http_client=httpx.Client(limits=limits, timeout=timeout, http2=http2),
+        async_http_client=httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2),
+    )
+
+
+_resources: Resources | None = None
+
+
+def get_resources() -> Resources:
+    global _resources
+    if _resources is None:
+        _resources = create_resources()
+    return _resources
+
+
+# Open the TLS connections to the OpenRouter host on both pools, load the tokenizer and
+# open the Chroma collection, so the first user request does not pay for any of it.
+# Failures are logged and ignored: the app still works, just without the head start.
+async def warm_up(resources: Resources) -> None:
+    start = time.perf_counter()
+    url = settings.openrouter_base_url.rstrip("/") + "/models"
+
+    async def ping_async() -> None:
+        await resources.async_http_client.get(url)
+
+    def ping_sync() -> None:
+        resources.http_client.get(url)
+
+    def open_local() -> None:
+        count_tokens("warm up")
+        # Opening Chroma would create chroma_dir before the first index build swaps it in
+        if settings.vector_backend == "chroma" and Path(settings.chroma_dir).exists():
+            resources.chroma_client.heartbeat()
+
+    results = await asyncio.gather(
+        ping_async(),
+        asyncio.to_thread(ping_sync),
+        asyncio.to_thread(open_local),
+        return_exceptions=True,
+    )
+    errors = [str(result) for result in results if isinstance(result, BaseException)]
+    log.info(
+        "resources_warmed",
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        errors=errors or None,
+    )
+
+
+# Long-lived clients built on these pools (agent.llm, the embeddings) are rebuilt by the
+# next lifespan's bind_llm/bind_embeddings
+async def close_resources() -> None:
+    global _resources
+    if _resources is None:
+        return
+    _resources.http_client.close()
+    await _resources.async_http_client.aclose()
+    _resources = None
@@ -0,0 +1,187 @@
+# Fast-path router: deterministic rules (and an optional embedding classifier) that decide
+# obvious intents before the LLM router is called.
+
+import json
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+# Article numbers ("4550242", "4606051V") or an explicit "Art.-Nr." prefix
+_CATALOG_ID_RE = re.compile(r"\bart\.?\s?-?\s?nr\b|\b\d{6,}[a-z]?\b")
+
+# Brands are printed with a registered/trademark sign in the catalog ("Omnifix®")
+_BRAND_RE = re.compile(r"(\w[\w\-]*)\s?[®™]")
+
+_GREETINGS = frozenset(
+    [
+        "hi",
+        "hey",
+        "hello",
+        "hallo",
+        "moin",
+        "servus",
+        "good morning",
+        "good evening",
+        "guten morgen",
+        "guten tag",
+        "guten abend",
+        "thanks",
+        "thank you",
+        "thanks a lot",
+        "danke",
+        "vielen dank",
+        "bye",
+        "goodbye",
+        "tschüss",
+        "ok",
+        "okay",
+        "who are you",
+        "what can you do",
+    ]
+)
+
+# Labelled examples for the embedding classifier, mirroring the LLM router prompt
+_EXEMPLARS = {
+    "chat": [
+        "Hi",
+        "Who are you?",
+        "Thanks",
+        "What is the capital of France?",
+        "Write a poem",
+        "Python code",
+        "What's the weather like today?",
+    ],
+    "search": [
+        "What syringes do you have?",
+        "Product 123",
+        "Needle specs",
+        "Which cannula sizes are available?",
+        "Do you sell infusion sets?",
+        "What is the article number of the 5 ml syringe?",
+        "Gloves in size M",
+    ],
+}
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    source: str
+    confidence: float
+
+
+def _normalize(query: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s.\-]", " ", query.lower())).strip(" .")
+
+
+def harvest_brand_names(texts: list[str]) -> list[str]:
+    return sorted({match.group(1).lower() for text in texts for match in _BRAND_RE.finditer(text)})
+
+
+def brand_lexicon_path(root: Path) -> Path:
+    return root / "brand_lexicon.json"
+
+
+def save_brand_lexicon(texts: list[str], root: Path) -> None:
+    brands = harvest_brand_names(texts)
+    brand_lexicon_path(root).write_text(json.dumps(brands, ensure_ascii=False))
+    log.info("brand_lexicon_saved", num_brands=len(brands))
+
+
+def load_brand_lexicon(root: Path) -> frozenset[str]:
+    path = brand_lexicon_path(root)
+    if not path.exists():
+        return frozenset()
+    return frozenset(json.loads(path.read_text()))
+
+
+# Rules first; when an embeddings factory is given, a nearest-centroid classifier over
+# query embeddings handles what the rules do not cover. Returns None when the LLM router
+# should decide. The brand lexicon is reloaded whenever the index version changes.
+class FastRouter:
+    def __init__(
+        self,
+        brands: Callable[[], frozenset[str]],
+        index_version: Callable[[], int],
+        embeddings: Callable[[], Embeddings] | None = None,
+        margin: float = 0.05,
+    ) -> None:
+        self.margin = margin
+        self._load_brands = brands
+        self._index_version = index_version
+        self._embeddings = embeddings
+        self._brands: frozenset[str] = frozenset()
+        self._brands_version: int | None = None
+        self._centroids: dict[str, np.ndarray] | None = None
+
+    def classify(self, query: str) -> RouteDecision | None:
+        decision = self._rules(query)
+        if decision is not None or self._embeddings is None:
+            return decision
+        embeddings = self._embeddings()
+        if self._centroids is None:
+            self._set_centroids(
+                {label: embeddings.embed_documents(ex) for label, ex in _EXEMPLARS.items()}
+            )
+        return self._nearest(embeddings.embed_query(query))
+
+    async def aclassify(self, query: str) -> RouteDecision | None:
+        decision = self._rules(query)
+        if decision is not None or self._embeddings is None:
+            return decision
+        embeddings = self._embeddings()
+        if self._centroids is None:
+            self._set_centroids(
+                {label: await embeddings.aembed_documents(ex) for label, ex in _EXEMPLARS.items()}
+            )
+        return self._nearest(await embeddings.aembed_query(query))
+
+    @property
+    def brands(self) -> frozenset[str]:
+        version = self._index_version()
+        if version != self._brands_version:
+            self._brands, self._brands_version = self._load_brands(), version
+        return self._brands
+
+    def _rules(self, query: str) -> RouteDecision | None:
+        normalized = _normalize(query)
+        if not normalized or normalized in _GREETINGS:
+            return RouteDecision("chat", "greeting", 1.0)
+        if _CATALOG_ID_RE.search(normalized):
+            return RouteDecision("search", "catalog_id", 1.0)
+        if self.brands.intersection(normalized.split()):
+            return RouteDecision("search", "brand", 1.0)
+        return None
+
+    def _set_centroids(self, vectors: dict[str, list[list[float]]]) -> None:
+        self._centroids = {
+            label: _unit(np.mean([_unit(v) for v in rows], axis=0))
+            for label, rows in vectors.items()
+        }
+
+    # Decide only when the closer centroid wins by at least `margin` cosine similarity
+    def _nearest(self, vector: list[float]) -> RouteDecision | None:
+        assert self._centroids is not None
+        query = _unit(vector)
+        scores = sorted(
+            ((float(centroid @ query), label) for label, centroid in self._centroids.items()),
+            reverse=True,
+        )
+        (best, label), (runner_up, _) = scores[0], scores[1]
+        if best - runner_up < self.margin:
+            return None
+        return RouteDecision(label, "embedding", round(best - runner_up, 4))
+
+
+def _unit(vector: list[float] | np.ndarray) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
@@ -0,0 +1,202 @@
+# Single-flight: concurrent identical work runs once. SingleFlight shares one call's result
+# (LLM prompts, embedding requests) with every caller that asked while it was running;
+# StreamFlights fans one event stream (a chat turn) out to every request that joined it.
+# Nothing is kept once a flight lands; repeat questions later are the answer cache's job.
+
+import asyncio
+import contextvars
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable, Iterator
+from concurrent.futures import Future
+from typing import Any, Generic, TypeVar
+
+from app.log import get_logger
+from app.metrics import COALESCED_CALLS
+
+log = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future[Any]] = {}
+        self._tasks: dict[Hashable, asyncio.Future[Any]] = {}
+
+    # The first caller runs fn on its own thread; callers arriving meanwhile wait for it
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = self._calls[key] = Future()
+        if not leader:
+            COALESCED_CALLS.labels(self.kind).inc()
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    # The call runs as its own task, so a caller that is cancelled (client disconnect)
+    # does not cancel it for the others
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._landed(key, done))
+        else:
+            COALESCED_CALLS.labels(self.kind).inc()
+        return await asyncio.shield(task)
+
+    def _landed(self, key: Hashable, task: asyncio.Future[Any]) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here, so no "never retrieved" warning without waiters
+
+
+# Events published so far plus completion, replayed in full to every subscriber
+class _Broadcast(Generic[T]):
+    def __init__(self) -> None:
+        self.events: list[T] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._cond = threading.Condition()
+        self._changed = asyncio.Event()
+
+    def publish(self, event: T) -> None:
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+        self._notify()
+
+    def close(self, error: BaseException | None = None) -> None:
+        with self._cond:
+            self.done, self.error = True, error
+            self._cond.notify_all()
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    # For threads: blocks until the next event
+    def subscribe(self) -> Iterator[T]:
+        seen = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: seen < len(self.events) or self.done)
+                events, done, error = self.events[seen:], self.done, self.error
+            yield from events
+            seen += len(events)
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    # For the event loop the flight runs on
+    async def asubscribe(self) -> AsyncIterator[T]:
+        seen = 0
+        while True:
+            changed = self._changed
+            events, done, error = self.events[seen:], self.done, self.error
+            for event in events:
+                yield event
+            seen += len(events)
+            if done:
+                if error is not None:
+                    raise error
+                return
+            if seen == len(self.events):
+                await changed.wait()
+
+
+class StreamFlights(Generic[T]):
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, _Broadcast[T]] = {}
+        # Strong references to running async flights
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    # Subscribes to the flight for key, starting it with produce() on a thread if none is
+    # running. Returns the events and whether an existing flight was joined.
+    def join(self, key: Hashable, produce: Callable[[], Iterator[T]]) -> tuple[Iterator[T], bool]:
+        broadcast, joined = self._broadcast(key)
+        if not joined:
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run,
+                args=(self._run, key, broadcast, produce),
+                name=f"{self.kind}-flight",
+                daemon=True,
+            ).start()
+        return broadcast.subscribe(), joined
+
+    # Async variant: the flight runs as a task on the running event loop
+    def ajoin(
+        self, key: Hashable, produce: Callable[[], AsyncIterator[T]]
+    ) -> tuple[AsyncIterator[T], bool]:
+        broadcast, joined = self._broadcast(key)
+        if not joined:
+            task = asyncio.ensure_future(self._arun(key, broadcast, produce))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return broadcast.asubscribe(), joined
+
+    def _broadcast(self, key: Hashable) -> tuple[_Broadcast[T], bool]:
+        with self._lock:
+            broadcast = self._flights.get(key)
+            if broadcast is not None:
+                COALESCED_CALLS.labels(self.kind).inc()
+                return broadcast, True
+            broadcast = self._flights[key] = _Broadcast()
+            return broadcast, False
+
+    def _run(
+        self, key: Hashable, broadcast: _Broadcast[T], produce: Callable[[], Iterator[T]]
+    ) -> None:
+        try:
+            for event in produce():
+                broadcast.publish(event)
+        except BaseException as exc:
+            broadcast.close(exc)
+            if not isinstance(exc, Exception):
+                raise
+            log.exception("flight_failed", kind=self.kind)
+        else:
+            broadcast.close()
+        finally:
+            self._land(key, broadcast)
+
+    async def _arun(
+        self, key: Hashable, broadcast: _Broadcast[T], produce: Callable[[], AsyncIterator[T]]
+    ) -> None:
+        try:
+            async for event in produce():
+                broadcast.publish(event)
+        except BaseException as exc:
+            broadcast.close(exc)
+            if not isinstance(exc, Exception):
+                raise
+            log.exception("flight_failed", kind=self.kind)
+        else:
+            broadcast.close()
+        finally:
+            self._land(key, broadcast)
+
+    def _land(self, key: Hashable, broadcast: _Broadcast[T]) -> None:
+        with self._lock:
+            if self._flights.get(key) is broadcast:
+                del self._flights[key]
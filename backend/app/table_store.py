@@ -0,0 +1,347 @@
+# Structured table store: catalog table rows in SQLite with unit-parsed numeric values,
+# so constraint-style questions ("needles shorter than 20 mm, 27G") become indexed
+# range queries instead of a similarity search the LLM has to filter.
+
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from langchain_core.documents import Document
+
+from app.extraction import ARTICLE_NUMBER_RE
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+_NUMBER = r"\d+(?:[.,]\d+)?"
+
+# Canonical unit and scale factor per spelling. Gauge ("G") and gram ("g") differ only
+# in case, so unit matching is case-sensitive except where listed twice.
+_UNITS: dict[str, tuple[str, float]] = {
+    "mm": ("mm", 1.0),
+    "cm": ("mm", 10.0),
+    "m": ("mm", 1000.0),
+    "µl": ("ml", 0.001),
+    "ml": ("ml", 1.0),
+    "mL": ("ml", 1.0),
+    "l": ("ml", 1000.0),
+    "L": ("ml", 1000.0),
+    "g": ("g", 1.0),
+    "kg": ("g", 1000.0),
+    "G": ("G", 1.0),
+    "Fr": ("Fr", 1.0),
+    "Ch": ("Fr", 1.0),
+    "CH": ("Fr", 1.0),
+    "%": ("%", 1.0),
+}
+_UNIT = "|".join(sorted((re.escape(unit) for unit in _UNITS), key=len, reverse=True))
+
+# A number, optionally chained with "x" ("0,45 x 25 mm"), then an optional unit
+_QUANTITY_RE = re.compile(
+    rf"(?P<numbers>{_NUMBER}(?:\s*[x×]\s*{_NUMBER})*)\s*(?P<unit>{_UNIT})?(?!\w)"
+)
+_HEADER_UNIT_RE = re.compile(rf"(?:\(|\[|\s|^)(?P<unit>{_UNIT})(?:\)|\]|$)")
+
+_LESS = r"(?i:less|shorter|smaller|thinner|lower|under|below|up to|at most|max(?:imum)?|kleiner|kürzer|unter|bis|höchstens)|<=?|≤"
+_MORE = r"(?i:more|longer|larger|bigger|greater|thicker|higher|over|above|at least|min(?:imum)?|größer|länger|über|mindestens)|>=?|≥"
+_BETWEEN_RE = re.compile(
+    rf"\b(?i:between|zwischen)\s+(?P<low>{_NUMBER})\s*(?P<low_unit>{_UNIT})?\s+(?i:and|und)\s+(?P<high>{_NUMBER})\s*(?P<unit>{_UNIT})(?!\w)"
+)
+_COMPARISON_RE = re.compile(
+    rf"(?:(?P<less>{_LESS})|(?P<more>{_MORE}))\s*(?i:than|als)?\s*(?P<value>{_NUMBER})\s*(?P<unit>{_UNIT})(?!\w)"
+    r"(?:\s+(?P<dim>(?i:diameter|width|length|long|durchmesser|länge|lang)))?"
+)
+_LONG_RE = re.compile(r"(?i:short|long|length|läng|kürz|lang)")
+_SHORT_RE = re.compile(r"(?i:thin|thick|diameter|width|durchmesser|dünn|dick|ø)")
+_GAUGE_RE = re.compile(
+    rf"\bgauge\s*(?P<value>{_NUMBER})(?:\s*G)?\b|\b(?P<value2>{_NUMBER})\s*gauge\b", re.I
+)
+_EQUALS_RE = re.compile(rf"(?<![\w.,])(?P<value>{_NUMBER})\s*(?P<unit>{_UNIT})(?!\w)")
+
+_STOPWORDS = frozenset(
+    "a an the and or with of for in on to than as is are do you have i need show me list "
+    "all which what any that between gauge und mit der die das ein eine für als".split()
+)
+
+
+def _to_float(number: str) -> float:
+    return float(number.replace(",", "."))
+
+
+def _canonical(value: float, unit: str | None) -> tuple[float, str]:
+    if not unit:
+        return value, ""
+    canonical, factor = _UNITS.get(unit, _UNITS.get(unit.lower(), (unit, 1.0)))
+    return value * factor, canonical
+
+
+class Quantity(NamedTuple):
+    value: float
+    unit: str
+    # "long"/"short" for the largest/other values of a dimension chain ("0,45 x 25 mm" is
+    # diameter x length) or a length/diameter column; "" when the value has no known role
+    role: str = ""
+
+
+# Every number in a cell with its canonical unit; numbers without one inherit the
+# column's unit from the header, e.g. "Length (mm)"
+def parse_quantities(
+    text: str, default_unit: str | None = None, default_role: str = ""
+) -> list[Quantity]:
+    if ARTICLE_NUMBER_RE.fullmatch(text.strip()):
+        return []
+    quantities = []
+    for match in _QUANTITY_RE.finditer(text):
+        unit = match.group("unit") or default_unit
+        values = [_to_float(number) for number in re.findall(_NUMBER, match.group("numbers"))]
+        longest = max(values)
+        for value in values:
+            role = default_role
+            if len(values) > 1:
+                role = "long" if value == longest else "short"
+            quantities.append(Quantity(*_canonical(value, unit), role))
+    return quantities
+
+
+def _header_unit(header: str) -> str | None:
+    match = _HEADER_UNIT_RE.search(header)
+    return match.group("unit") if match else None
+
+
+def _role(word: str | None) -> str:
+    if not word:
+        return ""
+    if _LONG_RE.search(word):
+        return "long"
+    return "short" if _SHORT_RE.search(word) else ""
+
+
+@dataclass(frozen=True)
+class Constraint:
+    op: str
+    value: float
+    unit: str
+    role: str = ""
+
+    def __str__(self) -> str:
+        return f"{self.role or 'any'} {self.op} {self.value:g} {self.unit}"
+
+
+# Numeric constraints in a question. Only queries with at least one comparison
+# ("shorter than", "between") count as constraint-style; bare quantities such as
+# "27G" then narrow the match further.
+def parse_constraints(query: str) -> list[Constraint]:
+    constraints: list[Constraint] = []
+    spans: list[tuple[int, int]] = []
+
+    for match in _BETWEEN_RE.finditer(query):
+        unit = match.group("unit")
+        low, low_unit = _canonical(_to_float(match.group("low")), match.group("low_unit") or unit)
+        high, high_unit = _canonical(_to_float(match.group("high")), unit)
+        constraints += [Constraint(">=", low, low_unit), Constraint("<=", high, high_unit)]
+        spans.append(match.span())
+
+    for match in _COMPARISON_RE.finditer(query):
+        if any(start <= match.start() < end for start, end in spans):
+            continue
+        value, unit = _canonical(_to_float(match.group("value")), match.group("unit"))
+        op = "<=" if match.group("less") else ">="
+        role = _role(match.group("dim")) or _role(match.group("less") or match.group("more"))
+        constraints.append(Constraint(op, value, unit, role))
+        spans.append(match.span())
+
+    if not constraints:
+        return []
+
+    for match in _GAUGE_RE.finditer(query):
+        constraints.append(
+            Constraint("=", _to_float(match.group("value") or match.group("value2")), "G")
+        )
+        spans.append(match.span())
+    for match in _EQUALS_RE.finditer(query):
+        if any(start <= match.start() < end for start, end in spans):
+            continue
+        value, unit = _canonical(_to_float(match.group("value")), match.group("unit"))
+        constraints.append(Constraint("=", value, unit))
+
+    return list(dict.fromkeys(constraints))
+
+
+def _keywords(query: str) -> list[str]:
+    text = query
+    for pattern in (_BETWEEN_RE, _COMPARISON_RE, _GAUGE_RE, _EQUALS_RE):
+        text = pattern.sub(" ", text)
+    words = re.findall(r"[^\W\d_]{3,}", text.lower())
+    # Crude plural folding: "needles" should match "needle" and "Nadeln" should match "Nadel"
+    return list(dict.fromkeys(re.sub(r"(e?s|n)$", "", w) for w in words if w not in _STOPWORDS))
+
+
+_SCHEMA = """
+CREATE TABLE tables (
+    table_id INTEGER PRIMARY KEY, chunk_id TEXT, source TEXT, page INTEGER,
+    header TEXT NOT NULL, context TEXT NOT NULL
+);
+CREATE TABLE table_rows (
+    row_id INTEGER PRIMARY KEY, table_id INTEGER NOT NULL, row_num INTEGER NOT NULL,
+    markdown TEXT NOT NULL
+);
+CREATE TABLE row_values (
+    row_id INTEGER NOT NULL, column_name TEXT NOT NULL, unit TEXT NOT NULL, value REAL NOT NULL,
+    role TEXT NOT NULL
+);
+CREATE INDEX row_values_unit_value ON row_values (unit, value);
+CREATE INDEX table_rows_table ON table_rows (table_id);
+"""
+
+
+def _split_row(line: str) -> list[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+# Rebuild the store from the indexed table chunks (the markdown `_table_to_markdown`
+# produced from `page.find_tables()`). Page text gives each table searchable context.
+def save_table_store(path: Path, documents: list[Document]) -> None:
+    # A page's text may be split over several chunks; rejoin them in order
+    page_parts: dict[tuple[Any, Any], list[str]] = {}
+    for doc in documents:
+        if doc.metadata.get("content_type") == "text":
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            page_parts.setdefault(key, []).append(doc.page_content)
+    page_text = {key: "\n".join(parts) for key, parts in page_parts.items()}
+
+    staging = path.with_name(path.name + ".tmp")
+    staging.unlink(missing_ok=True)
+    conn = sqlite3.connect(staging)
+    conn.executescript(_SCHEMA)
+
+    num_rows = 0
+    for doc in documents:
+        if doc.metadata.get("content_type") != "table":
+            continue
+        lines = doc.page_content.split("\n")
+        if len(lines) < 3:
+            continue
+
+        headers = _split_row(lines[0])
+        units = [_header_unit(header) for header in headers]
+        roles = [_role(header) for header in headers]
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        cursor = conn.execute(
+            "INSERT INTO tables (chunk_id, source, page, header, context) VALUES (?, ?, ?, ?, ?)",
+            (
+                doc.metadata.get("chunk_id"),
+                key[0],
+                key[1],
+                "\n".join(lines[:2]),
+                page_text.get(key, "")[:1000].lower(),
+            ),
+        )
+        table_id = cursor.lastrowid
+
+        for row_num, line in enumerate(lines[2:], start=1):
+            cursor = conn.execute(
+                "INSERT INTO table_rows (table_id, row_num, markdown) VALUES (?, ?, ?)",
+                (table_id, row_num, line),
+            )
+            values = [
+                (cursor.lastrowid, header, quantity.unit, quantity.value, quantity.role)
+                for header, unit, role, cell in zip(headers, units, roles, _split_row(line))
+                for quantity in parse_quantities(cell, unit, role)
+                if quantity.unit
+            ]
+            conn.executemany("INSERT INTO row_values VALUES (?, ?, ?, ?, ?)", values)
+            num_rows += 1
+
+    conn.commit()
+    conn.close()
+    os.replace(staging, path)
+    log.info("table_store_saved", num_rows=num_rows)
+
+
+_OPS = {"<=": "value <= ?", ">=": "value >= ?", "=": "abs(value - ?) < 1e-6"}
+
+
+class TableStore:
+    def __init__(self, path: Path, max_rows: int = 20) -> None:
+        self.max_rows = max_rows
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        # SQLite's lower() only folds ASCII; catalog text is German
+        self._conn.create_function("casefold", 1, str.casefold, deterministic=True)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Rows satisfying every constraint and matching at least one query keyword in the row,
+    # its header or the page text, best matches first; grouped back into one compact table
+    # per source table. Without a keyword match the numbers alone say nothing about the
+    # product, so nothing is returned and the question goes through normal retrieval.
+    def filter(self, query: str) -> list[Document]:
+        constraints = parse_constraints(query)
+        keywords = [kw.casefold() for kw in _keywords(query)]
+        if not constraints or not keywords:
+            return []
+
+        # A constraint with a role ("shorter than") skips values known to have the other role
+        clauses, params = [], []
+        for c in constraints:
+            clause = f"SELECT row_id FROM row_values WHERE unit = ? AND {_OPS[c.op]}"
+            params += [c.unit, c.value]
+            if c.role:
+                clause += " AND role IN (?, '')"
+                params.append(c.role)
+            clauses.append(clause)
+        sql = " INTERSECT ".join(clauses)
+        score = " + ".join("(instr(haystack, ?) > 0)" for _ in keywords)
+        # Ranked in SQL so the row limit applies after ranking, not before
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM ("
+                f"SELECT row_id, markdown, table_id, header, context, source, page, chunk_id, {score} AS score"
+                " FROM (SELECT r.row_id, r.markdown, t.table_id, t.header, t.context, t.source, t.page,"
+                " t.chunk_id, casefold(r.markdown || ' ' || t.header || ' ' || t.context) AS haystack"
+                f" FROM table_rows r JOIN tables t USING (table_id) WHERE r.row_id IN ({sql})))"
+                " WHERE score > 0 ORDER BY score DESC, row_id LIMIT ?",
+                [*keywords, *params, self.max_rows],
+            ).fetchall()
+
+        log.info(
+            "table_filter",
+            constraints=[str(c) for c in constraints],
+            keywords=keywords,
+            matched=len(rows),
+        )
+        return _group_rows(rows, constraints)
+
+
+def _group_rows(rows: list[tuple], constraints: list[Constraint]) -> list[Document]:
+    tables: dict[int, list[tuple]] = {}
+    for row in rows:
+        tables.setdefault(row[2], []).append(row)
+
+    description = ", ".join(str(c) for c in constraints)
+    return [
+        Document(
+            page_content="\n".join([group[0][3], *(row[1] for row in group)]),
+            metadata={
+                "source": group[0][5],
+                "page": group[0][6],
+                "chunk_id": group[0][7],
+                "content_type": "table",
+                "match_type": "Filter Match",
+                "table_filter": description,
+            },
+        )
+        for group in tables.values()
+    ]
+
+
+def load_table_store(path: Path, max_rows: int = 20) -> TableStore | None:
+    if not path.exists():
+        return None
+    return TableStore(path, max_rows=max_rows)
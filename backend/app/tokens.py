@@ -0,0 +1,40 @@
+# Token counting for batching and prompt budgets.
+
+from functools import cache
+from typing import Any
+
+from app.log import get_logger
+
+log = get_logger(__name__)
+
+
+# tiktoken downloads its BPE files on first use; without network access fall back to
+# a conservative characters-per-token estimate (catalog text is dense with numbers).
+@cache
+def _encoding() -> Any | None:
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as exc:
+        log.warning("tiktoken_unavailable", error=str(exc))
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 3 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# Cut text to at most max_tokens, marking the cut so the reader knows it was shortened
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    encoding = _encoding()
+    if encoding is None:
+        limit = max_tokens * 3
+        return text if len(text) <= limit else text[:limit] + " …"
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]) + " …"
@@ -0,0 +1,130 @@
+# Per-query latency of the sparse BM25 scorer on synthetic catalog-like corpora.
+#
+#   python benchmarks/bm25_bench.py --sizes 10000 100000 1000000
+#
+# Corpora are generated directly as token-id arrays with a Zipf-distributed vocabulary
+# plus article numbers, so building a 1M-chunk index does not dominate the run. When
+# rank_bm25 is installed (dev extra) it is timed as the baseline for corpora up to
+# --baseline-max chunks.
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.bm25 import BM25Index  # noqa: E402
+
+
+def synthetic_corpus(
+    num_docs: int, vocab_size: int, mean_len: int, rng: np.random.Generator
+) -> tuple[dict[str, int], np.ndarray, np.ndarray, np.ndarray]:
+    words = [f"w{i}" for i in range(vocab_size)] + [f"{4_000_000 + i}" for i in range(num_docs)]
+    vocab = {word: i for i, word in enumerate(words)}
+
+    doc_len = rng.poisson(mean_len, num_docs).clip(5).astype(np.float32)
+    token_docs = np.repeat(np.arange(num_docs, dtype=np.int64), doc_len.astype(np.int64))
+    term_ids = (rng.zipf(1.3, len(token_docs)) - 1) % vocab_size
+
+    # One article number per chunk, as in the catalog's product tables
+    starts = np.concatenate([[0], np.cumsum(doc_len.astype(np.int64))[:-1]])
+    term_ids[starts] = vocab_size + np.arange(num_docs)
+    return vocab, term_ids.astype(np.int64), token_docs, doc_len
+
+
+def queries(
+    num_queries: int, vocab_size: int, num_docs: int, rng: np.random.Generator
+) -> list[str]:
+    result = []
+    for _ in range(num_queries):
+        words = [f"w{(rng.zipf(1.3) - 1) % vocab_size}" for _ in range(rng.integers(2, 6))]
+        if rng.random() < 0.3:
+            words.append(f"{4_000_000 + rng.integers(num_docs)}")
+        result.append(" ".join(words))
+    return result
+
+
+def percentiles(samples_ms: list[float]) -> dict[str, float]:
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def bench_sparse(index: BM25Index, query_set: list[str], k: int) -> dict[str, float]:
+    samples = []
+    for query in query_set:
+        start = time.perf_counter()
+        index.top_k(query, k)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def bench_rank_bm25(
+    vocab: dict[str, int], term_ids: np.ndarray, doc_len: np.ndarray, query_set: list[str], k: int
+) -> dict[str, float] | None:
+    try:
+        from rank_bm25 import BM25Okapi
+    except ImportError:
+        return None
+
+    words = list(vocab)
+    bounds = np.concatenate([[0], np.cumsum(doc_len.astype(np.int64))])
+    corpus = [[words[t] for t in term_ids[bounds[i] : bounds[i + 1]]] for i in range(len(doc_len))]
+    bm25 = BM25Okapi(corpus)
+
+    samples = []
+    for query in query_set:
+        start = time.perf_counter()
+        scores = bm25.get_scores(query.split())
+        np.argsort(scores)[::-1][:k]
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="BM25 per-query latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--mean-len", type=int, default=40)
+    parser.add_argument("--baseline-max", type=int, default=100_000)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for size in args.sizes:
+        vocab, term_ids, token_docs, doc_len = synthetic_corpus(
+            size, args.vocab, args.mean_len, rng
+        )
+
+        start = time.perf_counter()
+        index = BM25Index.from_tokens(vocab, term_ids, token_docs, doc_len)
+        build_s = time.perf_counter() - start
+
+        query_set = queries(args.queries, args.vocab, size, rng)
+        row: dict[str, object] = {
+            "chunks": size,
+            "postings": len(index.doc_ids),
+            "build_s": round(build_s, 2),
+            "sparse": bench_sparse(index, query_set, args.k),
+        }
+        if size <= args.baseline_max:
+            row["rank_bm25"] = bench_rank_bm25(vocab, term_ids, doc_len, query_set, args.k)
+        results.append(row)
+        print(json.dumps(row), flush=True)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
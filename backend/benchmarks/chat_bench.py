@@ -0,0 +1,302 @@
+# End-to-end /chat benchmark against the OpenRouter stub, fully offline.
+#
+#   python benchmarks/chat_bench.py --pages 200 --requests 200 --concurrency 16 \
+#       --output results.json [--baseline previous.json]
+#
+# Generates a synthetic catalog PDF (text plus a ruled product table per page), starts
+# stub_openrouter.py and the app (uvicorn) as subprocesses with a fresh index directory,
+# waits for /ready, then drives /chat at a fixed concurrency. Reports p50/p95/p99
+# time-to-first-status and time-to-answer, throughput, and per-node latency: status events
+# are sent as each graph node finishes, so a node's time is the gap since the previous
+# event ("(answer)" is the time from the last status to the answer). Results are written as JSON; --baseline prints the change against an earlier run.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+import fitz
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_PRODUCTS = [
+    ("Omnifix", "syringe", "ml", [1, 2, 3, 5, 10, 20, 50]),
+    ("Sterican", "needle", "mm", [12, 16, 25, 30, 40, 50]),
+    ("Introcan", "IV catheter", "mm", [19, 25, 32, 45, 50]),
+    ("Injekt", "syringe", "ml", [2, 5, 10, 20]),
+    ("Perifix", "epidural set", "mm", [80, 90, 100]),
+    ("Discofix", "stopcock", "cm", [10, 25, 50, 100]),
+]
+_GAUGES = ["18G", "20G", "21G", "22G", "23G", "25G", "26G", "27G"]
+
+
+def _draw_table(page: fitz.Page, top: float, rows: list[list[str]]) -> None:
+    widths = [110, 150, 90, 90]
+    height = 18
+    for r, row in enumerate(rows):
+        x = 50.0
+        for width, cell in zip(widths, row):
+            rect = fitz.Rect(x, top + r * height, x + width, top + (r + 1) * height)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.5)
+            page.insert_text((rect.x0 + 3, rect.y1 - 5), cell, fontsize=8)
+            x += width
+
+
+# Returns the article numbers printed in the catalog, for ID lookups in the query mix
+def synthetic_catalog(path: Path, pages: int, rng: random.Random) -> list[str]:
+    doc = fitz.open()
+    article_numbers = []
+    for page_num in range(pages):
+        brand, kind, unit, sizes = _PRODUCTS[page_num % len(_PRODUCTS)]
+        page = doc.new_page()
+        page.insert_text((50, 60), f"{brand}® {kind} range (series {page_num})", fontsize=14)
+        page.insert_textbox(
+            fitz.Rect(50, 75, 550, 160),
+            f"{brand}® {kind}s for single use, sterile, latex-free. Available in "
+            f"{', '.join(f'{s} {unit}' for s in sizes)}. Luer lock and Luer slip variants. "
+            f"Packaging unit 100 pieces per box, series {page_num}.",
+            fontsize=9,
+        )
+        rows = [["Art.-Nr.", "Description", "Size", "Gauge"]]
+        for size in sizes:
+            article_number = f"{4_600_000 + page_num * 10 + len(rows)}"
+            article_numbers.append(article_number)
+            rows.append([article_number, f"{brand} {kind}", f"{size} {unit}", rng.choice(_GAUGES)])
+        _draw_table(page, 180, rows)
+    doc.save(path)
+    doc.close()
+    return article_numbers
+
+
+def query_mix(count: int, article_numbers: list[str], rng: random.Random) -> list[str]:
+    templates = [
+        lambda: f"Which {rng.choice(_PRODUCTS)[1]} sizes are available?",
+        lambda: f"What is the article number of the {rng.choice([2, 5, 10])} ml Omnifix syringe?",
+        lambda: f"Needles shorter than {rng.choice([16, 25, 30])} mm in {rng.choice(_GAUGES)}",
+        lambda: f"Art.-Nr. {rng.choice(article_numbers)}",
+        lambda: f"Tell me about {rng.choice(_PRODUCTS)[0]} packaging",
+        lambda: rng.choice(["Hi", "Thanks", "Who are you?"]),
+    ]
+    return [rng.choice(templates)() for _ in range(count)]
+
+
+def percentiles(samples_ms: list[float]) -> dict[str, float] | None:
+    if not samples_ms:
+        return None
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "mean_ms": round(float(values.mean()), 1),
+    }
+
+
+def wait_until_ready(url: str, process: subprocess.Popen[bytes], timeout_s: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout_s:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with code {process.returncode}")
+        try:
+            response = httpx.get(url, timeout=2)
+        except httpx.TransportError:
+            time.sleep(0.2)
+            continue
+        if response.status_code == 200:
+            return time.perf_counter() - start
+        indexing = response.json().get("indexing") if "ready" in url else None
+        if indexing and indexing["state"] == "failed":
+            raise RuntimeError(f"indexing failed: {indexing['error']}")
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout_s}s")
+
+
+async def one_chat(client: httpx.AsyncClient, query: str) -> dict[str, Any]:
+    start = time.perf_counter()
+    sample: dict[str, Any] = {"query": query, "first_status_ms": None, "answer_ms": None}
+    nodes: list[tuple[str, float]] = []
+    last = start
+    async with client.stream("POST", "/chat", json={"message": query}) as response:
+        if response.status_code != 200:
+            return {**sample, "error": f"HTTP {response.status_code}"}
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: ") :])
+            now = time.perf_counter()
+            # Token events fall inside a node, so only status and answer events end one
+            if event.get("type") == "status":
+                if sample["first_status_ms"] is None:
+                    sample["first_status_ms"] = (now - start) * 1000
+                nodes.append((event["message"], (now - last) * 1000))
+                last = now
+            elif event.get("type") == "answer":
+                sample["answer_ms"] = (now - start) * 1000
+                nodes.append(("(answer)", (now - last) * 1000))
+                last = now
+    sample["nodes"] = nodes
+    if sample["answer_ms"] is None:
+        sample["error"] = "no answer event"
+    return sample
+
+
+async def drive(base_url: str, queries: list[str], concurrency: int) -> dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+
+        async def bounded(query: str) -> dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await one_chat(client, query)
+                except httpx.HTTPError as exc:
+                    return {"query": query, "error": repr(exc)}
+
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(bounded(query) for query in queries))
+        wall_s = time.perf_counter() - start
+
+    completed = [s for s in samples if not s.get("error")]
+    per_node: dict[str, list[float]] = defaultdict(list)
+    for sample in completed:
+        for label, duration_ms in sample["nodes"]:
+            per_node[label].append(duration_ms)
+
+    errors: dict[str, int] = defaultdict(int)
+    for sample in samples:
+        if sample.get("error"):
+            errors[sample["error"]] += 1
+
+    return {
+        "requests": len(samples),
+        "completed": len(completed),
+        "errors": dict(errors),
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(completed) / wall_s, 2) if wall_s else 0.0,
+        "time_to_first_status": percentiles(
+            [s["first_status_ms"] for s in completed if s["first_status_ms"] is not None]
+        ),
+        "time_to_answer": percentiles([s["answer_ms"] for s in completed]),
+        "nodes": {label: percentiles(values) for label, values in sorted(per_node.items())},
+    }
+
+
+# Relative change of every shared numeric metric, e.g. {"time_to_answer.p95_ms": -0.12}
+def compare(
+    current: dict[str, Any], baseline: dict[str, Any], prefix: str = ""
+) -> dict[str, float]:
+    changes: dict[str, float] = {}
+    for key, value in current.items():
+        old = baseline.get(key)
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(old, dict):
+            changes.update(compare(value, old, f"{name}."))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            changes[name] = round((value - old) / old, 3)
+    return changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end /chat benchmark")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--app-port", type=int, default=8810)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-s", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on")
+    parser.add_argument("--ready-timeout", type=float, default=1800.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", nargs="*", default=[], help="extra app settings, KEY=VALUE")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, help="earlier --output to compare against")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix="chat-bench-"))
+    pdf_path = workdir / "catalog.pdf"
+    article_numbers = synthetic_catalog(pdf_path, args.pages, rng)
+    queries = query_mix(args.requests, article_numbers, rng)
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    env = {
+        **os.environ,
+        "OPENROUTER_API_KEY": "stub",
+        "OPENROUTER_BASE_URL": f"{stub_url}/api/v1",
+        "PDF_PATH": str(pdf_path),
+        "CHROMA_DIR": str(workdir / "chroma"),
+        "ANSWER_CACHE_ENABLED": str(args.answer_cache).lower(),
+        "LOG_LEVEL": "WARNING",
+        # tiktoken's encoding files may not be available offline
+        "EMBEDDING_CHECK_CTX_LENGTH": "false",
+        **dict(item.split("=", 1) for item in args.env),
+    }
+
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).with_name("stub_openrouter.py")),
+            f"--port={args.stub_port}",
+            f"--latency-ms={args.latency_ms}",
+            f"--tokens-per-s={args.tokens_per_s}",
+            f"--error-rate={args.error_rate}",
+            f"--seed={args.seed}",
+        ]
+    )
+    app = None
+    try:
+        wait_until_ready(f"{stub_url}/api/v1/models", stub, timeout_s=30)
+        app = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                f"--port={args.app_port}",
+                f"--workers={args.workers}",
+                "--log-level=warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        index_s = wait_until_ready(f"{app_url}/ready", app, timeout_s=args.ready_timeout)
+
+        results = asyncio.run(drive(app_url, queries, args.concurrency))
+        results = {
+            "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+            "startup_to_ready_s": round(index_s, 2),
+            **results,
+            "stub_requests": httpx.get(f"{stub_url}/api/v1/stats").json(),
+        }
+    finally:
+        for process in (app, stub):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        measured = {k: v for k, v in results.items() if k != "config"}
+        changes = compare(measured, json.loads(args.baseline.read_text()))
+        print(json.dumps({"change_vs_baseline": changes}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
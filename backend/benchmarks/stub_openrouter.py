@@ -0,0 +1,215 @@
+# Local OpenAI-compatible stand-in for OpenRouter: chat completions (streaming included)
+# and embeddings, with configurable latency, token rate and 429 injection, so the app can
+# be benchmarked and load-tested offline.
+#
+#   python benchmarks/stub_openrouter.py --port 8900 --latency-ms 300 --tokens-per-s 80
+#   OPENROUTER_BASE_URL=http://127.0.0.1:8900/api/v1 uvicorn app.main:app
+#
+# Replies are picked from the system prompt so the agent's graph takes its real paths:
+# the router gets "search", the grader keeps the first documents, rewrites echo the query,
+# everything else gets a filler answer. Embeddings are deterministic per input text.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import uvicorn
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class StubConfig:
+    # Delay before the first token (chat) or the whole response (embeddings)
+    latency_ms: float = 200.0
+    # Streaming speed of chat completions; 0 sends all tokens at once
+    tokens_per_s: float = 100.0
+    # Fraction of requests answered with 429 before any work is done
+    error_rate: float = 0.0
+    answer_tokens: int = 120
+    embedding_dim: int = 1536
+    seed: int = 0
+
+
+_FILLER = (
+    "The catalog lists this product with sterile single-use packaging, Luer lock connection "
+    "and the article numbers shown in the table on the referenced page."
+).split()
+
+
+def _reply(messages: list[dict[str, Any]], answer_tokens: int) -> str:
+    system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    human = str(messages[-1].get("content", "")) if messages else ""
+    if "'search' or 'chat'" in system:
+        return "search"
+    if "relevance grader" in system:
+        return "1, 2"
+    if "rewrite" in system.lower() or "standalone" in system.lower():
+        return human.splitlines()[-1][:200]
+    return " ".join(_FILLER[i % len(_FILLER)] for i in range(answer_tokens))
+
+
+def _embedding(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _usage(prompt: str, completion: str) -> dict[str, int]:
+    prompt_tokens, completion_tokens = len(prompt.split()), len(completion.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def create_app(config: StubConfig | None = None) -> FastAPI:
+    config = config or StubConfig()
+    rng = random.Random(config.seed)
+    stats: Counter[str] = Counter()
+    router = APIRouter()
+
+    def rate_limited(kind: str) -> JSONResponse | None:
+        stats[kind] += 1
+        if rng.random() >= config.error_rate:
+            return None
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded (stub)", "type": "rate_limit", "code": 429}},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+
+    @router.get("/models")
+    async def models() -> dict[str, Any]:
+        return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+    @router.post("/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        if error := rate_limited("chat"):
+            return error
+        body = await request.json()
+        completion = _reply(body.get("messages", []), config.answer_tokens)
+        prompt = json.dumps(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "stub")
+        await asyncio.sleep(config.latency_ms / 1000)
+
+        if not body.get("stream"):
+            if config.tokens_per_s:
+                await asyncio.sleep(len(completion.split()) / config.tokens_per_s)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": completion},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(prompt, completion),
+            }
+
+        async def events() -> AsyncIterator[str]:
+            def chunk(delta: dict[str, str], finish: str | None = None) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }
+                return f"data: {json.dumps(payload)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(completion.split()):
+                if config.tokens_per_s:
+                    await asyncio.sleep(1 / config.tokens_per_s)
+                yield chunk({"content": word if i == 0 else f" {word}"})
+            yield chunk({}, finish="stop")
+            if body.get("stream_options", {}).get("include_usage"):
+                usage = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": _usage(prompt, completion),
+                }
+                yield f"data: {json.dumps(usage)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @router.post("/embeddings")
+    async def embeddings(request: Request) -> Any:
+        if error := rate_limited("embeddings"):
+            return error
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        # Token-id inputs (tiktoken pre-splitting) are embedded by their id sequence
+        texts = [text if isinstance(text, str) else json.dumps(text) for text in inputs]
+        await asyncio.sleep(config.latency_ms / 1000)
+        return {
+            "object": "list",
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": _embedding(text, config.embedding_dim),
+                }
+                for i, text in enumerate(texts)
+            ],
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": sum(len(t.split()) for t in texts), "total_tokens": 0},
+        }
+
+    @router.get("/stats")
+    async def get_stats() -> dict[str, int]:
+        return dict(stats)
+
+    app = FastAPI(title="OpenRouter stub")
+    # OpenRouter serves under /api/v1; plain /v1 is what other OpenAI clients assume
+    app.include_router(router, prefix="/api/v1")
+    app.include_router(router, prefix="/v1")
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible OpenRouter stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms)
+    parser.add_argument("--tokens-per-s", type=float, default=StubConfig.tokens_per_s)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--answer-tokens", type=int, default=StubConfig.answer_tokens)
+    parser.add_argument("--embedding-dim", type=int, default=StubConfig.embedding_dim)
+    parser.add_argument("--seed", type=int, default=StubConfig.seed)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        tokens_per_s=args.tokens_per_s,
+        error_rate=args.error_rate,
+        answer_tokens=args.answer_tokens,
+        embedding_dim=args.embedding_dim,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# Recall and per-query latency of the matrix vector backend (float16 / int8) against Chroma's
+# HNSW index on synthetic embedding-like vectors.
+#
+#   python benchmarks/vector_bench.py --sizes 10000 100000 1000000 --dim 1536
+#
+# Vectors are drawn around random cluster centres (embeddings of catalog chunks cluster by
+# product family) and generated block by block, so the float32 ground truth is computed
+# without holding the float32 corpus in memory. Recall@k is measured against that exact
+# float32 search. Chroma is built for corpora up to --chroma-max vectors; beyond that its
+# insert time dominates the run.
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.matrix_store import DTYPES, QuantizedMatrix, normalize  # noqa: E402
+
+_BLOCK = 50_000
+
+
+def cluster_centres(count: int, dim: int, seed: int) -> np.ndarray:
+    return normalize(np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32))
+
+
+# Deterministic per block, so every pass over the corpus sees the same vectors
+def vector_blocks(
+    size: int, centres: np.ndarray, spread: float, seed: int
+) -> Iterator[tuple[int, np.ndarray]]:
+    for start in range(0, size, _BLOCK):
+        rng = np.random.default_rng([seed, start])
+        rows = min(_BLOCK, size - start)
+        noise = rng.standard_normal((rows, centres.shape[1])).astype(np.float32)
+        assigned = centres[rng.integers(len(centres), size=rows)]
+        yield start, normalize(assigned + spread * noise / np.sqrt(centres.shape[1]))
+
+
+def query_vectors(
+    count: int, centres: np.ndarray, spread: float, rng: np.random.Generator
+) -> np.ndarray:
+    noise = rng.standard_normal((count, centres.shape[1])).astype(np.float32)
+    assigned = centres[rng.integers(len(centres), size=count)]
+    return normalize(assigned + spread * noise / np.sqrt(centres.shape[1]))
+
+
+def merge_top_k(
+    best: tuple[np.ndarray, np.ndarray], block: tuple[np.ndarray, np.ndarray], k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    ids = np.concatenate([best[0], block[0]], axis=1)
+    scores = np.concatenate([best[1], block[1]], axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(ids, order, 1), np.take_along_axis(scores, order, 1)
+
+
+def percentiles(samples_ms: list[float]) -> dict[str, float]:
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def recall(found: list[np.ndarray] | np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = [
+        len(set(map(int, row[:k])) & set(map(int, expected))) for row, expected in zip(found, truth)
+    ]
+    return round(sum(hits) / truth.size, 4)
+
+
+def bench_matrix(
+    matrix: QuantizedMatrix, queries: np.ndarray, truth: np.ndarray, k: int, batch: int
+) -> dict[str, object]:
+    samples, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = matrix.top_k(query, k)
+        samples.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch):
+        matrix.top_k(queries[offset : offset + batch], k)
+    batched_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    return {
+        **percentiles(samples),
+        "batched_ms_per_query": round(batched_ms, 3),
+        "recall": recall(found, truth),
+        "bytes": int(
+            matrix.data.nbytes + (matrix.scales.nbytes if matrix.scales is not None else 0)
+        ),
+    }
+
+
+def bench_chroma(
+    size: int,
+    centres: np.ndarray,
+    args: argparse.Namespace,
+    queries: np.ndarray,
+    truth: np.ndarray,
+) -> dict[str, object] | None:
+    try:
+        import chromadb
+    except ImportError:
+        return None
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = chromadb.PersistentClient(path=directory)
+        collection = client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+        max_batch = client.get_max_batch_size()
+
+        start = time.perf_counter()
+        for offset, block in vector_blocks(size, centres, args.spread, args.seed):
+            for i in range(0, len(block), max_batch):
+                rows = block[i : i + max_batch]
+                collection.add(
+                    ids=[str(offset + i + j) for j in range(len(rows))],
+                    embeddings=rows,  # type: ignore[arg-type]
+                )
+        build_s = time.perf_counter() - start
+
+        samples, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=args.k)
+            samples.append((time.perf_counter() - start) * 1000)
+            found.append(np.asarray([int(i) for i in result["ids"][0]]))
+
+    return {**percentiles(samples), "recall": recall(found, truth), "build_s": round(build_s, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vector backend recall/latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=32, help="queries per batched top-k call")
+    parser.add_argument("--clusters", type=int, default=1_000)
+    parser.add_argument("--spread", type=float, default=0.8, help="noise around the centres")
+    parser.add_argument("--dtypes", nargs="+", default=list(DTYPES), choices=DTYPES)
+    parser.add_argument("--chroma-max", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    centres = cluster_centres(args.clusters, args.dim, args.seed)
+    queries = query_vectors(args.queries, centres, args.spread, np.random.default_rng(args.seed))
+
+    results = []
+    for size in args.sizes:
+        # One pass: quantize each block for every dtype and fold it into the exact top-k
+        truth = (
+            np.empty((len(queries), 0), dtype=np.int64),
+            np.empty((len(queries), 0), dtype=np.float32),
+        )
+        parts: dict[str, list[QuantizedMatrix]] = {dtype: [] for dtype in args.dtypes}
+        start = time.perf_counter()
+        for offset, block in vector_blocks(size, centres, args.spread, args.seed):
+            ids, scores = QuantizedMatrix(block).top_k(queries, args.k)
+            truth = merge_top_k(truth, (ids + offset, scores), args.k)
+            for dtype in args.dtypes:
+                parts[dtype].append(QuantizedMatrix.quantize(block, dtype))
+        row: dict[str, object] = {
+            "vectors": size,
+            "dim": args.dim,
+            "k": args.k,
+            "generate_s": round(time.perf_counter() - start, 2),
+        }
+
+        for dtype in args.dtypes:
+            matrix = QuantizedMatrix.concat(parts.pop(dtype))
+            row[f"matrix_{dtype}"] = bench_matrix(matrix, queries, truth[0], args.k, args.batch)
+            del matrix
+        if size <= args.chroma_max:
+            row["chroma_hnsw"] = bench_chroma(size, centres, args, queries, truth[0])
+
+        results.append(row)
+        print(json.dumps(row), flush=True)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
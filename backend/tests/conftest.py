@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 
@@ -5,3 +6,6 @@ BACKEND_ROOT = Path(__file__).resolve().parents[1]
 
 if str(BACKEND_ROOT) not in sys.path:
     sys.path.insert(0, str(BACKEND_ROOT))
+
+# app.agent builds its ChatOpenAI client at import time, which requires a key
+os.environ.setdefault("OPENROUTER_API_KEY", "test-key")
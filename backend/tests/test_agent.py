@@ -0,0 +1,294 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from app import agent
+from app.config import settings
+from app.grading import PrefilterResult
+from app.memory import Conversation
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from prometheus_client import REGISTRY
+
+
+def _state(documents: list[Document]) -> agent.AgentState:
+    return {
+        "query": "Omnifix syringes",
+        "documents": documents,
+        "generation": "",
+        "query_rewritten": False,
+        "route": "search",
+    }
+
+
+def test_apply_grades_keeps_selected_documents() -> None:
+    docs = [Document(page_content=f"chunk {i}") for i in range(3)]
+
+    state = agent._apply_grades(_state(docs), "1, 3")
+
+    assert [doc.page_content for doc in state["documents"]] == ["chunk 0", "chunk 2"]
+
+
+def test_apply_grades_handles_none() -> None:
+    docs = [Document(page_content="chunk")]
+
+    assert agent._apply_grades(_state(docs), "None")["documents"] == []
+
+
+def test_router_fast_path_skips_llm(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["chat"]))
+
+    state = agent.router({**_state([]), "query": "Art.-Nr. 4606051V"})
+
+    assert state["route"] == "search"
+
+
+def test_grader_passes_exact_matches_through(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["none"]))
+    monkeypatch.setattr(settings, "grader_prefilter_enabled", False)
+    exact = Document(page_content="| 4550242 | Omnifix |", metadata={"exact_match": True})
+    other = Document(page_content="unrelated")
+
+    assert agent.grade_documents(_state([exact]))["documents"] == [exact]
+    assert agent.grade_documents(_state([exact, other]))["documents"] == [exact]
+
+
+def test_filter_tables_sends_matching_rows_to_generate(monkeypatch: pytest.MonkeyPatch) -> None:
+    rows = Document(page_content="| 4657527 | 0,40 x 12 mm |", metadata={"page": 4})
+
+    class _Store:
+        def filter(self, query: str) -> list[Document]:
+            return [rows] if "shorter" in query else []
+
+    monkeypatch.setattr(agent, "get_table_store", lambda index: _Store())
+
+    state = agent.filter_tables({**_state([]), "query": "needles shorter than 15 mm"})
+    assert state["documents"] == [rows]
+    assert agent.after_filter(state) == "generate"
+    assert agent.after_filter(agent.filter_tables(_state([]))) == "retrieve"
+
+
+@pytest.mark.asyncio
+async def test_grader_only_sends_uncertain_documents_to_llm(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    accepted, rejected, uncertain = (Document(page_content=t) for t in ("a", "b", "c"))
+
+    class _Prefilter:
+        def split(self, query: str, docs: list[Document]) -> PrefilterResult:
+            return PrefilterResult(accepted=[accepted], rejected=[rejected], uncertain=[uncertain])
+
+    monkeypatch.setattr(agent, "grade_prefilter", _Prefilter())
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["1"]))
+
+    state = await agent.agrade_documents(_state([accepted, rejected, uncertain]))
+
+    # "1" refers to the first document in the LLM prompt, which only holds the uncertain one
+    assert state["documents"] == [accepted, uncertain]
+
+
+def _rewrites() -> float:
+    return REGISTRY.get_sample_value("rag_query_rewrites_total") or 0.0
+
+
+def _patch_speculation(monkeypatch: pytest.MonkeyPatch, grade: list[Document]) -> list[str]:
+    calls: list[str] = []
+
+    async def agrade_documents(state: agent.AgentState) -> agent.AgentState:
+        await asyncio.sleep(0.01)
+        return {**state, "documents": grade}
+
+    async def arewrite_query(state: agent.AgentState) -> agent.AgentState:
+        calls.append("rewrite")
+        return {**state, "query": "rewritten", "query_rewritten": True}
+
+    async def aretrieve(state: agent.AgentState, config: object = None) -> agent.AgentState:
+        await asyncio.sleep(0.05)
+        calls.append("retrieve")
+        return {**state, "documents": [Document(page_content=state["query"])]}
+
+    monkeypatch.setattr(agent, "agrade_documents", agrade_documents)
+    monkeypatch.setattr(agent, "arewrite_query", arewrite_query)
+    monkeypatch.setattr(agent, "aretrieve", aretrieve)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_speculative_branch_is_cancelled_when_grade_keeps_documents(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    kept = Document(page_content="kept")
+    calls = _patch_speculation(monkeypatch, grade=[kept])
+    rewrites = _rewrites()
+
+    state = await agent.aspeculative_grade(_state([kept]))
+    await asyncio.sleep(0.1)
+
+    assert state["documents"] == [kept]
+    assert agent.after_speculation(state) == "generate"
+    assert calls == ["rewrite"]
+    # A discarded speculation is not a rewrite
+    assert _rewrites() == rewrites
+
+
+@pytest.mark.asyncio
+async def test_speculative_branch_supplies_rewritten_retrieval(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    calls = _patch_speculation(monkeypatch, grade=[])
+    rewrites = _rewrites()
+
+    state = await agent.aspeculative_grade(_state([Document(page_content="rejected")]))
+
+    assert [d.page_content for d in state["documents"]] == ["rewritten"]
+    assert agent.after_speculation(state) == "grade_documents"
+    assert calls == ["rewrite", "retrieve"]
+    assert _rewrites() == rewrites + 1
+
+
+def test_queued_speculation_runs_inline_when_needed(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    pool.submit(release.wait)
+    threads: list[str] = []
+
+    def rewrite_and_retrieve(state: agent.AgentState, config: object) -> agent.AgentState:
+        threads.append(threading.current_thread().name)
+        return {**state, "documents": [Document(page_content="rewritten")]}
+
+    monkeypatch.setattr(agent, "_speculation_executor", pool)
+    monkeypatch.setattr(agent, "_rewrite_and_retrieve", rewrite_and_retrieve)
+    monkeypatch.setattr(agent, "grade_documents", lambda state: {**state, "documents": []})
+
+    try:
+        state = agent.speculative_grade(_state([Document(page_content="rejected")]))
+    finally:
+        release.set()
+        pool.shutdown()
+
+    assert [d.page_content for d in state["documents"]] == ["rewritten"]
+    assert threads == [threading.current_thread().name]
+
+
+@pytest.mark.asyncio
+async def test_exact_matches_start_no_speculative_rewrite(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    exact = Document(page_content="4606051V", metadata={"exact_match": True})
+    calls = _patch_speculation(monkeypatch, grade=[exact])
+
+    state = await agent.aspeculative_grade(_state([exact]))
+    await asyncio.sleep(0.1)
+
+    assert state["documents"] == [exact]
+    assert agent.after_speculation(state) == "generate"
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_astream_agent_streams_status_and_answer(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["chat", "Hello there!"]))
+    agent.answer_cache.clear()
+    agent.conversations.clear()
+
+    events = [event async for event in agent.astream_agent("Write a poem", "conv-1")]
+
+    assert events[0] == 'data: {"type": "status", "message": "Understanding intent..."}\n\n'
+    tokens = [json.loads(e[6:])["content"] for e in events if '"type": "token"' in e]
+    assert "".join(tokens) == "Hello there!"
+    assert '"answer": "Hello there!"' in events[-1]
+    assert '"conversation_id": "conv-1"' in events[-1]
+
+
+@pytest.mark.asyncio
+async def test_answer_event_carries_node_timings_and_tokens(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["chat", "Hello there!"]))
+    agent.answer_cache.clear()
+    agent.conversations.clear()
+
+    events = [event async for event in agent.astream_agent("Write a poem", "conv-1")]
+    timings = json.loads(events[-1][6:])["timings"]
+
+    assert set(timings["nodes_ms"]) == {"condense_query", "router", "casual_chat"}
+    assert set(timings["tokens"]) == {"router", "casual_chat"}
+    assert timings["tokens"]["casual_chat"]["completion"] > 0
+    assert timings["total_ms"] >= sum(timings["nodes_ms"].values())
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_chats_share_one_graph_run(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    llm = FakeListChatModel(responses=["chat", "Hello there!", "unused"], sleep=0.01)
+    monkeypatch.setattr(agent, "llm", llm)
+    agent.answer_cache.clear()
+    agent.conversations.clear()
+
+    async def chat(query: str, conv_id: str) -> list[str]:
+        return [event async for event in agent.astream_agent(query, conv_id)]
+
+    first, second = await asyncio.gather(
+        chat("Write a poem", "conv-1"), chat("write a poem?", "conv-2")
+    )
+
+    assert llm.i == 2
+    answers = [json.loads(events[-1][6:]) for events in (first, second)]
+    assert [a["conversation_id"] for a in answers] == ["conv-1", "conv-2"]
+    assert [a["answer"] for a in answers] == ["Hello there!"] * 2
+    assert [a["timings"]["coalesced"] for a in answers] == [False, True]
+    assert first[:-1] == second[:-1]
+    assert agent.conversations.get("conv-2").turns == [("write a poem?", "Hello there!")]
+
+
+@pytest.mark.asyncio
+async def test_astream_agent_replays_cached_answer(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["Welcome!"]))
+    agent.answer_cache.clear()
+    agent.conversations.clear()
+
+    first = [event async for event in agent.astream_agent("Hello", "conv-1")]
+    second = [event async for event in agent.astream_agent("hello!", "conv-2")]
+
+    answer, replay = json.loads(first[-1][6:]), json.loads(second[0][6:])
+    assert len(second) == 1
+    assert replay["timings"]["nodes_ms"] == {}
+    assert {**replay, "timings": None} == {**answer, "conversation_id": "conv-2", "timings": None}
+
+
+@pytest.mark.asyncio
+async def test_follow_up_is_condensed_with_conversation_history(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        agent,
+        "llm",
+        FakeListChatModel(responses=["Hi!", "Write a poem about syringes", "chat", "Roses"]),
+    )
+    agent.answer_cache.clear()
+    agent.conversations.clear()
+
+    [event async for event in agent.astream_agent("Hello", "conv-1")]
+    events = [event async for event in agent.astream_agent("about syringes", "conv-1")]
+
+    assert json.loads(events[-1][6:])["answer"] == "Roses"
+    assert agent.conversations.get("conv-1").turns == [
+        ("Hello", "Hi!"),
+        ("about syringes", "Roses"),
+    ]
+
+
+def test_long_history_is_folded_into_a_summary(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(agent, "llm", FakeListChatModel(responses=["User asked about syringes."]))
+    monkeypatch.setattr(settings, "memory_history_tokens", 10)
+    monkeypatch.setattr(settings, "memory_recent_turns", 1)
+    turns = [(f"question {i}", f"answer {i}") for i in range(3)]
+
+    agent.compact_conversation("conv-2", Conversation(turns=turns))
+
+    stored = agent.conversations.get("conv-2")
+    assert stored.summary == "User asked about syringes."
+    assert stored.turns == [("question 2", "answer 2")]
@@ -0,0 +1,60 @@
+from app.answer_cache import AnswerCache, normalize_query
+from langchain_core.embeddings import Embeddings
+
+
+class _ConstantEmbeddings(Embeddings):
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [1.0, 0.0]
+
+
+def test_normalize_query_ignores_case_whitespace_and_punctuation() -> None:
+    assert normalize_query("  What is  Omnifix? ") == "what is omnifix"
+
+
+def test_answer_cache_invalidates_on_index_version_change() -> None:
+    version = 1
+    cache = AnswerCache(max_entries=10, ttl_s=60, index_version=lambda: version)
+    cache.put("Omnifix sizes?", {"answer": "1-50 ml"})
+
+    assert cache.get("omnifix sizes") == {"answer": "1-50 ml"}
+
+    version = 2
+    assert cache.get("omnifix sizes") is None
+
+
+def test_answers_from_a_replaced_index_are_not_stored() -> None:
+    version = 2
+    cache = AnswerCache(max_entries=10, ttl_s=60, index_version=lambda: version)
+
+    # The turn pinned version 1; a hot-swap to version 2 happened before it finished
+    cache.put("Omnifix sizes?", {"answer": "old catalog"}, index_version=1)
+    assert cache.get("omnifix sizes") is None
+
+    cache.put("Omnifix sizes?", {"answer": "1-50 ml"}, index_version=2)
+    assert cache.get("omnifix sizes") == {"answer": "1-50 ml"}
+
+
+def test_answer_cache_evicts_least_recently_used() -> None:
+    cache = AnswerCache(max_entries=1, ttl_s=60, index_version=lambda: 0)
+    cache.put("first", {"answer": "1"})
+    cache.put("second", {"answer": "2"})
+
+    assert cache.get("first") is None
+    assert cache.get("second") == {"answer": "2"}
+
+
+def test_semantic_match_requires_identical_numbers() -> None:
+    cache = AnswerCache(
+        max_entries=10,
+        ttl_s=60,
+        index_version=lambda: 0,
+        similarity_threshold=0.9,
+        embeddings=_ConstantEmbeddings,
+    )
+    cache.put("Art.-Nr. 4550242", {"answer": "Omnifix 2 ml"})
+
+    assert cache.get("Look up Art.-Nr. 4550242") == {"answer": "Omnifix 2 ml"}
+    assert cache.get("Art.-Nr. 4550243") is None
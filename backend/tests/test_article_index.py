@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from app.article_index import (
+    ArticleRetriever,
+    is_id_only,
+    load_article_index,
+    save_article_index,
+)
+from app.bm25 import load_bm25_index, save_bm25_index
+from langchain_core.documents import Document
+
+TABLE = (
+    "| Art.-Nr. | Description |\n| --- | --- |\n| 4606051V | Solo 5 ml |\n| 4606108V | Solo 10 ml |"
+)
+
+DOCS = [
+    Document(page_content="Omnifix syringes overview", metadata={"page": 1}),
+    Document(
+        page_content=TABLE,
+        metadata={"page": 2, "article_numbers": json.dumps({"4606051V": 1, "4606108V": 2})},
+    ),
+]
+
+
+def test_article_retriever_resolves_ids_to_table_rows(tmp_path: Path) -> None:
+    save_bm25_index(tmp_path / "bm25", DOCS)
+    save_article_index(tmp_path / "articles.json", DOCS)
+    loaded = load_bm25_index(tmp_path / "bm25")
+    index = load_article_index(tmp_path / "articles.json")
+    assert loaded is not None and index is not None
+
+    docs = ArticleRetriever(index=index, chunks=loaded[1]).invoke("Price of art.-nr. 4606108v?")
+
+    assert len(docs) == 1
+    assert docs[0].page_content.splitlines()[-1] == "| 4606108V | Solo 10 ml |"
+    assert docs[0].metadata["exact_match"] is True
+    assert (docs[0].metadata["page"], docs[0].metadata["table_row"]) == (2, 2)
+
+
+def test_load_article_index_returns_none_when_missing(tmp_path: Path) -> None:
+    assert load_article_index(tmp_path / "missing.json") is None
+
+
+def test_is_id_only() -> None:
+    assert is_id_only("Art.-Nr. 4606051V")
+    assert is_id_only("4550242, 4606108V")
+    assert not is_id_only("Is 4550242 latex free?")
@@ -0,0 +1,72 @@
+from pathlib import Path
+
+from app.bm25 import (
+    BM25Index,
+    PersistedBM25Retriever,
+    load_bm25_index,
+    save_bm25_index,
+    tokenize,
+)
+from langchain_core.documents import Document
+
+DOCS = [
+    Document(page_content="Omnifix Luer Solo syringe 2 ml", metadata={"page": 1}),
+    Document(page_content="Sterican needle 0.45 x 25 mm", metadata={"page": 2}),
+    Document(page_content="Injekt syringe 5 ml Luer", metadata={"page": 3}),
+]
+
+
+def test_bm25_index_round_trips_through_disk(tmp_path: Path) -> None:
+    built = save_bm25_index(tmp_path / "bm25", DOCS)
+    loaded = load_bm25_index(tmp_path / "bm25")
+
+    assert loaded is not None
+    index, chunks = loaded
+    assert index.num_docs == 3
+    assert (index.scores("syringe Luer") == built.scores("syringe Luer")).all()
+    assert chunks.get(1) == DOCS[1]
+
+
+def test_persisted_retriever_ranks_matching_chunks_first(tmp_path: Path) -> None:
+    save_bm25_index(tmp_path / "bm25", DOCS)
+    loaded = load_bm25_index(tmp_path / "bm25")
+    assert loaded is not None
+
+    retriever = PersistedBM25Retriever(index=loaded[0], chunks=loaded[1], k=2)
+
+    docs = retriever.invoke("Sterican needle")
+
+    assert docs[0].metadata["page"] == 2
+    assert docs[0].metadata["bm25_score"] > 0
+
+
+def test_persisted_retriever_drops_chunks_without_matching_terms(tmp_path: Path) -> None:
+    save_bm25_index(tmp_path / "bm25", DOCS)
+    loaded = load_bm25_index(tmp_path / "bm25")
+    assert loaded is not None
+
+    retriever = PersistedBM25Retriever(index=loaded[0], chunks=loaded[1], k=3)
+
+    assert retriever.invoke("unrelated words") == []
+
+
+def test_load_bm25_index_returns_none_when_missing(tmp_path: Path) -> None:
+    assert load_bm25_index(tmp_path / "missing") is None
+
+
+def test_tokenize_keeps_catalog_identifiers_intact() -> None:
+    assert tokenize("Omnifix Art.-Nr. 4606051V, 0,45 x 25 mm") == [
+        "omnifix",
+        "art.-nr.",
+        "4606051v",
+        "0,45",
+        "x",
+        "25",
+        "mm",
+    ]
+
+
+def test_top_k_matches_full_sort() -> None:
+    index = BM25Index.build([doc.page_content for doc in DOCS])
+
+    assert list(index.top_k("syringe Luer 5 ml", 2)) == [2, 0]
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+from app.embeddings import CachedEmbeddings, EmbeddingCache
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+
+class _CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.calls += 1
+        return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(0.01)
+        return self.embed_query(text)
+
+
+def _cache(path: Path) -> EmbeddingCache:
+    return EmbeddingCache(path / "cache.sqlite3", model="test", max_memory=2, max_disk=100)
+
+
+def test_cached_embeddings_skip_repeat_queries(tmp_path: Path) -> None:
+    underlying = _CountingEmbeddings(size=4)
+    embeddings = CachedEmbeddings(underlying, _cache(tmp_path))
+
+    first = embeddings.embed_query("Omnifix syringes")
+    second = embeddings.embed_query("Omnifix syringes")
+
+    assert first == second
+    assert underlying.calls == 1
+    assert embeddings.cache.stats()["hits"] == 1
+
+
+def test_cached_embeddings_persist_across_instances(tmp_path: Path) -> None:
+    CachedEmbeddings(_CountingEmbeddings(size=4), _cache(tmp_path)).embed_documents(["a", "b"])
+
+    underlying = _CountingEmbeddings(size=4)
+    vectors = CachedEmbeddings(underlying, _cache(tmp_path)).embed_documents(["b", "c", "a"])
+
+    assert len(vectors) == 3
+    assert underlying.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_misses_share_one_call(tmp_path: Path) -> None:
+    underlying = _CountingEmbeddings(size=4)
+    embeddings = CachedEmbeddings(underlying, _cache(tmp_path))
+
+    vectors = await asyncio.gather(*(embeddings.aembed_query("Omnifix") for _ in range(5)))
+
+    assert underlying.calls == 1
+    assert all(vector == vectors[0] for vector in vectors)
+
+
+def test_disk_is_pruned_to_its_bound_keeping_recently_read_rows(tmp_path: Path) -> None:
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", model="test", max_memory=1, max_disk=10)
+    cache.put_many(["keep"], [[1.0]])
+    for i in range(30):
+        cache.put_many([f"text {i}"], [[float(i)]])
+        cache.get_many(["keep"] if i % 2 else ["text 0"])  # disk hits once "keep" left memory
+
+    assert 9 <= cache._count_disk() <= 10
+    assert _cache_row_exists(tmp_path, "keep")
+
+
+def _cache_row_exists(path: Path, text: str) -> bool:
+    return EmbeddingCache(path / "cache.sqlite3", model="test", max_memory=1, max_disk=10).get_many(
+        [text]
+    ) != [None]
+
+
+@pytest.mark.asyncio
+async def test_async_lookups_read_the_disk_off_the_event_loop(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _cache(tmp_path).put_many(["Omnifix"], [[0.5, 0.5]])
+    cache = _cache(tmp_path)
+    threads: list[int] = []
+    lookup = EmbeddingCache._lookup
+
+    def spy(self: EmbeddingCache, keys: list[str], disk: bool) -> dict[str, list[float]]:
+        if disk:
+            threads.append(threading.get_ident())
+        return lookup(self, keys, disk)
+
+    monkeypatch.setattr(EmbeddingCache, "_lookup", spy)
+
+    assert await cache.aget_many(["Omnifix"]) == [[0.5, 0.5]]
+    assert await cache.aget_many(["Omnifix"]) == [[0.5, 0.5]]  # memory hit, no disk read
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
@@ -0,0 +1,143 @@
+from pathlib import Path
+
+import fitz
+import pytest
+from app.config import settings
+from app.extraction import (
+    _split_table,
+    _split_text,
+    extract_article_numbers,
+    extract_chunks_from_pdf,
+    resolve_pdf_paths,
+)
+from app.tokens import count_tokens
+
+
+def _write_pdf(path: Path, num_pages: int) -> None:
+    doc = fitz.open()
+    for page in range(num_pages):
+        doc.new_page().insert_text(
+            (72, 72),
+            f"{path.stem} page {page + 1}: Omnifix Luer Solo syringe 2 ml, sterile, single use",
+        )
+    doc.save(path)
+    doc.close()
+
+
+def test_resolve_pdf_paths_accepts_directory_and_glob(tmp_path: Path) -> None:
+    for name in ["b.pdf", "a.pdf"]:
+        _write_pdf(tmp_path / name, 1)
+    (tmp_path / "notes.txt").write_text("not a pdf")
+
+    assert resolve_pdf_paths(str(tmp_path)) == [tmp_path / "a.pdf", tmp_path / "b.pdf"]
+    assert resolve_pdf_paths(str(tmp_path / "b*.pdf")) == [tmp_path / "b.pdf"]
+    assert resolve_pdf_paths(str(tmp_path / "a.pdf")) == [tmp_path / "a.pdf"]
+
+
+def test_parallel_extraction_keeps_page_order(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "ingest_workers", 2)
+    monkeypatch.setattr(settings, "ingest_pages_per_task", 1)
+    _write_pdf(tmp_path / "a.pdf", 3)
+    _write_pdf(tmp_path / "b.pdf", 2)
+
+    chunks = extract_chunks_from_pdf(str(tmp_path))
+
+    assert [(c.metadata["source"], c.metadata["page"]) for c in chunks] == [
+        ("a.pdf", 1),
+        ("a.pdf", 2),
+        ("a.pdf", 3),
+        ("b.pdf", 1),
+        ("b.pdf", 2),
+    ]
+
+
+def test_sources_are_relative_to_the_ingest_root(tmp_path: Path) -> None:
+    for directory in ["2023", "2024"]:
+        (tmp_path / directory).mkdir()
+        _write_pdf(tmp_path / directory / "catalog.pdf", 1)
+
+    chunks = extract_chunks_from_pdf(str(tmp_path / "**" / "*.pdf"))
+
+    assert [c.metadata["source"] for c in chunks] == ["2023/catalog.pdf", "2024/catalog.pdf"]
+    assert (
+        extract_chunks_from_pdf(str(tmp_path / "2023" / "catalog.pdf"))[0].metadata["source"]
+        == "catalog.pdf"
+    )
+
+
+def test_extract_article_numbers_maps_ids_to_rows() -> None:
+    table: list[list[str | None]] = [
+        ["Art.-Nr.", "Description", "Pack"],
+        ["4606051V", "Omnifix Solo 5 ml", "100"],
+        ["4606108V / 4606108", "Omnifix Solo 10 ml", "100"],
+        [None, "Accessory", "4550242"],
+    ]
+
+    assert extract_article_numbers(table) == {
+        "4606051V": 1,
+        "4606108V": 2,
+        "4606108": 2,
+        "4550242": 3,
+    }
+
+
+def test_split_text_packs_blocks_under_budget() -> None:
+    blocks = [f"Omnifix Luer Solo syringe {size} ml, sterile, single use" for size in range(1, 30)]
+    blocks.append("\n".join(f"Injekt {size} ml, Luer tip, box of 100" for size in range(30)))
+
+    parts = _split_text(blocks, 60)
+
+    assert len(parts) > 1
+    assert all(count_tokens(part) <= 60 for part in parts)
+    assert "\n".join(parts) == "\n".join(blocks)
+    assert _split_text(blocks, 0) == ["\n".join(blocks)]
+
+
+def test_split_table_repeats_header_and_renumbers_article_rows() -> None:
+    table: list[list[str | None]] = [["Art.-Nr.", "Description", "Pack"]]
+    table += [[f"46060{i:02d}V", f"Omnifix Solo {i} ml", "100"] for i in range(40)]
+
+    groups = _split_table(table, 80)
+
+    assert len(groups) > 1
+    for markdown, article_numbers in groups:
+        lines = markdown.split("\n")
+        assert lines[0] == "| Art.-Nr. | Description | Pack |"
+        assert lines[1] == "| --- | --- | --- |"
+        assert count_tokens(markdown) <= 80
+        for article_number, row in article_numbers.items():
+            assert lines[row + 1].startswith(f"| {article_number} |")
+    assert sum(len(numbers) for _, numbers in groups) == 40
+    assert len(_split_table(table, 0)) == 1
+
+
+def test_split_table_still_splits_when_the_header_fills_the_budget() -> None:
+    header = [f"Nominal outer diameter, column {i} (mm)" for i in range(12)]
+    table: list[list[str | None]] = [header]
+    table += [[f"{row}.{col}" for col in range(12)] for row in range(30)]
+
+    groups = _split_table(table, 60)
+
+    assert len(groups) == 30
+    assert all(len(markdown.split("\n")) == 3 for markdown, _ in groups)
+
+
+def test_long_pages_become_several_chunks_of_the_same_page(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chunk_max_tokens", 60)
+    doc = fitz.open()
+    page = doc.new_page()
+    for i in range(12):
+        page.insert_text((72, 72 + 50 * i), f"Omnifix Luer Solo syringe {i + 1} ml, sterile")
+    doc.save(tmp_path / "a.pdf")
+    doc.close()
+
+    chunks = extract_chunks_from_pdf(str(tmp_path / "a.pdf"))
+
+    assert len(chunks) > 1
+    assert {c.metadata["page"] for c in chunks} == {1}
+    assert [c.metadata["part"] for c in chunks] == list(range(1, len(chunks) + 1))
+    assert all(count_tokens(c.page_content) <= 60 for c in chunks)
@@ -0,0 +1,44 @@
+from app.grading import GradePrefilter
+from langchain_core.documents import Document
+
+
+def _prefilter() -> GradePrefilter:
+    return GradePrefilter(accept_similarity=0.8, reject_similarity=0.2)
+
+
+def test_prefilter_separates_clear_cases_from_uncertain_ones() -> None:
+    close = Document(page_content="Omnifix syringe Luer Lock 5 ml", metadata={"vector_score": 0.9})
+    unrelated = Document(
+        page_content="Surgical gloves, powder free", metadata={"vector_score": 0.1}
+    )
+    partial = Document(
+        page_content="Needle holder for blood collection, Luer", metadata={"vector_score": 0.1}
+    )
+
+    result = _prefilter().split("Luer syringe 5 ml", [close, unrelated, partial])
+
+    assert result.accepted == [close]
+    assert result.rejected == [unrelated]
+    assert result.uncertain == [partial]
+
+
+def test_prefilter_accepts_chunks_containing_every_identifier() -> None:
+    table = Document(page_content="| 4606051V | Sterile gloves |")
+
+    result = _prefilter().split("Is 4606051V in stock?", [table])
+
+    assert result.accepted == [table]
+
+
+def test_prefilter_leaves_chunks_without_a_vector_score_to_the_llm() -> None:
+    lexical = Document(page_content="Surgical gloves, powder free", metadata={"bm25_score": 2.0})
+    bm25_only = Document(
+        page_content="Omnifix syringe Luer Lock 5 ml", metadata={"bm25_score": 3.1}
+    )
+    matched = Document(
+        page_content="Surgical gloves", metadata={"vector_score": 0.1, "bm25_score": 1.0}
+    )
+
+    result = _prefilter().split("Luer syringe 5 ml", [lexical, bm25_only, matched])
+
+    assert result.uncertain == [lexical, bm25_only, matched]
@@ -1,4 +1,21 @@
-from app.ingestion import _table_to_markdown
+import os
+import threading
+import time
+from pathlib import Path
+
+import fitz
+import httpx
+import openai
+import pytest
+from app import ingestion
+from app.config import settings
+from app.embeddings import CachedEmbeddings
+from app.extraction import _table_to_markdown
+from app.ingestion import HybridRetriever, IndexStats, assign_chunk_ids
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.retrievers import BaseRetriever
 
 
 def test_table_to_markdown_formats_rows() -> None:
@@ -15,3 +32,347 @@ def test_table_to_markdown_formats_rows() -> None:
 
 def test_table_to_markdown_handles_empty_table() -> None:
     assert _table_to_markdown([]) == ""
+
+
+class _StaticRetriever(BaseRetriever):
+    docs: list[Document]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return [Document(page_content=d.page_content) for d in self.docs]
+
+
+def _hybrid() -> HybridRetriever:
+    return HybridRetriever(
+        bm25_retriever=_StaticRetriever(docs=[Document(page_content="Art.-Nr. 4550242")]),
+        vector_retriever=_StaticRetriever(
+            docs=[Document(page_content="Art.-Nr. 4550242"), Document(page_content="Omnifix")]
+        ),
+    )
+
+
+def test_hybrid_retriever_merges_legs_bm25_first() -> None:
+    docs = _hybrid().invoke("4550242")
+
+    assert [(d.page_content, d.metadata["match_type"]) for d in docs] == [
+        ("Art.-Nr. 4550242", "Exact Match"),
+        ("Omnifix", "Semantic Match"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_hybrid_retriever_async_path_matches_sync() -> None:
+    docs = await _hybrid().ainvoke("4550242")
+
+    assert [d.page_content for d in docs] == ["Art.-Nr. 4550242", "Omnifix"]
+
+
+def test_hybrid_retriever_ranks_by_fused_score_within_budget() -> None:
+    retriever = HybridRetriever(
+        bm25_retriever=_StaticRetriever(
+            docs=[Document(page_content="only bm25"), Document(page_content="both")]
+        ),
+        vector_retriever=_StaticRetriever(
+            docs=[Document(page_content="both"), Document(page_content="only vector " * 200)]
+        ),
+        k=3,
+        token_budget=20,
+    )
+
+    docs = retriever.invoke("query")
+
+    # "both" is ranked by both legs, and the long vector-only chunk exceeds the budget
+    assert [d.page_content for d in docs] == ["both", "only bm25"]
+    assert docs[0].metadata["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert docs[0].metadata["match_type"] == "Exact Match"
+
+
+def test_hybrid_retriever_answers_id_only_queries_from_exact_hits() -> None:
+    exact = Document(page_content="| 4550242 | Omnifix |", metadata={"exact_match": True})
+    retriever = HybridRetriever(
+        exact_retriever=_StaticRetriever(docs=[exact]),
+        bm25_retriever=_StaticRetriever(docs=[Document(page_content="other")]),
+        vector_retriever=_StaticRetriever(docs=[Document(page_content="other")]),
+    )
+
+    assert [d.page_content for d in retriever.invoke("4550242")] == ["| 4550242 | Omnifix |"]
+    assert [d.page_content for d in retriever.invoke("Is 4550242 sterile?")] == [
+        "| 4550242 | Omnifix |",
+        "other",
+    ]
+
+
+def _write_pdf(path: Path, pages: list[str]) -> str:
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_assign_chunk_ids_are_positional_and_hash_content() -> None:
+    chunks = [
+        Document(
+            page_content="a", metadata={"source": "cat.pdf", "page": 3, "content_type": "table"}
+        ),
+        Document(
+            page_content="b", metadata={"source": "cat.pdf", "page": 3, "content_type": "table"}
+        ),
+    ]
+
+    assert assign_chunk_ids(chunks) == ["cat.pdf:p3:table:0", "cat.pdf:p3:table:1"]
+    assert chunks[0].metadata["content_hash"] != chunks[1].metadata["content_hash"]
+
+
+@pytest.mark.parametrize("backend", ["chroma", "matrix"])
+def test_index_pdf_only_upserts_changed_chunks(
+    backend: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(settings, "vector_backend", backend)
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    pdf_path = tmp_path / "catalog.pdf"
+
+    _write_pdf(pdf_path, [page, page, page])
+    assert ingestion.index_pdf(str(pdf_path)) == IndexStats(added=3)
+    assert ingestion.index_pdf(str(pdf_path)) == IndexStats(unchanged=3)
+
+    _write_pdf(pdf_path, [page, "Sterican needle 0.45 x 25 mm, gauge 26G, Art.-Nr. 4657683."])
+    assert ingestion.index_pdf(str(pdf_path)) == IndexStats(updated=1, removed=1, unchanged=1)
+    assert len(ingestion.get_vectorstore().get(include=[])["ids"]) == 2
+    assert (tmp_path / "chroma" / "chroma.sqlite3").exists() == (backend == "chroma")
+
+
+def test_token_batches_respect_size_and_token_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "embedding_batch_size", 3)
+    monkeypatch.setattr(settings, "embedding_batch_max_tokens", 10)
+    monkeypatch.setattr(ingestion, "count_tokens", len)
+    chunks = [
+        Document(page_content=text)
+        for text in ["aaaa", "bbbb", "cc", "d", "e", "f", "g", "ffffffffffff"]
+    ]
+
+    batches = [[doc.page_content for doc in batch] for batch in ingestion._token_batches(chunks)]
+
+    assert batches == [["aaaa", "bbbb", "cc"], ["d", "e", "f"], ["g"], ["ffffffffffff"]]
+
+
+# Waits for queued background loads and drops
+def _settle() -> None:
+    ingestion._swap_executor.submit(lambda: None).result()
+
+
+def test_rebuild_index_hot_swaps_versions_and_drops_old_ones_once_released(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(ingestion, "_index", None)
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    pdf_path = _write_pdf(tmp_path / "catalog.pdf", [page, page])
+    progress = ingestion.IndexProgress()
+
+    assert ingestion.rebuild_index(pdf_path, progress=progress) == IndexStats(added=2)
+    assert (progress.state, progress.version, progress.pages_done, progress.chunks) == (
+        "complete",
+        1,
+        2,
+        2,
+    )
+    assert progress.batches_done == progress.batches_total == 1
+    assert ingestion.live_version_on_disk() == 1 and ingestion.is_index_live()
+
+    with ingestion.pin_index() as pinned:
+        old_retriever = ingestion.get_retriever(pinned)
+        _write_pdf(
+            tmp_path / "catalog.pdf",
+            ["Sterican needle 0.45 x 25 mm, gauge 26G, Art.-Nr. 4657683, sterile."],
+        )
+        assert ingestion.rebuild_index(pdf_path) == IndexStats(updated=1, removed=1)
+
+        # The pinned request still reads version 1; new requests get version 2
+        assert ingestion.get_retriever(pinned) is old_retriever
+        assert ingestion.get_retriever() is not old_retriever
+        assert ingestion.get_vectorstore()._collection.count() == 1
+        assert ingestion.index_dir(1).exists()
+
+    _settle()
+    assert not ingestion.index_dir(1).exists()
+    assert ingestion.live_version_on_disk() == 2
+    # The released handle's chunk file was closed with it
+    assert isinstance(old_retriever, HybridRetriever)
+    assert old_retriever.bm25_retriever.chunks._file.closed
+
+
+@pytest.mark.parametrize("backend", ["chroma", "matrix"])
+def test_rebuild_index_diffs_against_the_live_version_and_reuses_its_vectors(
+    backend: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(settings, "vector_backend", backend)
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(ingestion, "_index", None)
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    needle = "Sterican needle 0.45 x 25 mm, gauge 26G, Art.-Nr. 4657683, sterile."
+    pdf_path = _write_pdf(tmp_path / "catalog.pdf", [page, needle])
+    ingestion.rebuild_index(pdf_path)
+    embedded: list[str] = []
+    embed_and_upsert = ingestion.embed_and_upsert
+
+    def recording(
+        vectorstore: ingestion.IndexVectorStore,
+        chunks: list[Document],
+        progress: ingestion.IndexProgress | None = None,
+    ) -> None:
+        embedded.extend(doc.page_content for doc in chunks)
+        embed_and_upsert(vectorstore, chunks, progress)
+
+    monkeypatch.setattr(ingestion, "embed_and_upsert", recording)
+
+    _write_pdf(tmp_path / "catalog.pdf", [page])
+    assert ingestion.rebuild_index(pdf_path) == IndexStats(removed=1, unchanged=1)
+    assert embedded == []
+    assert ingestion.get_vectorstore().similarity_search(page, k=1)[0].page_content == page
+
+    # Vectors from another embedding model are not reused
+    monkeypatch.setattr(settings, "embedding_model", "other/model")
+    assert ingestion.rebuild_index(pdf_path) == IndexStats(unchanged=1)
+    assert embedded == [page]
+
+
+def test_drop_stale_versions_removes_interrupted_builds(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(ingestion, "_index", None)
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    pdf_path = _write_pdf(tmp_path / "catalog.pdf", [page])
+    ingestion.rebuild_index(pdf_path)
+    ingestion.index_dir(7).mkdir(parents=True)
+
+    ingestion.drop_stale_versions()
+
+    assert not ingestion.index_dir(7).exists()
+    assert ingestion.index_dir(1).exists()
+
+
+def test_workers_pick_up_versions_swapped_in_by_another_process(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(ingestion, "_index", None)
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    pdf_path = _write_pdf(tmp_path / "catalog.pdf", [page])
+    ingestion.rebuild_index(pdf_path)
+
+    # Another worker builds version 2 and makes it live, while a third still serves version 1
+    ingestion.index_pdf(pdf_path, version=2)
+    ingestion._write_current_version(2)
+    other_lease = ingestion._leases_dir() / str(os.getppid())
+    other_lease.write_text("[1]")
+
+    generation = ingestion.get_index_version()
+
+    # The request that notices keeps version 1; version 2 is loaded in the background
+    with ingestion.pin_index() as pinned:
+        assert pinned is not None and pinned.version == 1
+    _settle()
+    with ingestion.pin_index() as pinned:
+        assert pinned is not None and pinned.version == 2
+    _settle()
+    assert ingestion.index_dir(1).exists()
+    # Cached answers and the brand lexicon of version 1 are invalidated here too
+    assert ingestion.get_index_version() == pinned.generation == generation + 1
+
+    # A build in progress elsewhere is leased too, so startup cleanup leaves it alone
+    ingestion.index_dir(3).mkdir(parents=True)
+    other_lease.write_text("[3]")
+    ingestion.drop_stale_versions()
+    assert not ingestion.index_dir(1).exists()
+    assert ingestion.index_dir(3).exists()
+
+
+def test_rate_limit_pauses_every_batch_of_the_stage(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "embedding_retry_base_s", 0.01)
+    limited = threading.Event()
+    calls: list[tuple[str, float]] = []
+
+    class Limited(DeterministicFakeEmbedding):
+        def embed_documents(self, texts: list[str]) -> list[list[float]]:
+            calls.append((texts[0], time.monotonic()))
+            if texts == ["first"] and not limited.is_set():
+                limited.set()
+                response = httpx.Response(
+                    429, headers={"retry-after": "0.3"}, request=httpx.Request("POST", "http://x")
+                )
+                raise openai.RateLimitError("rate limited", response=response, body=None)
+            return super().embed_documents(texts)
+
+    monkeypatch.setattr(ingestion, "get_index_embeddings", lambda: Limited(size=4))
+    gate = ingestion._BackoffGate()
+    first = threading.Thread(target=ingestion._embed_with_retry, args=(["first"], gate))
+    first.start()
+    limited.wait()
+    while not gate._not_before:
+        time.sleep(0.001)
+    # A batch that never saw the 429 still waits out the provider's Retry-After
+    assert len(ingestion._embed_with_retry(["second"], gate)) == 1
+    first.join()
+
+    limited_at = calls[0][1]
+    assert sorted(text for text, _ in calls) == ["first", "first", "second"]
+    assert all(at - limited_at >= 0.3 for _, at in calls[1:])
+
+
+def test_index_embeddings_share_the_cache_without_sdk_retries(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", None)
+
+    shared = ingestion.get_embeddings()
+    index = ingestion.get_index_embeddings()
+
+    assert isinstance(shared, CachedEmbeddings) and isinstance(index, CachedEmbeddings)
+    assert index.cache is shared.cache
+    assert index.underlying.underlying.max_retries == 0  # type: ignore[attr-defined]
+    assert ingestion.get_index_embeddings() is index
+
+
+def test_workers_of_a_fresh_deploy_build_the_index_once(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(ingestion, "_index", None)
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    pdf_path = _write_pdf(tmp_path / "catalog.pdf", [page])
+    ingestion.rebuild_index(pdf_path)
+
+    # Another worker's startup job, queued before the first build finished, adopts it
+    monkeypatch.setattr(ingestion, "_index", None)
+    progress = ingestion.IndexProgress()
+    assert ingestion.ensure_index(pdf_path, progress) == IndexStats()
+    assert (progress.state, progress.version) == ("complete", 1)
+    assert ingestion.is_index_live() and ingestion.live_version_on_disk() == 1
+
+
+def test_a_worker_without_an_index_adopts_one_built_elsewhere(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(ingestion, "_index", None)
+    monkeypatch.setattr(ingestion, "_current_mtime", None)
+    page = "Omnifix syringe 2 ml Luer Solo, Art.-Nr. 4606051V, sterile, single use."
+    ingestion.index_pdf(_write_pdf(tmp_path / "catalog.pdf", [page]), version=1)
+    ingestion._write_current_version(1)
+
+    assert not ingestion.is_index_live()
+    _settle()
+    assert ingestion.is_index_live()
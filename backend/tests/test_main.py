@@ -0,0 +1,75 @@
+import time
+from pathlib import Path
+
+import pytest
+from app import main
+from app.config import settings
+from app.index_jobs import IndexJobs
+from app.ingestion import IndexProgress, IndexStats
+from fastapi.testclient import TestClient
+
+
+def test_ready_reports_progress_and_chat_waits_for_first_index(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def run(pdf_path: str, progress: IndexProgress) -> IndexStats:
+        progress.state, progress.pages_done = "indexing", 4
+        return IndexStats(added=4)
+
+    monkeypatch.setattr(main, "index_jobs", IndexJobs(run=run))
+    monkeypatch.setattr(main, "is_index_live", lambda: False)
+    client = TestClient(main.app)
+    main.index_jobs.submit("catalog.pdf")
+
+    assert client.get("/health").status_code == 200
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["indexing"]["job_id"]
+
+    response = client.post("/chat", json={"message": "Omnifix"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "10"
+
+    monkeypatch.setattr(main, "is_index_live", lambda: True)
+    assert client.get("/ready").status_code == 200
+
+
+def test_admin_index_queues_an_upload_and_reports_the_job(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    indexed: list[str] = []
+
+    def run(pdf_path: str, progress: IndexProgress) -> IndexStats:
+        indexed.append(Path(pdf_path).read_text())
+        progress.state, progress.version = "complete", 3
+        return IndexStats(added=1)
+
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    monkeypatch.setattr(main, "index_jobs", IndexJobs(run=run))
+    client = TestClient(main.app)
+
+    files = {"file": ("catalog.pdf", b"%PDF-1.4", "application/pdf")}
+    assert client.post("/admin/index", files=files).status_code == 401
+    response = client.post("/admin/index", files=files, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 202
+
+    job_url = f"/admin/index/{response.json()['job_id']}"
+    for _ in range(50):
+        job = client.get(job_url, headers={"X-Admin-Token": "secret"}).json()
+        if job["finished_at"]:
+            break
+        time.sleep(0.01)
+    assert (job["state"], job["version"], job["stats"]["added"]) == ("complete", 3, 1)
+    assert indexed == ["%PDF-1.4"]
+    assert list(main.uploads_dir().iterdir()) == []
+    assert client.get("/admin/index/nope", headers={"X-Admin-Token": "secret"}).status_code == 404
+
+
+def test_metrics_endpoint_exposes_prometheus_text() -> None:
+    response = TestClient(main.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "rag_node_duration_seconds" in response.text
+    assert "rag_chat_requests_total" in response.text
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from app.matrix_store import MatrixVectorStore, QuantizedMatrix, normalize
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_top_k_matches_exact_search(dtype: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Small blocks so the cross-block merge is exercised
+    monkeypatch.setattr("app.matrix_store._BLOCK_ROWS", 64)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((1_000, 32)).astype(np.float32)
+    queries = normalize(vectors[:20] + 0.1 * rng.standard_normal((20, 32)).astype(np.float32))
+
+    ids, scores = QuantizedMatrix.quantize(vectors, dtype).top_k(queries, 5)
+
+    exact = queries @ normalize(vectors).T
+    expected = np.argsort(-exact, axis=1)[:, :5]
+    assert ids.shape == (20, 5)
+    assert (ids[:, 0] == np.arange(20)).all()
+    recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(ids, expected)])
+    assert recall >= 0.9
+    assert np.allclose(scores, np.take_along_axis(exact, ids, 1), atol=0.02)
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+
+@pytest.mark.asyncio
+async def test_store_buffers_writes_until_saved_and_reloads(tmp_path: Path) -> None:
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = MatrixVectorStore(tmp_path / "vectors", embedding, dtype="int8")
+    store.add_texts(
+        ["Omnifix syringe", "Sterican needle", "Peha-haft bandage"], ids=["a", "b", "c"]
+    )
+    assert store.count() == 0
+
+    store.save()
+    store.delete(["b"])
+    store.upsert_embeddings(
+        ["c"], [embedding.embed_query("Vasofix cannula")], ["Vasofix cannula"], [{"page": 4}]
+    )
+    store.save()
+
+    reopened = MatrixVectorStore(tmp_path / "vectors", embedding, dtype="int8")
+    assert reopened.get(include=["metadatas"]) == {
+        "ids": ["a", "c"],
+        "documents": None,
+        "metadatas": [{}, {"page": 4}],
+    }
+    [(doc, score)] = await reopened.asimilarity_search_with_relevance_scores("Vasofix cannula", k=1)
+    assert (doc.id, doc.page_content) == ("c", "Vasofix cannula")
+    assert 0.99 <= score <= 1.0
+    assert not (tmp_path / "vectors.tmp").exists()
+
+
+def test_changing_dtype_converts_stored_rows_on_save(tmp_path: Path) -> None:
+    embedding = DeterministicFakeEmbedding(size=16)
+    MatrixVectorStore.from_texts(
+        ["Omnifix syringe", "Sterican needle"],
+        embedding,
+        ids=["a", "b"],
+        directory=tmp_path,
+        dtype="float16",
+    )
+
+    store = MatrixVectorStore(tmp_path, embedding, dtype="int8")
+    store.add_texts(["Vasofix cannula"], ids=["c"])
+    store.save()
+
+    assert MatrixVectorStore(tmp_path, embedding)._matrix.dtype == "int8"  # type: ignore[union-attr]
+    [doc] = store.similarity_search("Sterican needle", k=1)
+    assert doc.id == "b"
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+from app import memory
+from app.memory import Conversation, ConversationStore
+
+
+def test_store_evicts_least_recently_used() -> None:
+    store = ConversationStore(max_entries=2, ttl_s=60)
+    for conv_id in ["a", "b", "c"]:
+        store.put(conv_id, Conversation(turns=[(conv_id, "answer")]))
+
+    assert store.get("a").turns == []
+    assert store.get("c").turns == [("c", "answer")]
+
+
+def test_store_expires_conversations(monkeypatch: pytest.MonkeyPatch) -> None:
+    store = ConversationStore(max_entries=10, ttl_s=60)
+    store.put("a", Conversation(summary="earlier"))
+
+    monkeypatch.setattr(memory.time, "time", lambda: 1e12)
+
+    assert store.get("a") == Conversation()
+
+
+def test_persistent_store_survives_restart(tmp_path: Path) -> None:
+    ConversationStore(10, 60, tmp_path / "conv.sqlite3").put(
+        "a", Conversation(summary="s", turns=[("q", "a")])
+    )
+
+    restored = ConversationStore(10, 60, tmp_path / "conv.sqlite3").get("a")
+
+    assert restored == Conversation(summary="s", turns=[("q", "a")])
+    assert "User: q\nAssistant: a" in restored.render()
+
+
+@pytest.mark.asyncio
+async def test_persistent_store_reads_and_writes_off_the_event_loop(tmp_path: Path) -> None:
+    await ConversationStore(10, 60, tmp_path / "conv.sqlite3").aput(
+        "a", Conversation(summary="s", turns=[("q", "a")])
+    )
+
+    restored = await ConversationStore(10, 60, tmp_path / "conv.sqlite3").aget("a")
+
+    assert restored == Conversation(summary="s", turns=[("q", "a")])
+
+
+def test_persistent_store_prunes_expired_rows_at_most_once_per_interval(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    now = 1000.0
+    monkeypatch.setattr(memory.time, "time", lambda: now)
+    store = ConversationStore(10, 60, tmp_path / "conv.sqlite3")
+    assert store._conn is not None
+    store.put("old", Conversation(summary="old"))
+    now = 1050.0
+    store.put("x", Conversation(summary="x"))
+
+    now = 1070.0
+    store.put("a", Conversation())
+    now = 1115.0
+    store.put("b", Conversation())
+
+    # "old" went with the prune at 1070; "x" expired since but waits for the next one
+    ids = store._conn.execute("SELECT id FROM conversations ORDER BY id").fetchall()
+    assert ids == [("a",), ("b",), ("x",)]
+    store.clear()
+    assert store.get("x") == Conversation()
@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+from app.metrics import RequestTimings, TokenUsageCallback, timed_node
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables import RunnableConfig
+from prometheus_client import REGISTRY
+
+
+def _sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_timed_node_records_sync_and_async_runs() -> None:
+    seen: list[RunnableConfig] = []
+
+    def node(state: dict, config: RunnableConfig) -> dict:
+        seen.append(config)
+        return {**state, "done": True}
+
+    async def anode(state: dict) -> dict:
+        return {**state, "done": True}
+
+    runnable = timed_node("test_node", node, anode)
+    timings = RequestTimings()
+    config: RunnableConfig = {"configurable": {"timings": timings}}
+    before = _sample("rag_node_duration_seconds_count", node="test_node")
+
+    assert runnable.invoke({}, config) == {"done": True}
+    assert await runnable.ainvoke({}, config) == {"done": True}
+
+    assert seen[0]["configurable"]["timings"] is timings
+    assert _sample("rag_node_duration_seconds_count", node="test_node") == before + 2
+    assert set(timings.summary()["nodes_ms"]) == {"test_node"}
+
+
+def test_token_callback_prefers_reported_usage() -> None:
+    timings = RequestTimings()
+    callback = TokenUsageCallback(timings)
+    run_id = uuid.uuid4()
+    message = AIMessage(
+        content="Omnifix",
+        usage_metadata={"input_tokens": 40, "output_tokens": 3, "total_tokens": 43},
+    )
+
+    callback.on_chat_model_start(
+        {},
+        [[HumanMessage(content="Which syringe?")]],
+        run_id=run_id,
+        metadata={"langgraph_node": "generate"},
+    )
+    callback.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+
+    assert timings.summary()["tokens"] == {"generate": {"prompt": 40, "completion": 3}}
+    assert _sample("rag_node_llm_tokens_sum", node="generate", kind="prompt") >= 40
+
+
+def test_token_callback_estimates_missing_usage() -> None:
+    timings = RequestTimings()
+    callback = TokenUsageCallback(timings)
+    run_id = uuid.uuid4()
+
+    callback.on_chat_model_start({}, [[HumanMessage(content="Which syringe?")]], run_id=run_id)
+    callback.on_llm_end(
+        LLMResult(generations=[[ChatGeneration(message=AIMessage(content="Omnifix 5 ml"))]]),
+        run_id=run_id,
+    )
+
+    usage = timings.summary()["tokens"]["other"]
+    assert usage["prompt"] > 0 and usage["completion"] > 0
@@ -0,0 +1,80 @@
+from pathlib import Path
+
+import httpx
+import pytest
+from app import agent, ingestion
+from app.config import settings
+from app.embeddings import CachedEmbeddings
+from app.resources import Resources, close_resources, create_resources, get_resources, warm_up
+
+
+class FakeChroma:
+    def __init__(self) -> None:
+        self.heartbeats = 0
+
+    def heartbeat(self) -> int:
+        self.heartbeats += 1
+        return 0
+
+
+def test_create_resources_applies_pool_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "http_max_connections", 7)
+    monkeypatch.setattr(settings, "http_max_keepalive_connections", 3)
+
+    resources = create_resources()
+    pool = resources.async_http_client._transport._pool  # type: ignore[attr-defined]
+
+    assert pool._max_connections == 7
+    assert pool._max_keepalive_connections == 3
+    resources.http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_pings_both_pools_and_tolerates_failures(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path))
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        return httpx.Response(200, json={"data": []})
+
+    def failing(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("unreachable", request=request)
+
+    chroma = FakeChroma()
+    resources = Resources(
+        http_client=httpx.Client(transport=httpx.MockTransport(failing)),
+        async_http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        _chroma_client=chroma,
+        _chroma_path=str(tmp_path),
+    )
+
+    await warm_up(resources)
+
+    assert requests == ["/api/v1/models"]
+    assert chroma.heartbeats == 1
+
+
+@pytest.mark.asyncio
+async def test_clients_are_rebuilt_after_resources_close(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "chroma_dir", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "_embeddings", None)
+    embeddings = ingestion.get_embeddings()
+    assert isinstance(embeddings, CachedEmbeddings)
+
+    await close_resources()
+    assert agent.llm.http_async_client.is_closed  # type: ignore[union-attr]
+
+    agent.bind_llm()
+    ingestion.bind_embeddings()
+
+    resources = get_resources()
+    assert agent.llm.http_async_client is resources.async_http_client
+    # Vector stores keep the cached wrapper; only the API client beneath it changed
+    assert ingestion.get_embeddings() is embeddings
+    api = embeddings.underlying.underlying  # type: ignore[attr-defined]
+    assert api.http_async_client is resources.async_http_client
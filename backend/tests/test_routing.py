@@ -0,0 +1,57 @@
+import pytest
+from app.routing import FastRouter, harvest_brand_names
+from langchain_core.embeddings import Embeddings
+
+
+def _router(
+    brands: frozenset[str] = frozenset(), embeddings: Embeddings | None = None
+) -> FastRouter:
+    return FastRouter(
+        brands=lambda: brands,
+        index_version=lambda: 0,
+        embeddings=(lambda: embeddings) if embeddings else None,
+    )
+
+
+@pytest.mark.parametrize(
+    ("query", "route", "source"),
+    [
+        ("Hallo!", "chat", "greeting"),
+        ("  thank you ", "chat", "greeting"),
+        ("4550242", "search", "catalog_id"),
+        ("Art.-Nr. 4606051V", "search", "catalog_id"),
+        ("Is omnifix available in 10 ml?", "search", "brand"),
+    ],
+)
+def test_rules_decide_obvious_intents(query: str, route: str, source: str) -> None:
+    decision = _router(frozenset({"omnifix"})).classify(query)
+
+    assert decision is not None
+    assert (decision.route, decision.source) == (route, source)
+
+
+def test_ambiguous_query_defers_to_llm() -> None:
+    assert _router().classify("Hi, do you have syringes?") is None
+
+
+def test_harvest_brand_names_reads_trademark_signs() -> None:
+    texts = ["Omnifix® Solo 5 ml", "Injekt ® Luer", "Sterican™ needles, Omnifix® F"]
+
+    assert harvest_brand_names(texts) == ["injekt", "omnifix", "sterican"]
+
+
+class _KeywordEmbeddings(Embeddings):
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        lowered = text.lower()
+        product = any(word in lowered for word in ("syringe", "needle", "cannula", "product"))
+        return [1.0, 0.1] if product else [0.1, 1.0]
+
+
+def test_embedding_classifier_routes_by_nearest_centroid() -> None:
+    decision = _router(embeddings=_KeywordEmbeddings()).classify("Which needle fits?")
+
+    assert decision is not None
+    assert (decision.route, decision.source) == ("search", "embedding")
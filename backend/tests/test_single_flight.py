@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from app.single_flight import SingleFlight, StreamFlights
+
+
+def test_do_runs_concurrent_identical_calls_once() -> None:
+    flights = SingleFlight("test")
+    calls: list[str] = []
+    results: list[str] = []
+
+    def work() -> str:
+        calls.append("call")
+        time.sleep(0.05)
+        return "done"
+
+    threads = [
+        threading.Thread(target=lambda: results.append(flights.do("key", work))) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["call"] and results == ["done"] * 4
+    assert flights.do("key", lambda: "again") == "again"
+
+
+@pytest.mark.asyncio
+async def test_ado_shares_result_and_errors_and_survives_a_cancelled_caller() -> None:
+    flights = SingleFlight("test")
+    calls = 0
+
+    async def work() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return calls
+
+    leader = asyncio.ensure_future(flights.ado("key", work))
+    await asyncio.sleep(0)
+    followers = asyncio.gather(flights.ado("key", work), flights.ado("key", work))
+    leader.cancel()
+
+    assert await followers == [1, 1]
+
+    async def fail() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        flights.ado("bad", fail), flights.ado("bad", fail), return_exceptions=True
+    )
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+@pytest.mark.asyncio
+async def test_stream_flights_fan_out_events_to_late_joiners() -> None:
+    flights: StreamFlights[int] = StreamFlights("test")
+    runs = 0
+
+    async def produce():  # type: ignore[no-untyped-def]
+        nonlocal runs
+        runs += 1
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+
+    first, first_joined = flights.ajoin("key", produce)
+    await asyncio.sleep(0.015)
+    second, second_joined = flights.ajoin("key", produce)
+
+    assert [e async for e in first] == [e async for e in second] == [0, 1, 2]
+    assert (first_joined, second_joined, runs) == (False, True, 1)
+
+
+def test_sync_stream_flights_propagate_producer_errors() -> None:
+    flights: StreamFlights[int] = StreamFlights("test")
+
+    def produce():  # type: ignore[no-untyped-def]
+        yield 1
+        raise RuntimeError("graph failed")
+
+    events, _ = flights.join("key", produce)
+
+    assert next(events) == 1
+    with pytest.raises(RuntimeError, match="graph failed"):
+        next(events)
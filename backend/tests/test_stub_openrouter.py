@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+from stub_openrouter import StubConfig, create_app  # noqa: E402
+
+
+def _client(**config: float) -> TestClient:
+    return TestClient(create_app(StubConfig(latency_ms=0, tokens_per_s=0, **config)))
+
+
+def test_stub_serves_langchain_chat_and_embedding_clients() -> None:
+    client = _client(embedding_dim=16)
+    llm = ChatOpenAI(
+        model="stub", api_key="x", base_url="http://testserver/api/v1", http_client=client
+    )
+    embeddings = OpenAIEmbeddings(
+        model="stub",
+        api_key="x",
+        base_url="http://testserver/api/v1",
+        http_client=client,
+        check_embedding_ctx_length=False,
+    )
+
+    assert llm.invoke([("system", "Output ONLY 'search' or 'chat'."), ("human", "Hi")]).content == (
+        "search"
+    )
+    streamed = "".join(str(chunk.content) for chunk in llm.stream("Tell me about Omnifix"))
+    assert streamed.startswith("The catalog lists")
+    assert embeddings.embed_query("Omnifix") == embeddings.embed_documents(["Omnifix"])[0]
+    assert len(embeddings.embed_query("Omnifix")) == 16
+    assert client.get("/api/v1/stats").json() == {"chat": 2, "embeddings": 3}
+
+
+def test_stub_injects_rate_limits() -> None:
+    client = _client(error_rate=1.0)
+    llm = ChatOpenAI(
+        model="stub",
+        api_key="x",
+        base_url="http://testserver/v1",
+        http_client=client,
+        max_retries=0,
+    )
+
+    with pytest.raises(openai.RateLimitError):
+        llm.invoke("Hi")
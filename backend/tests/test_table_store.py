@@ -0,0 +1,97 @@
+from pathlib import Path
+
+from app.table_store import (
+    Constraint,
+    load_table_store,
+    parse_constraints,
+    parse_quantities,
+    save_table_store,
+)
+from langchain_core.documents import Document
+
+NEEDLES = (
+    "| Art.-Nr. | Size | Gauge |\n| --- | --- | --- |\n"
+    "| 4657519 | 0,40 x 20 mm | 27G |\n"
+    "| 4657527 | 0,40 x 12 mm | 27G |\n"
+    "| 4657683 | 0,45 x 12 mm | 26G |"
+)
+SYRINGES = "| Art.-Nr. | Volume (ml) |\n| --- | --- |\n| 4606051V | 5 |\n| 4606108V | 10 |\n| 4606205V | 20 |"
+CATHETERS = (
+    "| Art.-Nr. | Größe | Länge |\n| --- | --- | --- |\n"
+    "| 4251601 | 0,7 mm | 10 mm |\n"
+    "| 4251628 | 1,1 mm | 25 mm |"
+)
+DOCS = [
+    Document(
+        page_content="Sterican hypodermic needles for injection",
+        metadata={"source": "cat.pdf", "page": 4, "content_type": "text"},
+    ),
+    Document(
+        page_content=NEEDLES, metadata={"source": "cat.pdf", "page": 4, "content_type": "table"}
+    ),
+    Document(
+        page_content="Omnifix single-use syringes, Luer Lock",
+        metadata={"source": "cat.pdf", "page": 7, "content_type": "text"},
+    ),
+    Document(
+        page_content=SYRINGES, metadata={"source": "cat.pdf", "page": 7, "content_type": "table"}
+    ),
+    Document(
+        page_content="Introcan Safety Venenverweilkatheter aus Polyurethan",
+        metadata={"source": "cat.pdf", "page": 9, "content_type": "text"},
+    ),
+    Document(
+        page_content=CATHETERS, metadata={"source": "cat.pdf", "page": 9, "content_type": "table"}
+    ),
+]
+
+
+def test_parse_quantities_normalizes_units() -> None:
+    assert parse_quantities("0,45 x 25 mm") == [(0.45, "mm", "short"), (25.0, "mm", "long")]
+    assert parse_quantities("2,5 cm") == [(25.0, "mm", "")]
+    assert parse_quantities("10", default_unit="ml") == [(10.0, "ml", "")]
+    assert parse_quantities("27 G") == [(27.0, "G", "")]
+    assert parse_quantities("4606051V", default_unit="ml") == []
+
+
+def test_parse_constraints_requires_a_comparison() -> None:
+    assert parse_constraints("needles shorter than 20 mm, 27G") == [
+        Constraint("<=", 20.0, "mm", "long"),
+        Constraint("=", 27.0, "G"),
+    ]
+    assert parse_constraints("syringes between 5 and 10 ml") == [
+        Constraint(">=", 5.0, "ml"),
+        Constraint("<=", 10.0, "ml"),
+    ]
+    assert parse_constraints("Omnifix 5 ml") == []
+
+
+def test_filter_returns_matching_rows_as_compact_tables(tmp_path: Path) -> None:
+    save_table_store(tmp_path / "tables.sqlite3", DOCS)
+    store = load_table_store(tmp_path / "tables.sqlite3")
+    assert store is not None
+
+    docs = store.filter("needles shorter than 15 mm with 27G")
+
+    assert len(docs) == 1
+    assert docs[0].page_content.splitlines()[2:] == ["| 4657527 | 0,40 x 12 mm | 27G |"]
+    assert docs[0].metadata["page"] == 4
+    assert [
+        row.split(" | ")[0]
+        for row in store.filter("syringes between 5 and 10 ml")[0].page_content.splitlines()[2:]
+    ] == ["| 4606051V", "| 4606108V"]
+
+
+def test_filter_needs_a_keyword_match_beyond_the_numbers(tmp_path: Path) -> None:
+    save_table_store(tmp_path / "tables.sqlite3", DOCS)
+    store = load_table_store(tmp_path / "tables.sqlite3")
+    assert store is not None
+
+    # Catheter and needle rows satisfy both constraints, but only needle rows match the words
+    docs = store.filter("needles shorter than 15 mm")
+    assert [doc.metadata["page"] for doc in docs] == [4]
+    assert store.filter("what gloves are smaller than 15 mm") == []
+    assert store.filter("anything shorter than 15 mm") == []
+    assert [
+        doc.metadata["page"] for doc in store.filter("Venenverweilkatheter kürzer als 15 mm")
+    ] == [9]
@@ -16,8 +16,9 @@ export interface ChatResponse {
 }
 
 export type SSEStatusEvent = { type: "status"; message: string };
+export type SSETokenEvent = { type: "token"; content: string };
 export type SSEAnswerEvent = { type: "answer" } & ChatResponse;
-export type SSEEvent = SSEStatusEvent | SSEAnswerEvent;
+export type SSEEvent = SSEStatusEvent | SSETokenEvent | SSEAnswerEvent;
 
 export async function streamMessage(
   message: string,
@@ -25,6 +26,7 @@ export async function streamMessage(
   onStatus: (message: string) => void,
   onAnswer: (response: ChatResponse) => void,
   onError: (error: Error) => void,
+  onToken?: (content: string) => void,
 ): Promise<void> {
   const res = await fetch(`${API_BASE}/chat`, {
     method: "POST",
@@ -67,6 +69,8 @@ export async function streamMessage(
         const event: SSEEvent = JSON.parse(trimmed.slice(6));
         if (event.type === "status") {
           onStatus(event.message);
+        } else if (event.type === "token") {
+          onToken?.(event.content);
         } else if (event.type === "answer") {
           onAnswer({
             answer: event.answer,